@@ -0,0 +1,78 @@
+"""Benchmark inserting rows with random (uuid4) and time-ordered (uuid7) string primary keys.
+
+Random keys land on random pages of the primary key index, so once the index no longer fits
+in the page cache every insert reads and splits a different page. Time-ordered keys are
+appended to the last page.
+
+Usage:
+    python benchmarks/id_inserts.py --rows 10000000
+    python benchmarks/id_inserts.py --rows 100000 --ids uuid7
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import tempfile
+import click
+
+from promptmage.ids import uuid7
+
+ID_GENERATORS = {"uuid4": lambda: str(uuid.uuid4()), "uuid7": uuid7}
+
+
+def benchmark(ids: str, rows: int, batch_size: int, report_every: int):
+    """Insert `rows` rows in transactions of `batch_size` rows, like the data table of runs."""
+    generate = ID_GENERATORS[ids]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ids.db")
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE data (step_run_id TEXT PRIMARY KEY, step_name TEXT, status TEXT)"
+        )
+        start = interval_start = time.perf_counter()
+        inserted = 0
+        while inserted < rows:
+            batch = min(batch_size, rows - inserted)
+            with connection:
+                connection.executemany(
+                    "INSERT INTO data VALUES (?, ?, ?)",
+                    ((generate(), "step", "success") for _ in range(batch)),
+                )
+            inserted += batch
+            if inserted % report_every < batch:
+                now = time.perf_counter()
+                click.echo(
+                    f"{ids} {inserted:>10} rows: "
+                    f"{report_every / (now - interval_start):10.0f} rows/s"
+                )
+                interval_start = now
+        total = time.perf_counter() - start
+        connection.close()
+        size = os.path.getsize(path)
+    return total, size
+
+
+@click.command()
+@click.option("--rows", default=10_000_000, help="Number of rows to insert.")
+@click.option("--batch-size", default=1000, help="Rows per transaction.")
+@click.option(
+    "--ids",
+    "id_types",
+    multiple=True,
+    type=click.Choice(list(ID_GENERATORS)),
+    help="The identifiers to compare, both by default.",
+)
+def main(rows: int, batch_size: int, id_types: tuple):
+    report_every = max(rows // 10, batch_size)
+    for ids in id_types or ID_GENERATORS:
+        total, size = benchmark(ids, rows, batch_size, report_every)
+        click.echo(
+            f"{ids}: {rows / total:10.0f} rows/s overall, "
+            f"database size {size / 1024 / 1024:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark storing and fetching runs with large outputs for each installed JSON library.
+
+Usage:
+    python benchmarks/payload_codec.py --runs 1000 --output-kb 64
+    python benchmarks/payload_codec.py --json json --json orjson
+"""
+
+import os
+import time
+import random
+import tempfile
+import click
+
+from promptmage import RunData
+from promptmage.codec import JSON_BACKENDS, set_json_backend, dumps, loads
+from promptmage.storage import SQLiteDataBackend
+
+WORDS = ["transcript", "summary", "model", "prompt", "ünïcode", "step", "token"]
+
+
+def make_runs(runs: int, output_kb: int):
+    random.seed(0)
+    for i in range(runs):
+        text = " ".join(random.choices(WORDS, k=output_kb * 128))
+        yield RunData(
+            step_name=f"step-{i % 5}",
+            prompt=None,
+            input_data={"question": f"question {i}", "history": [text[:1000]] * 4},
+            output_data={
+                "answer": text,
+                "scores": [random.random() for _ in range(50)],
+            },
+            status="success",
+        )
+
+
+def benchmark_codec(runs: list):
+    """Time encoding and decoding the run dictionaries alone, without any I/O."""
+    data = [run.to_dict() for run in runs]
+    start = time.perf_counter()
+    encoded = [dumps(d) for d in data]
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    for e in encoded:
+        loads(e)
+    decode = time.perf_counter() - start
+    return encode, decode
+
+
+def benchmark(json_backend: str, runs: list, search_index: bool):
+    set_json_backend(json_backend)
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteDataBackend(os.path.join(directory, "promptmage.db"))
+        backend.search_index = backend.search_index and search_index
+
+        start = time.perf_counter()
+        for run in runs:
+            backend.store_data(run)
+        store = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fetched = sum(1 for _ in backend.iter_data())
+        fetch = time.perf_counter() - start
+        backend.engine.dispose()
+    assert fetched == len(runs)
+    return store, fetch, *benchmark_codec(runs)
+
+
+@click.command()
+@click.option("--runs", default=1000, help="Number of runs to store.")
+@click.option("--output-kb", default=64, help="Approximate size of each output in KB.")
+@click.option(
+    "--json",
+    "json_backends",
+    multiple=True,
+    type=click.Choice(JSON_BACKENDS),
+    help="The JSON libraries to compare, all installed ones by default.",
+)
+@click.option(
+    "--search-index/--no-search-index",
+    default=False,
+    help="Whether to keep the full-text index up to date while storing.",
+)
+def main(runs: int, output_kb: int, json_backends: tuple, search_index: bool):
+    run_data = list(make_runs(runs, output_kb))
+    for json_backend in json_backends or JSON_BACKENDS:
+        try:
+            store, fetch, encode, decode = benchmark(
+                json_backend, run_data, search_index
+            )
+        except ValueError as e:
+            click.echo(f"{json_backend}: skipped, {e}")
+            continue
+        click.echo(
+            f"{json_backend:8} store: {runs / store:8.1f} runs/s  "
+            f"fetch: {runs / fetch:8.1f} runs/s  "
+            f"encode: {encode / runs * 1e6:7.1f} us/run  "
+            f"decode: {decode / runs * 1e6:7.1f} us/run"
+        )
+
+
+if __name__ == "__main__":
+    main()
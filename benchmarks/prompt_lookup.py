@@ -0,0 +1,78 @@
+"""Benchmark prompt head and active lookups with a long version history.
+
+Usage:
+    python benchmarks/prompt_lookup.py --prompts 10 --versions 1000
+    python benchmarks/prompt_lookup.py --backend memory
+"""
+
+import time
+import click
+
+from promptmage import Prompt
+from promptmage.storage import SQLitePromptBackend, InMemoryPromptBackend
+from promptmage.storage.sqlite_backend import PromptModel
+
+
+def make_prompts(prompts: int, versions: int):
+    for p in range(prompts):
+        for v in range(1, versions + 1):
+            yield Prompt(
+                name=f"prompt-{p}",
+                system=f"system {v}",
+                user=f"user {v}",
+                template_vars=["question"],
+                version=v,
+                active=v == versions // 2,
+            )
+
+
+def fill_backend(backend: SQLitePromptBackend, prompts: int, versions: int):
+    """Insert `versions` versions for each of `prompts` prompts in one transaction."""
+    session = backend.Session()
+    try:
+        for prompt in make_prompts(prompts, versions):
+            session.add(PromptModel.from_dict(prompt.to_dict()))
+        session.commit()
+    finally:
+        session.close()
+
+
+def timeit(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+@click.command()
+@click.option("--prompts", default=10, help="Number of distinct prompts.")
+@click.option("--versions", default=1000, help="Number of versions per prompt.")
+@click.option("--repeat", default=1000, help="Number of lookups to time.")
+@click.option(
+    "--backend",
+    "backend_name",
+    type=click.Choice(["sqlite", "memory"]),
+    default="sqlite",
+    help="The prompt backend, memory measures the lookup without any I/O.",
+)
+def main(prompts: int, versions: int, repeat: int, backend_name: str):
+    if backend_name == "memory":
+        backend = InMemoryPromptBackend()
+        for prompt in make_prompts(prompts, versions):
+            backend.store_prompt(prompt)
+    else:
+        backend = SQLitePromptBackend(":memory:")
+        fill_backend(backend, prompts, versions)
+
+    head = timeit(lambda: backend.get_prompt("prompt-0"), repeat)
+    active = timeit(lambda: backend.get_prompt("prompt-0", active=True), repeat)
+    pinned = timeit(lambda: backend.get_prompt("prompt-0", version=versions), repeat)
+
+    click.echo(f"{backend_name}: {prompts} prompts x {versions} versions")
+    click.echo(f"head lookup:    {head * 1e6:8.1f} us")
+    click.echo(f"active lookup:  {active * 1e6:8.1f} us")
+    click.echo(f"version lookup: {pinned * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 
 from promptmage import PromptMage
+from promptmage.codec import CodecJSONResponse
 
 
 class PromptMageAPI:
@@ -27,7 +28,9 @@ class PromptMageAPI:
     def get_app(self) -> FastAPI:
         """Create a FastAPI application to serve the PromptMage instance."""
         app = FastAPI(
-            title=f"PromptMage API: {self.mage.name}", description="API for PromptMage."
+            title=f"PromptMage API: {self.mage.name}",
+            description="API for PromptMage.",
+            default_response_class=CodecJSONResponse,
         )
 
         app.add_middleware(
@@ -4,6 +4,7 @@ import json
 import click
 import uvicorn
 from pathlib import Path
+from datetime import datetime
 from loguru import logger
 
 from promptmage import __version__, title
@@ -12,7 +13,63 @@ from promptmage.api import PromptMageAPI
 from promptmage.remote import RemoteBackendAPI
 from promptmage.frontend import PromptMageFrontend
 from promptmage.storage import SQLiteDataBackend, SQLitePromptBackend
-from promptmage.storage.utils import backup_db_to_json, restore_db_from_json
+from promptmage.storage.utils import (
+    backup_db_to_json,
+    backup_db_to_jsonl,
+    restore_db,
+    restore_db_from_chain,
+    snapshot_db,
+)
+from promptmage.storage.export import EXPORT_FORMATS, export_runs
+from promptmage.storage.retention import (
+    RetentionPolicy,
+    RetentionTask,
+    apply_retention,
+    enable_incremental_vacuum,
+)
+
+
+def retention_options(func):
+    """Add the options for the scheduled retention task to a command."""
+    func = click.option(
+        "--retention-interval",
+        default=24.0,
+        type=float,
+        help="Hours between two scheduled retention runs.",
+    )(func)
+    func = click.option(
+        "--retention-runs-per-step",
+        default=None,
+        type=int,
+        help="Keep only this many most recent runs per step. Enables scheduled retention.",
+    )(func)
+    func = click.option(
+        "--retention-days",
+        default=None,
+        type=float,
+        help="Delete runs older than this many days. Enables scheduled retention.",
+    )(func)
+    return func
+
+
+def start_retention_task(
+    backend,
+    retention_days: float | None,
+    retention_runs_per_step: int | None,
+    retention_interval: float,
+):
+    """Start the scheduled retention task for a SQLite data backend if a policy is set."""
+    policy = RetentionPolicy(
+        max_age_days=retention_days, max_runs_per_step=retention_runs_per_step
+    )
+    if policy.is_empty:
+        return None
+    if not isinstance(backend, SQLiteDataBackend):
+        logger.warning("Retention is only supported for the SQLite data backend.")
+        return None
+    task = RetentionTask(backend, policy, interval=retention_interval * 3600)
+    task.start()
+    return task
 
 
 @click.group()
@@ -42,7 +99,16 @@ def version():
     help="Open the browser after starting the server.",
     default=False,
 )
-def run(file_path: str, host: str, port: int, browser: bool):
+@retention_options
+def run(
+    file_path: str,
+    host: str,
+    port: int,
+    browser: bool,
+    retention_days: float | None,
+    retention_runs_per_step: int | None,
+    retention_interval: float,
+):
     """Serve the application containing a PromptMage instance from the given file.
 
     Args:
@@ -50,6 +116,9 @@ def run(file_path: str, host: str, port: int, browser: bool):
         host (str): The host IP to run the FastAPI server on.
         port (int): The port to run the FastAPI server on.
         browser (bool): Whether to open the browser after starting the server.
+        retention_days (float | None): Delete runs older than this many days.
+        retention_runs_per_step (int | None): Keep only this many most recent runs per step.
+        retention_interval (float): Hours between two scheduled retention runs.
     """
     logger.info(f"\nWelcome to\n{title}")
     logger.info(f"Running PromptMage version {__version__} from {file_path}")
@@ -70,6 +139,15 @@ def run(file_path: str, host: str, port: int, browser: bool):
     frontend = PromptMageFrontend(flows=available_flows)
     frontend.init_from_api(app)
 
+    # schedule the retention of old run data
+    backends = {
+        id(flow.data_store.backend): flow.data_store.backend for flow in available_flows
+    }
+    for backend in backends.values():
+        start_retention_task(
+            backend, retention_days, retention_runs_per_step, retention_interval
+        )
+
     # Run the applications
     if browser:
         import webbrowser
@@ -89,21 +167,91 @@ def run(file_path: str, host: str, port: int, browser: bool):
     default="promptmage",
     help="The name of the file to export the data to.",
 )
-def export(runs: bool = False, prompts: bool = False, filename: str = "promptmage"):
-    """Export the run data and prompts from the PromptMage instance to json.
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default="jsonl",
+    help="The file format of the exported runs.",
+)
+@click.option(
+    "--gzip",
+    "compress",
+    is_flag=True,
+    default=False,
+    help="Compress the exported runs with gzip.",
+)
+@click.option(
+    "--step",
+    "steps",
+    multiple=True,
+    help="Only export runs of this step. Can be repeated.",
+)
+@click.option(
+    "--flow",
+    "flow_file",
+    type=click.Path(exists=True),
+    default=None,
+    help="Only export runs of the steps of the flows in this file. Combined with --step, only runs of the given steps of these flows.",
+)
+@click.option("--status", default=None, help="Only export runs with this status.")
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    default=None,
+    help="Only export runs at or after this time.",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(),
+    default=None,
+    help="Only export runs before this time.",
+)
+def export(
+    runs: bool = False,
+    prompts: bool = False,
+    filename: str = "promptmage",
+    export_format: str = "jsonl",
+    compress: bool = False,
+    steps: tuple = (),
+    flow_file: str | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """Export the run data and prompts from the PromptMage instance.
+
+    Runs are streamed from the database to the file, so large exports need little memory.
 
     Args:
         runs (bool): Whether to export the run data.
         prompts (bool): Whether to export the prompts.
         filename (str): The name of the file to export the data to.
+        export_format (str): The file format of the exported runs, jsonl, json or csv.
+        compress (bool): Whether to gzip the exported runs.
+        steps (tuple): Only export runs of these steps.
+        flow_file (str | None): Only export runs of the steps of the flows in this file. If
+            steps are given as well, only the runs of those of the steps are exported.
+        status (str | None): Only export runs with this status.
+        since (datetime | None): Only export runs at or after this time.
+        until (datetime | None): Only export runs before this time.
     """
     if runs:
         click.echo("Exporting runs...")
+        step_names = list(steps) if steps else None
+        if flow_file:
+            flow_steps = [step for flow in get_flows(flow_file) for step in flow.steps]
+            # both filters apply, --step picks steps of the flows
+            step_names = [
+                step for step in flow_steps if step_names is None or step in step_names
+            ]
         data_store = SQLiteDataBackend()
-        run_data = data_store.get_all_data()
-
-        with open(f"{filename}_runs.json", "w") as f:
-            json.dump([run for run in run_data.values()], f)
+        run_data = data_store.iter_data(
+            step_names=step_names, status=status, since=since, until=until
+        )
+        path = f"{filename}_runs.{export_format}" + (".gz" if compress else "")
+        count = export_runs(run_data, path, export_format, compress=compress)
+        click.echo(f"Exported {count} runs to '{path}'.")
 
     if prompts:
         click.echo("Exporting prompts...")
@@ -122,7 +270,35 @@ def export(runs: bool = False, prompts: bool = False, filename: str = "promptmag
 @click.command()
 @click.option("--host", help="The host IP to run the server on.", default="localhost")
 @click.option("--port", help="The port to run the server on.", default=8021)
-def serve(host: str, port: int):
+@click.option(
+    "--partition-by",
+    type=click.Choice(["year", "month", "day"]),
+    default=None,
+    help="Store runs in one database file per period.",
+)
+@click.option(
+    "--blob-threshold",
+    type=int,
+    default=None,
+    help="Store run input and output values larger than this many bytes once in a blob store.",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(["zlib", "zstd"]),
+    default=None,
+    help="Compress the inputs and outputs of new runs.",
+)
+@retention_options
+def serve(
+    host: str,
+    port: int,
+    partition_by: str | None,
+    blob_threshold: int | None,
+    compression: str | None,
+    retention_days: float | None,
+    retention_runs_per_step: int | None,
+    retention_interval: float,
+):
     """Serve the PromptMage collaborative backend and frontend."""
     logger.info(f"\nWelcome to\n{title}")
     logger.info(f"Running PromptMage backend version {__version__}")
@@ -131,13 +307,23 @@ def serve(host: str, port: int):
     dirPath.mkdir(mode=0o777, parents=False, exist_ok=True)
 
     # create the FastAPI app
+    data_backend = SQLiteDataBackend(
+        partition_by=partition_by,
+        blob_threshold=blob_threshold,
+        compression=compression,
+    )
     backend = RemoteBackendAPI(
         url=f"http://{host}:{port}",
-        data_backend=SQLiteDataBackend(),
+        data_backend=data_backend,
         prompt_backend=SQLitePromptBackend(),
     )
     app = backend.get_app()
 
+    # schedule the retention of old run data
+    start_retention_task(
+        data_backend, retention_days, retention_runs_per_step, retention_interval
+    )
+
     # run the applications
     uvicorn.run(app, host=host, port=port, log_level="info")
 
@@ -145,19 +331,98 @@ def serve(host: str, port: int):
 @click.command()
 @click.option(
     "--json_path",
-    type=click.Path(
-        exists=True,
-    ),
+    type=click.Path(dir_okay=False),
     help="The path to write the JSON file containing the database backup.",
     required=True,
 )
-def backup(json_path: str):
+@click.option(
+    "--format",
+    "backup_format",
+    type=click.Choice(["jsonl", "json", "db"]),
+    default="jsonl",
+    help="The backup format, streamed line-delimited JSON, a single JSON document or a SQLite database snapshot.",
+)
+@click.option(
+    "--gzip",
+    "compress",
+    is_flag=True,
+    default=False,
+    help="Compress the backup with gzip, also enabled by a '.gz' file name.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only backup the data created or changed since the last backup.",
+)
+@click.option(
+    "--snapshot",
+    is_flag=True,
+    default=False,
+    help="Convert a consistent snapshot of the database instead of reading it while it is in use.",
+)
+def backup(
+    json_path: str,
+    backup_format: str,
+    compress: bool,
+    incremental: bool,
+    snapshot: bool,
+):
     """Backup the database from the PromptMage instance to json."""
     click.echo(f"Backing up the database to '{json_path}'...")
-    backup_db_to_json(db_path=".promptmage/promptmage.db", json_path=json_path)
+    db_path = ".promptmage/promptmage.db"
+    watermark_path = Path(".promptmage/backup_watermark.json")
+    if backup_format == "db":
+        if incremental:
+            raise click.UsageError("Incremental backups require the jsonl format.")
+        snapshot_db(db_path=db_path, snapshot_path=json_path)
+        click.echo("Backup complete.")
+        return
+    if snapshot:
+        # convert a consistent copy, so the running app can keep writing meanwhile
+        snapshot_path = ".promptmage/promptmage.snapshot.db"
+        snapshot_db(db_path=db_path, snapshot_path=snapshot_path)
+        db_path = snapshot_path
+    try:
+        _write_backup(
+            db_path, json_path, backup_format, compress, incremental, watermark_path
+        )
+    finally:
+        if snapshot:
+            Path(db_path).unlink()
     click.echo("Backup complete.")
 
 
+def _write_backup(
+    db_path: str,
+    json_path: str,
+    backup_format: str,
+    compress: bool,
+    incremental: bool,
+    watermark_path: Path,
+):
+    if backup_format == "jsonl":
+        since = None
+        if incremental:
+            if not watermark_path.exists():
+                raise click.UsageError(
+                    "No previous backup found, create a full backup first."
+                )
+            since = json.loads(watermark_path.read_text())
+        watermark = backup_db_to_jsonl(
+            db_path=db_path,
+            backup_path=json_path,
+            compress=compress or json_path.endswith(".gz"),
+            since=since,
+        )
+        # remember the watermark for the next incremental backup
+        watermark_path.write_text(json.dumps(watermark))
+    elif incremental:
+        raise click.UsageError("Incremental backups require the jsonl format.")
+    else:
+        backup_db_to_json(db_path=db_path, json_path=json_path)
+
+
 @click.command()
 @click.option(
     "--json_path",
@@ -167,7 +432,14 @@ def backup(json_path: str):
     help="The path to the JSON file containing the database backup.",
     required=True,
 )
-def restore(json_path: str):
+@click.option(
+    "--incremental",
+    "incremental_paths",
+    type=click.Path(exists=True),
+    multiple=True,
+    help="Incremental backups to replay on top of the backup, in order. Can be repeated.",
+)
+def restore(json_path: str, incremental_paths: tuple):
     """Restore the database from json to the PromptMage instance."""
     click.echo(f"Restoring the database from the backup '{json_path}'...")
     # check if the database already exists
@@ -176,17 +448,128 @@ def restore(json_path: str):
             "Are you sure you want to overwrite the current database?",
             abort=True,
         )
-    # restore the database
-    restore_db_from_json(db_path=".promptmage/promptmage.db", json_path=json_path)
+    # restore the database, the backup format is detected from the file
+    if incremental_paths:
+        restore_db_from_chain(
+            db_path=".promptmage/promptmage.db",
+            backup_paths=[json_path, *incremental_paths],
+        )
+    else:
+        restore_db(db_path=".promptmage/promptmage.db", backup_path=json_path)
     click.echo("Database restored successfully.")
 
 
+@click.command()
+@click.option(
+    "--max-age-days", default=None, type=float, help="Delete runs older than this."
+)
+@click.option(
+    "--max-runs-per-step",
+    default=None,
+    type=int,
+    help="Keep only this many most recent runs per step.",
+)
+@click.option(
+    "--keep-datasets/--no-keep-datasets",
+    default=True,
+    help="Whether to keep runs that are part of an evaluation dataset.",
+)
+@click.option(
+    "--archive-dir",
+    default=".promptmage/archive",
+    help="The directory to archive deleted runs to.",
+)
+@click.option(
+    "--no-archive", is_flag=True, default=False, help="Delete runs without archiving."
+)
+@click.option(
+    "--batch-size", default=500, type=int, help="Runs to delete per transaction."
+)
+@click.option(
+    "--vacuum",
+    is_flag=True,
+    default=False,
+    help="Switch the database to incremental vacuum with a one-time full VACUUM.",
+)
+@click.option(
+    "--collect-blobs",
+    is_flag=True,
+    default=False,
+    help="Delete stored payload blobs that no run references anymore.",
+)
+def prune(
+    max_age_days: float | None,
+    max_runs_per_step: int | None,
+    keep_datasets: bool,
+    archive_dir: str,
+    no_archive: bool,
+    batch_size: int,
+    vacuum: bool,
+    collect_blobs: bool,
+):
+    """Archive and delete old run data from the PromptMage database."""
+    backend = SQLiteDataBackend()
+    if vacuum:
+        click.echo("Vacuuming the database...")
+        enable_incremental_vacuum(backend)
+    policy = RetentionPolicy(
+        max_age_days=max_age_days,
+        max_runs_per_step=max_runs_per_step,
+        keep_datasets=keep_datasets,
+    )
+    deleted = apply_retention(
+        backend,
+        policy,
+        archive_dir=None if no_archive else archive_dir,
+        batch_size=batch_size,
+    )
+    click.echo(f"Deleted {deleted} runs.")
+    if collect_blobs:
+        click.echo(f"Deleted {backend.collect_blobs()} unreferenced blobs.")
+
+
+@click.command()
+@click.option(
+    "--codec",
+    type=click.Choice(["zlib", "zstd", "none"]),
+    default="zlib",
+    help="The codec to compress the stored runs with, none to decompress them.",
+)
+@click.option(
+    "--train-dictionary",
+    is_flag=True,
+    default=False,
+    help="Train a zstd dictionary on recent runs first.",
+)
+@click.option(
+    "--batch-size", default=500, type=int, help="Runs to rewrite per transaction."
+)
+def compress(codec: str, train_dictionary: bool, batch_size: int):
+    """Recompress the inputs and outputs of the stored runs.
+
+    Runs are rewritten in small batches, so this can run next to a running server. Start the
+    server with the same `--compression` to compress new runs as well.
+    """
+    try:
+        backend = SQLiteDataBackend(compression=None if codec == "none" else codec)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if train_dictionary:
+        if codec != "zstd":
+            raise click.UsageError("Dictionaries are only supported with --codec zstd.")
+        click.echo(f"Trained dictionary {backend.train_compression_dictionary()}.")
+    rewritten = backend.recompress(batch_size=batch_size)
+    click.echo(f"Recompressed {rewritten} runs.")
+
+
 promptmage.add_command(version)
 promptmage.add_command(run)
 promptmage.add_command(export)
 promptmage.add_command(serve)
 promptmage.add_command(backup)
 promptmage.add_command(restore)
+promptmage.add_command(prune)
+promptmage.add_command(compress)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+"""This module contains the JSON codec used for run payloads, backups and the remote API.
+
+orjson or msgspec are used when installed, the standard library otherwise. Set the
+`PROMPTMAGE_JSON` environment variable to `orjson`, `msgspec` or `json` to choose one.
+
+The fast libraries behave like the standard library for the JSON types, NaN and infinity
+included, and objects they can not serialize are handed to the standard library. orjson
+writes UUIDs and enums nested in an object, which the standard library rejects.
+"""
+
+import os
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JSON_BACKENDS = ["orjson", "msgspec", "json"]
+# objects with more containers are serialized by the standard library, which also detects cycles
+MAX_FAST_CONTAINERS = 100_000
+# the number of values `_has_non_finite` walks before it searches the JSON for a null instead
+NON_FINITE_WALK_BUDGET = 32
+# orjson hands these types to `default` instead of writing them differently than the standard library
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_PASSTHROUGH_SUBCLASS
+    if orjson
+    else 0
+)
+JSON_HEADERS = {"Content-Type": "application/json"}
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# the name of the active JSON library, see `set_json_backend`
+json_backend = "json"
+
+
+def set_json_backend(name: str | None = None):
+    """Choose the JSON library, the fastest installed one by default.
+
+    Raises:
+        ValueError: If the library is unknown or not installed.
+    """
+    global json_backend, _dumps, _loads
+    available = {"orjson": orjson, "msgspec": msgspec, "json": json}
+    if name is None:
+        name = next(backend for backend in JSON_BACKENDS if available[backend])
+    if name not in available:
+        raise ValueError(f"Unknown JSON backend '{name}'.")
+    if available[name] is None:
+        raise ValueError(f"The JSON backend '{name}' is not installed.")
+
+    if name == "orjson":
+        _dumps = _orjson_dumps
+        _loads = orjson.loads
+    elif name == "msgspec":
+        encoder = msgspec.json.Encoder()
+        _dumps = encoder.encode
+        _loads = msgspec.json.Decoder().decode
+    else:
+        _dumps = lambda obj: json.dumps(obj).encode("utf-8")
+        _loads = json.loads
+    json_backend = name
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize an object to UTF-8 encoded JSON."""
+    # msgspec writes every type it knows, so the object is checked up front
+    if json_backend == "json" or (json_backend == "msgspec" and not _is_plain(obj)):
+        return json.dumps(obj).encode("utf-8")
+    try:
+        data = _dumps(obj)
+    except (TypeError, ValueError, OverflowError):
+        # the fast libraries reject some values the standard library accepts, e.g. huge ints
+        return json.dumps(obj).encode("utf-8")
+    if json_backend == "orjson" and _has_non_finite(obj, data):
+        return json.dumps(obj).encode("utf-8")
+    return data
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_not_serializable, option=ORJSON_OPTIONS)
+
+
+def _not_serializable(obj: Any):
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _has_non_finite(obj: Any, data: bytes) -> bool:
+    """Check whether an object holds NaN or infinity, which orjson wrote as null to `data`.
+
+    Walking the object costs about 150ns per value and searching the JSON for a null about
+    1ns per byte, so objects with a few long strings are walked and others only walked if
+    their JSON has a null.
+    """
+    stack = [obj]
+    budget = NON_FINITE_WALK_BUDGET
+    while stack:
+        budget -= 1
+        if budget == 0 and b"null" not in data:
+            return False
+        value = stack.pop()
+        kind = type(value)
+        if kind is float:
+            if value - value != 0:
+                return True
+        elif kind is dict:
+            stack.extend(value.values())
+        elif kind is list or kind is tuple:
+            stack.extend(value)
+    return False
+
+
+def _is_plain(obj: Any) -> bool:
+    """Check that an object only holds JSON types, which all libraries serialize the same way."""
+    stack = [obj]
+    containers = 0
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is str or kind is int or kind is bool or value is None:
+            continue
+        if kind is float:
+            # the fast libraries write NaN and infinity as null
+            if value - value != 0:
+                return False
+            continue
+        containers += 1
+        if containers > MAX_FAST_CONTAINERS:
+            return False
+        if kind is dict:
+            for key in value:
+                if type(key) is not str:
+                    return False
+            stack.extend(value.values())
+        elif kind is list or kind is tuple:
+            stack.extend(value)
+        else:
+            return False
+    return True
+
+
+def dumps(obj: Any) -> str:
+    """Serialize an object to a JSON string."""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data: str | bytes) -> Any:
+    """Deserialize JSON from a string or bytes."""
+    try:
+        return _loads(data)
+    except ValueError:
+        # older rows written by the standard library may contain NaN or Infinity
+        return json.loads(data)
+
+
+class CodecJSONResponse(JSONResponse):
+    """A FastAPI response that renders its content with the active JSON library."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+set_json_backend(os.environ.get("PROMPTMAGE_JSON") or None)
@@ -26,12 +26,10 @@ def build_dataset_page(flow: PromptMage, dataset_id: str):
     # Get the dataset
     dataset = flow.data_store.backend.get_dataset(dataset_id)
 
-    datapoints = flow.data_store.backend.get_datapoints(dataset_id)
-
-    runs: List[RunData] = [
-        flow.data_store.backend.get_data(datapoint.run_data_id)
-        for datapoint in datapoints
-    ]
+    # fetch the datapoints together with their runs in one query
+    rows = flow.data_store.backend.get_datapoints_with_runs(dataset_id)
+    datapoints = [datapoint for datapoint, _ in rows]
+    runs: List[RunData] = [run_data for _, run_data in rows]
 
     table = None
     progress_bar = None
@@ -49,11 +47,8 @@ def build_dataset_page(flow: PromptMage, dataset_id: str):
     def rate_run(datapoint, rating):
         flow.data_store.backend.rate_datapoint(datapoint.id, rating)
 
-        # Update the datapoints and runs data after rating
-        datapoints[:] = flow.data_store.backend.get_datapoints(dataset_id)
-        runs[:] = [
-            flow.data_store.backend.get_data(dp.run_data_id) for dp in datapoints
-        ]
+        # Update the local datapoint instead of refetching the whole dataset
+        datapoint.rating = rating
         # Refresh the table content
         table.rows = build_table_rows(runs, datapoints)
         table.update()
@@ -168,15 +163,15 @@ def build_dataset_page(flow: PromptMage, dataset_id: str):
         import json
 
         logger.info("Downloading data")
-        # Get the data
-        data = [
-            flow.data_store.backend.get_data(datapoint.run_data_id)
-            for datapoint in datapoints
-        ]
-        # create the json file for export
+        # create the json file for export, fetching the data page by page
         export_data = []
-        for run_data, datapoint in zip(data, datapoints):
-            export_data.append(
+        page_size = 1000
+        offset = 0
+        while True:
+            page = flow.data_store.backend.get_datapoints_with_runs(
+                dataset_id, offset=offset, limit=page_size
+            )
+            export_data.extend(
                 {
                     "step_run_id": run_data.step_run_id,
                     "step_name": run_data.step_name,
@@ -184,7 +179,11 @@ def build_dataset_page(flow: PromptMage, dataset_id: str):
                     "output_data": run_data.output_data,
                     "rating": datapoint.rating,
                 }
+                for datapoint, run_data in page
             )
+            if len(page) < page_size:
+                break
+            offset += page_size
         # download the file
         ui.download(
             src=json.dumps(export_data, indent=4).encode("utf-8"),
@@ -8,19 +8,20 @@ from promptmage import PromptMage
 
 def build_evaluation_page(flow: PromptMage):
     available_datasets = []
+    dataset_stats = {}
 
     def get_datasets():
-        nonlocal available_datasets
+        nonlocal available_datasets, dataset_stats
         available_datasets = flow.data_store.backend.get_datasets()
+        dataset_stats = flow.data_store.backend.get_dataset_stats()
 
     get_datasets()
     columns: int = 5
 
     def dataset_card(dataset, flow):
-        datapoints = flow.data_store.backend.get_datapoints(dataset.id)
-        is_done = (
-            all([dp.rating is not None for dp in datapoints]) and len(datapoints) > 0
-        )
+        stats = dataset_stats.get(dataset.id, {"datapoints": 0, "rated": 0})
+        num_datapoints = stats["datapoints"]
+        is_done = stats["rated"] == num_datapoints and num_datapoints > 0
         with ui.card().style("padding: 20px; margin: 10px;"):
             with ui.row().classes("items-center"):
                 if is_done:
@@ -41,17 +42,13 @@ def build_evaluation_page(flow: PromptMage):
                         f"{dataset.description if dataset.description else 'No description'}"
                     )
                     ui.label(f"{dataset.created}")
-                    ui.label(f"{len(datapoints)}")
-                    if len(datapoints) == 0:
+                    ui.label(f"{num_datapoints}")
+                    if num_datapoints == 0:
                         ui.label("0%")
                         ui.label("N/A")
                     else:
-                        ui.label(
-                            f"{len([dp for dp in datapoints if dp.rating is not None]) / len(datapoints) * 100:.1f}%"
-                        )
-                        ui.label(
-                            f"{sum([dp.rating for dp in datapoints if dp.rating is not None]) / len(datapoints):.2f}"
-                        )
+                        ui.label(f"{stats['rated'] / num_datapoints * 100:.1f}%")
+                        ui.label(f"{stats['rating_sum'] / num_datapoints:.2f}")
             ui.separator()
             with ui.row().classes("justify-between"):
                 ui.button(
@@ -187,11 +187,10 @@ def create_runs_view(mage: PromptMage):
                 return
             dataset = datasets[dataset_select.value]
             selected_runs = table.selected
-            for run in selected_runs:
-                mage.data_store.backend.add_datapoint_to_dataset(
-                    run["step_run_id"], dataset.id
-                )
-                logger.info(f"Added run {run['step_run_id']} to dataset {dataset.id}")
+            mage.data_store.backend.add_datapoints_to_dataset(
+                [run["step_run_id"] for run in selected_runs], dataset.id
+            )
+            logger.info(f"Added {len(selected_runs)} runs to dataset {dataset.id}")
             ui.notify(
                 f"Added {len(selected_runs)} runs to dataset {dataset.name} successfully."
             )
@@ -210,6 +209,18 @@ def create_runs_view(mage: PromptMage):
                     value=None,
                     label="Select Dataset",
                 ).classes("w-1/3")
+                ui.space()
+                search_input = (
+                    ui.input(
+                        placeholder="Search inputs, outputs and prompts",
+                    )
+                    .props("clearable")
+                    .classes("w-1/4")
+                    .on("keydown.enter", lambda: search_runs())
+                    .on("clear", lambda: search_runs())
+                )
+                with search_input.add_slot("prepend"):
+                    ui.icon("search")
             # Create a table with clickable rows
             columns = [
                 {
@@ -288,4 +299,18 @@ def create_runs_view(mage: PromptMage):
 
             table.on("rowClick", on_row_click)
 
+            def search_runs():
+                query = search_input.value
+                if not query:
+                    table.rows = rows
+                else:
+                    matches = {
+                        run.step_run_id
+                        for run in mage.data_store.search_data(
+                            query, limit=1000, step_names=list(mage.steps)
+                        )
+                    }
+                    table.rows = [row for row in rows if row["step_run_id"] in matches]
+                table.update()
+
     return build_ui
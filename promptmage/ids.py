@@ -0,0 +1,43 @@
+"""This module contains the generation of time-ordered identifiers."""
+
+import os
+import time
+import uuid
+import threading
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> str:
+    """Generate a UUIDv7 string, in the same format as `str(uuid.uuid4())`.
+
+    The first 48 bits are the Unix time in milliseconds, so identifiers sort by creation time
+    and new rows are appended to the end of primary key indexes instead of random pages. IDs
+    generated in the same millisecond are ordered by a counter in the next 12 bits, the
+    remaining 62 bits are random.
+    """
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # start at a random value in the lower half, leaving room to count up
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            # the clock did not move or went backwards, keep counting on the last time
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+            ms = _last_ms
+        counter = _counter
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | rand_b
+    return str(uuid.UUID(int=value))
+
+
+def uuid7_time(value: str) -> float:
+    """Get the creation time of a UUIDv7 string as a Unix timestamp."""
+    return (uuid.UUID(value).int >> 80) / 1000
@@ -1,4 +1,4 @@
-import json
+import time
 import inspect
 from loguru import logger
 from collections import defaultdict
@@ -6,6 +6,8 @@ from typing import Dict, Callable, List
 
 
 # Local imports
+from .codec import dumps, loads
+from .ids import uuid7
 from .step import MageStep
 from .result import MageResult
 from .storage import (
@@ -159,11 +161,16 @@ class PromptMage:
             """
             Execute steps starting from the initial step, following the next_step attribute.
 
+            All steps executed by one call share a run ID, the run is recorded in the data
+            store with its start and end time and whether any step failed.
+
             Args:
                 initial_inputs (dict): The inputs for the initial step.
             """
             self.is_running = True
             self.execution_results = []
+            run_id = uuid7()
+            failed = False
 
             def execute_graph(
                 step_name: str,
@@ -173,6 +180,7 @@ class PromptMage:
                 """
                 Helper function to execute a step by its name.
                 """
+                nonlocal failed
                 logger.info(f"Executing step: {step_name}")
                 current_node = step_name
                 current_data = inputs
@@ -195,7 +203,16 @@ class PromptMage:
                             f"Step {current_node} requires additional inputs. Skipping."
                         )
                         break
-                    response = step.execute(**current_data, active=active_prompts)
+                    response = step.execute(
+                        **current_data, active=active_prompts, _run_id=run_id
+                    )
+                    if any(
+                        isinstance(res, MageResult) and res.error
+                        for res in (
+                            response if isinstance(response, list) else [response]
+                        )
+                    ):
+                        failed = True
 
                     # Store current and previous result ids
                     if previous_result_ids is None:
@@ -313,8 +330,23 @@ class PromptMage:
                     previous_result_ids if previous_result_ids else None,
                 )
 
-            final_result, _, _ = execute_graph(initial_step_name, initial_inputs)
-            self.is_running = False
+            if self.data_store:
+                self.data_store.start_run(run_id, self.name, time.time())
+            try:
+                final_result, _, _ = execute_graph(initial_step_name, initial_inputs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.is_running = False
+                if self.data_store:
+                    # an error here must not replace the error of a failed step
+                    try:
+                        self.data_store.end_run(
+                            run_id, "failed" if failed else "success", time.time()
+                        )
+                    except Exception as e:
+                        logger.error(f"Failed to record the end of run {run_id}: {e}")
             return final_result
 
         # Set the signature of the returned function to match the first function in the graph
@@ -334,11 +366,11 @@ class PromptMage:
                 break
             logger.info(f"Received data: {data}")
             # Parse the data
-            data = json.loads(data)
+            data = loads(data)
             # Run the flow
             result = run_function(**data)
             # Send the result back
-            await websocket.send_text(json.dumps(result))
+            await websocket.send_text(dumps(result))
         logger.info("Websocket connection closed.")
 
     def __repr__(self) -> str:
@@ -1,8 +1,9 @@
 """This module contains the Prompt class, which represents a prompt."""
 
-import uuid
 from typing import Dict, List
 
+from promptmage.ids import uuid7
+
 
 class Prompt:
     """A class that represents a prompt.
@@ -29,7 +30,7 @@ class Prompt:
         active: bool = False,
     ):
         self.name = name
-        self.id = id if id else str(uuid.uuid4())
+        self.id = id if id else uuid7()
         self.system = system
         self.user = user
         self.version = version
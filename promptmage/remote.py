@@ -1,14 +1,59 @@
 """This module contains the api for the remote backend of the PromptMage package."""
 
+import hashlib
 from loguru import logger
+from typing import Any, Dict, List
 
-from fastapi import FastAPI, Path, Query
+from fastapi import FastAPI, HTTPException, Path, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from promptmage import RunData, Prompt
+from promptmage.codec import NDJSON_CONTENT_TYPE, CodecJSONResponse, dumps_bytes, loads
 from promptmage.exceptions import PromptNotFoundException
 
 
+def conditional_response(request: Request, content: Any) -> Response:
+    """Render content with an ETag of its JSON, or a bodyless 304 if the client has it already.
+
+    Args:
+        request (Request): The request, with the ETags the client has in `If-None-Match`.
+        content (Any): The content to render.
+
+    Returns:
+        Response: The response with the ETag header.
+    """
+    body = dumps_bytes(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # weak comparison, as for GET requests
+        etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in etags or "*" in etags:
+            return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def parse_run(data: Any) -> RunData:
+    """Create the run data of a run sent to the API.
+
+    Raises:
+        ValueError: If the run is invalid.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a run object")
+    try:
+        run_data = RunData(**data)
+        if run_data.prompt:
+            run_data.prompt = Prompt(**run_data.prompt)
+    except TypeError as e:
+        raise ValueError(f"Invalid run: {e}")
+    for field in ["step_name", "status"]:
+        if not isinstance(getattr(run_data, field), str):
+            raise ValueError(f"Invalid run: '{field}' must be a string")
+    return run_data
+
+
 class RemoteBackendAPI:
 
     def __init__(self, url: str, data_backend, prompt_backend):
@@ -21,6 +66,7 @@ class RemoteBackendAPI:
         app = FastAPI(
             title="PromptMage Remote Backend",
             description="API for the remote backend of PromptMage.",
+            default_response_class=CodecJSONResponse,
         )
 
         app.add_middleware(
@@ -40,9 +86,95 @@ class RemoteBackendAPI:
         async def store_run(run_data: dict):
             logger.info(f"Storing run data: {run_data}")
             run_data = RunData(**run_data)
-            run_data.prompt = Prompt(**run_data.prompt)
+            if run_data.prompt:
+                run_data.prompt = Prompt(**run_data.prompt)
             self.data_backend.store_data(run_data)
 
+        @app.post("/runs/batch", tags=["runs"])
+        async def store_runs(request: Request):
+            """Store many runs in one transaction.
+
+            The body is a JSON array of runs, or one run per line with the content type
+            `application/x-ndjson`. Runs that are already stored are skipped. Invalid runs are
+            not stored and reported with their position in the batch, the other runs are.
+            """
+            body = await request.body()
+            try:
+                if request.headers.get("content-type", "").startswith(
+                    NDJSON_CONTENT_TYPE
+                ):
+                    runs = [loads(line) for line in body.splitlines() if line.strip()]
+                else:
+                    runs = loads(body)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+            if not isinstance(runs, list):
+                raise HTTPException(status_code=400, detail="Expected a list of runs")
+            run_datas = []
+            rejected = []
+            for index, run in enumerate(runs):
+                try:
+                    run_datas.append(parse_run(run))
+                except ValueError as e:
+                    step_run_id = (
+                        run.get("step_run_id") if isinstance(run, dict) else None
+                    )
+                    rejected.append(
+                        {"index": index, "step_run_id": step_run_id, "error": str(e)}
+                    )
+            if rejected:
+                logger.warning(f"Rejected {len(rejected)} invalid runs of a batch")
+            logger.info(f"Storing a batch of {len(run_datas)} runs")
+            return {
+                "stored": self.data_backend.store_data_batch(run_datas),
+                "rejected": rejected,
+            }
+
+        @app.get("/runs/search", tags=["runs"])
+        async def search_runs(
+            query: str = Query(...),
+            limit: int = Query(50),
+            step: List[str] | None = Query(None),
+        ):
+            return self.data_backend.search_data(query, limit=limit, step_names=step)
+
+        @app.get("/stats/latency", tags=["runs"])
+        async def get_latency_stats(
+            step_name: str | None = Query(None),
+            model: str | None = Query(None),
+            prompt_version: int | None = Query(None),
+            since: str | None = Query(None),
+            until: str | None = Query(None),
+            group_by: List[str] = Query(["step_name", "model", "prompt_version"]),
+            percentiles: List[float] = Query([50, 90, 95, 99]),
+        ):
+            try:
+                return self.data_backend.get_latency_stats(
+                    step_name=step_name,
+                    model=model,
+                    prompt_version=prompt_version,
+                    since=since,
+                    until=until,
+                    group_by=group_by,
+                    percentiles=percentiles,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @app.get("/stats/timeline", tags=["runs"])
+        async def get_run_timeline(
+            bucket: float = Query(3600.0),
+            step_name: str | None = Query(None),
+            since: str | None = Query(None),
+            until: str | None = Query(None),
+        ):
+            try:
+                return self.data_backend.get_run_timeline(
+                    bucket=bucket, step_name=step_name, since=since, until=until
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
         @app.get("/runs/{step_run_id}", tags=["runs"])
         async def get_run(step_run_id: str = Path(...)):
             return self.data_backend.get_data(step_run_id)
@@ -51,6 +183,35 @@ class RemoteBackendAPI:
         async def get_all_runs():
             return self.data_backend.get_all_data()
 
+        # Endpoints for the flow runs
+
+        @app.post("/flow-runs", tags=["flow runs"])
+        async def start_flow_run(run: dict):
+            self.data_backend.start_run(
+                run["run_id"], run["flow_name"], run.get("started_at")
+            )
+
+        @app.put("/flow-runs/{run_id}", tags=["flow runs"])
+        async def end_flow_run(run: dict, run_id: str = Path(...)):
+            self.data_backend.end_run(run_id, run["status"], run.get("ended_at"))
+
+        @app.get("/flow-runs", tags=["flow runs"])
+        async def get_flow_runs(
+            flow_name: str | None = Query(None), limit: int = Query(100)
+        ):
+            return self.data_backend.get_runs(flow_name=flow_name, limit=limit)
+
+        @app.get("/flow-runs/{run_id}", tags=["flow runs"])
+        async def get_flow_run(run_id: str = Path(...)):
+            run = self.data_backend.get_run(run_id)
+            if run is None:
+                raise HTTPException(status_code=404, detail="Run not found")
+            return run
+
+        @app.get("/flow-runs/{run_id}/steps", tags=["flow runs"])
+        async def get_flow_run_steps(run_id: str = Path(...)):
+            return self.data_backend.get_step_runs(run_id)
+
         # Endpoints for the prompt storage backend
 
         @app.post("/prompts", tags=["prompts"])
@@ -65,6 +226,7 @@ class RemoteBackendAPI:
 
         @app.get("/prompts/{prompt_name}", tags=["prompts"])
         async def get_prompt(
+            request: Request,
             prompt_name: str = Path(
                 ..., description="The name of the prompt to retrieve"
             ),
@@ -75,7 +237,8 @@ class RemoteBackendAPI:
         ):
             logger.info(f"Retrieving prompt with name: {prompt_name}")
             try:
-                return self.prompt_backend.get_prompt(prompt_name, version, active)
+                prompt = self.prompt_backend.get_prompt(prompt_name, version, active)
+                return conditional_response(request, prompt.to_dict())
             except PromptNotFoundException as e:
                 logger.error(
                     f"Prompt with ID {prompt_name} not found, returning an empty prompt."
@@ -91,16 +254,21 @@ class RemoteBackendAPI:
                 )
 
         @app.get("/prompts", tags=["prompts"])
-        def get_prompts():
+        def get_prompts(request: Request):
             logger.info("Retrieving all prompts.")
-            return self.prompt_backend.get_prompts()
+            return conditional_response(
+                request,
+                [prompt.to_dict() for prompt in self.prompt_backend.get_prompts()],
+            )
 
         @app.get("/prompts/id/{prompt_id}", tags=["prompts"])
         async def get_prompt_by_id(
-            prompt_id: str = Path(..., description="The ID of the prompt to retrieve")
+            request: Request,
+            prompt_id: str = Path(..., description="The ID of the prompt to retrieve"),
         ):
             logger.info(f"Retrieving prompt with ID {prompt_id}")
-            return self.prompt_backend.get_prompt_by_id(prompt_id)
+            prompt = self.prompt_backend.get_prompt_by_id(prompt_id)
+            return conditional_response(request, prompt.to_dict())
 
         @app.delete("/prompts/{prompt_id}", tags=["prompts"])
         async def delete_prompt(prompt_id: str = Path(...)):
@@ -109,6 +277,10 @@ class RemoteBackendAPI:
 
         # Endpoints for the datasets
 
+        @app.get("/datasets/stats", tags=["datasets"])
+        async def get_dataset_stats():
+            return self.data_backend.get_dataset_stats()
+
         @app.get("/datasets/{dataset_id}", tags=["datasets"])
         async def get_dataset(dataset_id: str):
             return self.data_backend.get_dataset(dataset_id)
@@ -117,4 +289,36 @@ class RemoteBackendAPI:
         async def get_datasets():
             return self.data_backend.get_datasets()
 
+        @app.get("/datasets/{dataset_id}/runs", tags=["datasets"])
+        async def get_datapoints_with_runs(
+            dataset_id: str = Path(...),
+            offset: int = Query(0, description="The number of datapoints to skip"),
+            limit: int | None = Query(
+                None, description="The maximum number of datapoints to return"
+            ),
+        ):
+            return [
+                {"datapoint": datapoint.to_dict(), "run": run_data.to_dict()}
+                for datapoint, run_data in self.data_backend.get_datapoints_with_runs(
+                    dataset_id, offset, limit
+                )
+            ]
+
+        @app.post("/datasets/{dataset_id}/datapoints", tags=["datasets"])
+        async def add_datapoints_to_dataset(
+            datapoint_ids: List[str], dataset_id: str = Path(...)
+        ):
+            logger.info(f"Adding {len(datapoint_ids)} datapoints to {dataset_id}")
+            self.data_backend.add_datapoints_to_dataset(datapoint_ids, dataset_id)
+
+        @app.put("/datapoints/ratings", tags=["datasets"])
+        async def rate_datapoints(ratings: Dict[str, int]):
+            logger.info(f"Rating {len(ratings)} datapoints")
+            self.data_backend.rate_datapoints(ratings)
+
+        @app.delete("/datapoints", tags=["datasets"])
+        async def remove_datapoints(datapoint_ids: List[str]):
+            logger.info(f"Removing {len(datapoint_ids)} datapoints")
+            self.data_backend.remove_datapoints(datapoint_ids)
+
         return app
@@ -1,4 +1,4 @@
-import uuid
+from promptmage.ids import uuid7
 
 
 class MageResult:
@@ -9,7 +9,7 @@ class MageResult:
         error: str | None = None,
         **kwargs,
     ):
-        self.id = str(uuid.uuid4())
+        self.id = uuid7()
         self.next_step = next_step
         self.results: dict = kwargs
         self.error = error
@@ -1,14 +1,46 @@
 """This module contains the RunData class, which is used to represent the data for a single run of a promptmage flow."""
 
-import uuid
+import time
 from datetime import datetime
 from typing import Dict
 
+from promptmage.ids import uuid7
 from promptmage.prompt import Prompt
 
 
+def epoch_time(value) -> float | None:
+    """Convert a run time to a Unix timestamp.
+
+    Args:
+        value: A Unix timestamp, a datetime or an ISO formatted string, which can be a date
+            prefix like `2024` or `2024-08` as well. Naive times are local times, like the run
+            times written by `str(datetime.now())`.
+
+    Returns:
+        float | None: The timestamp, or None if the value is None or can not be parsed.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    text = str(value)
+    if len(text) < 10:
+        text = (text + "-01-01")[:10]
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
 class RunData:
-    """A class that represents the data for a single run of a promptmage flow."""
+    """A class that represents the data for a single run of a promptmage flow.
+
+    `run_time` is the human readable start time. `started_at` and `ended_at` are the start and
+    end of the step execution as Unix timestamps, which the backends index for time range
+    queries. They are derived from `run_time` and `execution_time` if not given.
+    """
 
     def __init__(
         self,
@@ -16,18 +48,29 @@ class RunData:
         prompt: Prompt,
         input_data: Dict,
         output_data: Dict,
-        run_id: str = str(uuid.uuid4()),
+        run_id: str | None = None,
         step_run_id: str | None = None,
         run_time: datetime | None = None,
         execution_time: float | None = None,  # execution_time in seconds
         status: str | None = None,
         model: str | None = None,
+        started_at: float | None = None,
+        ended_at: float | None = None,
     ):
-        self.step_run_id = step_run_id if step_run_id else str(uuid.uuid4())
-        self.run_id = run_id
+        self.step_run_id = step_run_id if step_run_id else uuid7()
+        # steps executed outside of a flow run are runs of their own
+        self.run_id = run_id if run_id else uuid7()
         self.step_name = step_name
-        self.run_time = run_time if run_time else str(datetime.now())
+        if started_at is None:
+            started_at = epoch_time(run_time) if run_time else time.time()
+        self.run_time = (
+            run_time if run_time else str(datetime.fromtimestamp(started_at))
+        )
         self.execution_time = execution_time
+        self.started_at = started_at
+        if ended_at is None and started_at is not None and execution_time is not None:
+            ended_at = started_at + execution_time
+        self.ended_at = ended_at
         self.prompt = prompt
         self.input_data = input_data
         self.output_data = output_data
@@ -42,6 +85,8 @@ class RunData:
             f"status={self.status}, "
             f"run_time={self.run_time}, "
             f"execution_time={self.execution_time}, "
+            f"started_at={self.started_at}, "
+            f"ended_at={self.ended_at}, "
             f"prompt={self.prompt}, "
             f"input_data={self.input_data}, "
             f"output_data={self.output_data}, "
@@ -59,20 +104,24 @@ class RunData:
             "run_time": self.run_time,
             "model": self.model,
             "execution_time": self.execution_time,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
             "status": self.status,
         }
 
     @classmethod
     def from_dict(cls, data):
         return cls(
-            data["step_name"],
-            data["prompt"],
-            data["input_data"],
-            data["output_data"],
-            data["run_id"],
-            data["step_run_id"],
-            data["run_time"],
-            data["status"],
-            data["model"],
-            data["execution_time"],
+            step_name=data["step_name"],
+            prompt=data["prompt"],
+            input_data=data["input_data"],
+            output_data=data["output_data"],
+            run_id=data["run_id"],
+            step_run_id=data["step_run_id"],
+            run_time=data["run_time"],
+            execution_time=data["execution_time"],
+            status=data["status"],
+            model=data["model"],
+            started_at=data.get("started_at"),
+            ended_at=data.get("ended_at"),
         )
@@ -78,9 +78,21 @@ class MageStep:
         self._output_callbacks = []
 
     def execute(
-        self, prompt: Prompt | None = None, active: bool | None = None, **inputs
+        self,
+        prompt: Prompt | None = None,
+        active: bool | None = None,
+        _run_id: str | None = None,
+        **inputs,
     ):
-        """Execute the step with the given inputs."""
+        """Execute the step with the given inputs.
+
+        Args:
+            prompt (Prompt | None): The prompt to use instead of the stored one.
+            active (bool | None): Whether to use the active version of the stored prompt.
+            _run_id (str | None): The ID of the flow run the step is executed in. Defaults to
+                a new run of its own. Private, so step functions can have a `run_id` input.
+            **inputs: The inputs of the step function.
+        """
         logger.info(f"Executing step: {self.name}...")
         multi_input_param = None
         # set the inputs
@@ -131,9 +143,16 @@ class MageStep:
             logger.error(f"Error executing step: {e}")
             self.result = MageResult(error=f"Error: {e}")
             status = "failed"
-        execution_time = time.time() - start_time
+        end_time = time.time()
         # store the run data
-        self.store_run(prompt=prompt, status=status, execution_time=execution_time)
+        self.store_run(
+            prompt=prompt,
+            run_id=_run_id,
+            status=status,
+            execution_time=end_time - start_time,
+            started_at=start_time,
+            ended_at=end_time,
+        )
         # run the output callbacks
         for callback in self._output_callbacks:
             callback()
@@ -163,8 +182,11 @@ class MageStep:
     def store_run(
         self,
         prompt: Prompt | None = None,
+        run_id: str | None = None,
         status: str = "success",
         execution_time: float = 0.0,
+        started_at: float | None = None,
+        ended_at: float | None = None,
     ):
         """Store the run data in the data store."""
         if self.data_store:
@@ -181,9 +203,12 @@ class MageStep:
                     if isinstance(self.result, list)
                     else self.result.results
                 ),
+                run_id=run_id,
                 status=status,
                 model=self.model,
                 execution_time=execution_time,
+                started_at=started_at,
+                ended_at=ended_at,
             )
             self.data_store.store_data(run_data)
 
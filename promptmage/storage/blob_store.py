@@ -0,0 +1,152 @@
+"""This module contains the BlobStore class, a content-addressed store for large run payload values."""
+
+import os
+import re
+import mmap
+import uuid
+import hashlib
+from typing import Any, Iterator, Set
+
+from promptmage.codec import dumps_bytes, loads
+
+# Large values in run payloads are replaced by a dictionary with this single key
+BLOB_KEY = "$blob"
+BLOB_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobStore:
+    """A class that stores values in files named by the SHA-256 hash of their content.
+
+    Storing the same content twice writes it only once. Blobs are read through a memory map
+    of their file.
+
+    Attributes:
+        path (str): The directory of the blob files.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def put(self, data: bytes) -> str:
+        """Store content if it is not stored yet, otherwise mark the stored blob as used again.
+
+        Args:
+            data (bytes): The content to store.
+
+        Returns:
+            str: The hex digest of the content.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            # a blob that is referenced again is as young as the reference for collect_blobs
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temporary file first, so readers never see a partial blob
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """Read the content of a blob.
+
+        Raises:
+            FileNotFoundError: If there is no blob with this digest.
+        """
+        with open(self._path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[:]
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def delete(self, digest: str):
+        os.remove(self._path(digest))
+
+    def modified(self, digest: str) -> float:
+        """Get the time a blob was last stored, as a Unix timestamp."""
+        return os.path.getmtime(self._path(digest))
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the digests of all stored blobs."""
+        if not os.path.isdir(self.path):
+            return
+        for prefix in os.listdir(self.path):
+            directory = os.path.join(self.path, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if BLOB_DIGEST.fullmatch(prefix + name):
+                    yield prefix + name
+
+    def _path(self, digest: str) -> str:
+        if not BLOB_DIGEST.fullmatch(digest):
+            raise ValueError(f"Invalid blob digest '{digest}'.")
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def __repr__(self):
+        return f"BlobStore(path={self.path})"
+
+
+def externalize(value: Any, store: BlobStore, threshold: int) -> Any:
+    """Move the large values of a run payload to the blob store.
+
+    The values of a dictionary are moved one by one, so a value that is passed on to several
+    steps is only stored once. Other payloads are moved as a whole.
+
+    Args:
+        value (Any): The input or output data of a run.
+        store (BlobStore): The blob store.
+        threshold (int): The size in bytes of the serialized values to move.
+
+    Returns:
+        Any: The payload with large values replaced by blob references.
+    """
+    if isinstance(value, dict):
+        return {
+            key: _externalize_value(v, store, threshold) for key, v in value.items()
+        }
+    return _externalize_value(value, store, threshold)
+
+
+def _externalize_value(value: Any, store: BlobStore, threshold: int) -> Any:
+    data = dumps_bytes(value)
+    if len(data) < threshold:
+        return value
+    return {BLOB_KEY: store.put(data)}
+
+
+def internalize(value: Any, store: BlobStore) -> Any:
+    """Replace the blob references in a run payload with their values."""
+    if is_blob_reference(value):
+        return loads(store.get(value[BLOB_KEY]))
+    if isinstance(value, dict):
+        return {
+            key: (loads(store.get(v[BLOB_KEY])) if is_blob_reference(v) else v)
+            for key, v in value.items()
+        }
+    return value
+
+
+def blob_references(value: Any) -> Set[str]:
+    """Get the digests of the blobs a run payload references."""
+    if is_blob_reference(value):
+        return {value[BLOB_KEY]}
+    if isinstance(value, dict):
+        return {v[BLOB_KEY] for v in value.values() if is_blob_reference(v)}
+    return set()
+
+
+def is_blob_reference(value: Any) -> bool:
+    return (
+        isinstance(value, dict)
+        and len(value) == 1
+        and isinstance(value.get(BLOB_KEY), str)
+        # user payloads can look like references, only real digests are
+        and BLOB_DIGEST.fullmatch(value[BLOB_KEY]) is not None
+    )
@@ -0,0 +1,166 @@
+"""This module contains the compression of run payload columns.
+
+Compressed payloads are stored as binary values that start with a header of the magic bytes,
+the format version, the codec and the ID of the zstd dictionary, if any. Payloads without the
+header are plain JSON text, as written by older versions or with compression disabled.
+"""
+
+import zlib
+import struct
+import weakref
+import threading
+from typing import Callable, Dict, List
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"\x00PMZ"
+FORMAT_VERSION = 1
+# magic, format version, codec, dictionary ID
+HEADER = struct.Struct("<4sBBI")
+
+CODECS = {"zlib": 1, "zstd": 2}
+CODEC_NAMES = {value: name for name, value in CODECS.items()}
+
+# Payloads shorter than this are not worth compressing
+MIN_COMPRESS_SIZE = 128
+
+# zstd dictionaries by ID, shared by all databases as the IDs are derived from their content
+DICTIONARIES: Dict[int, bytes] = {}
+
+# methods that load dictionaries which are not registered yet, e.g. trained by another process
+_dictionary_loaders: List[weakref.WeakMethod] = []
+_dictionary_loaders_lock = threading.Lock()
+
+
+def add_dictionary_loader(loader: Callable[[int], bytes | None]):
+    """Register a method that loads a dictionary by ID, or returns None if it does not know it.
+
+    The method is only weakly referenced, so registering it does not keep its object alive.
+    """
+    with _dictionary_loaders_lock:
+        _dictionary_loaders.append(weakref.WeakMethod(loader))
+
+
+def get_dictionary(dictionary_id: int) -> bytes:
+    """Get a zstd dictionary by ID, loading it with the registered loaders if needed.
+
+    Raises:
+        ValueError: If no loader knows the dictionary.
+    """
+    if dictionary_id in DICTIONARIES:
+        return DICTIONARIES[dictionary_id]
+    with _dictionary_loaders_lock:
+        _dictionary_loaders[:] = [
+            ref for ref in _dictionary_loaders if ref() is not None
+        ]
+        loaders = list(_dictionary_loaders)
+    for ref in loaders:
+        loader = ref()
+        data = loader(dictionary_id) if loader is not None else None
+        if data is not None:
+            DICTIONARIES[dictionary_id] = data
+            return data
+    raise ValueError(f"Unknown compression dictionary {dictionary_id}.")
+
+
+def check_codec(codec: str):
+    """Raise a ValueError if a codec is unknown or its library is not installed."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec '{codec}'.")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError(
+            "zstd compression needs the zstandard package, install promptmage[zstd]."
+        )
+
+
+def compress_payload(
+    text: str, codec: str = "zlib", dictionary_id: int = 0
+) -> str | bytes:
+    """Compress the JSON text of a payload column.
+
+    Args:
+        text (str): The JSON text.
+        codec (str): Either `zlib` or `zstd`.
+        dictionary_id (int): The ID of a registered zstd dictionary, 0 for none.
+
+    Returns:
+        str | bytes: The compressed payload, or the text if compressing does not make it smaller.
+    """
+    data = text.encode("utf-8")
+    if len(data) < MIN_COMPRESS_SIZE:
+        return text
+    if codec == "zstd":
+        compressor = (
+            zstandard.ZstdCompressor(
+                dict_data=zstandard.ZstdCompressionDict(get_dictionary(dictionary_id))
+            )
+            if dictionary_id
+            else zstandard.ZstdCompressor()
+        )
+        compressed = compressor.compress(data)
+    else:
+        dictionary_id = 0
+        compressed = zlib.compress(data, 6)
+    if len(compressed) + HEADER.size >= len(data):
+        return text
+    return HEADER.pack(MAGIC, FORMAT_VERSION, CODECS[codec], dictionary_id) + compressed
+
+
+def decompress_payload(value: str | bytes | None) -> str | None:
+    """Get the JSON text of a payload column, compressed or not."""
+    if not isinstance(value, bytes):
+        return value
+    magic, version, codec, dictionary_id = payload_header(value)
+    if magic != MAGIC:
+        return value.decode("utf-8")
+    if version > FORMAT_VERSION:
+        raise ValueError(
+            f"Payload compression format {version} is newer than this version of promptmage."
+        )
+    data = value[HEADER.size :]
+    if CODEC_NAMES.get(codec) == "zstd":
+        if zstandard is None:
+            raise ValueError(
+                "The payload is zstd compressed, install promptmage[zstd] to read it."
+            )
+        decompressor = (
+            zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(get_dictionary(dictionary_id))
+            )
+            if dictionary_id
+            else zstandard.ZstdDecompressor()
+        )
+        return decompressor.decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def payload_header(value: bytes):
+    """Get the magic bytes, format version, codec and dictionary ID of a compressed payload."""
+    if len(value) < HEADER.size:
+        return b"", 0, 0, 0
+    return HEADER.unpack_from(value)
+
+
+def train_dictionary(samples: List[str], size: int = 110 * 1024) -> bytes:
+    """Train a zstd dictionary on sample payloads.
+
+    Args:
+        samples (List[str]): The JSON texts of sample payloads, a few hundred are usually enough.
+        size (int): The maximum size of the dictionary in bytes.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    check_codec("zstd")
+    dictionary = zstandard.train_dictionary(
+        size, [sample.encode("utf-8") for sample in samples]
+    )
+    return dictionary.as_bytes()
+
+
+def dictionary_id(dictionary: bytes) -> int:
+    """Get the ID zstd assigned to a trained dictionary."""
+    return zstandard.ZstdCompressionDict(dictionary).dict_id()
@@ -1,6 +1,6 @@
 """This module contains the DataStore class, which implements the storage and retrieval of data with different backends."""
 
-from typing import Dict
+from typing import Dict, List
 from loguru import logger
 
 from promptmage.storage import StorageBackend
@@ -19,6 +19,11 @@ class DataStore:
         logger.info(f"Storing data: {data}")
         self.backend.store_data(data)
 
+    def store_data_batch(self, data: List[RunData]) -> int:
+        """Store many runs at once, returns the number of newly stored runs."""
+        logger.info(f"Storing a batch of {len(data)} runs")
+        return self.backend.store_data_batch(data)
+
     def get_data(self, step_run_id: str) -> RunData:
         """Retrieve data from the backend."""
         logger.info(f"Retrieving data with ID: {step_run_id}")
@@ -30,3 +35,49 @@ class DataStore:
     def get_all_data(self) -> Dict:
         """Retrieve all data from the backend."""
         return self.backend.get_all_data()
+
+    def search_data(
+        self, query: str, limit: int = 50, step_names: List[str] | None = None
+    ) -> List[RunData]:
+        """Search the inputs, outputs and prompts of the stored runs."""
+        logger.info(f"Searching data for: {query}")
+        return self.backend.search_data(query, limit=limit, step_names=step_names)
+
+    def start_run(self, run_id: str, flow_name: str, started_at: float | None = None):
+        """Record the start of a flow run."""
+        logger.info(f"Starting run {run_id} of flow {flow_name}")
+        self.backend.start_run(run_id, flow_name, started_at)
+
+    def end_run(self, run_id: str, status: str, ended_at: float | None = None):
+        """Record the end and the final status of a flow run."""
+        logger.info(f"Run {run_id} ended with status {status}")
+        self.backend.end_run(run_id, status, ended_at)
+
+    def get_run(self, run_id: str) -> Dict:
+        """Retrieve a flow run by ID."""
+        run = self.backend.get_run(run_id)
+        if run:
+            return run
+        raise DataNotFoundException(run_id)
+
+    def get_runs(self, flow_name: str | None = None, limit: int = 100) -> List[Dict]:
+        """Retrieve the most recent flow runs, optionally of one flow only."""
+        return self.backend.get_runs(flow_name=flow_name, limit=limit)
+
+    def get_step_runs(self, run_id: str) -> List[RunData]:
+        """Retrieve the step runs of a flow run, ordered by their start time."""
+        return self.backend.get_step_runs(run_id)
+
+    def get_latency_stats(self, **kwargs) -> List[Dict]:
+        """Get run counts, error counts and latency percentiles per step, model and prompt version.
+
+        See `SQLiteDataBackend.get_latency_stats` for the available filters.
+        """
+        return self.backend.get_latency_stats(**kwargs)
+
+    def get_run_timeline(self, **kwargs) -> List[Dict]:
+        """Get run counts, error counts and mean latencies per time bucket.
+
+        See `SQLiteDataBackend.get_run_timeline` for the available filters.
+        """
+        return self.backend.get_run_timeline(**kwargs)
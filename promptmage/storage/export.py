@@ -0,0 +1,75 @@
+"""This module contains the streaming export of run data to JSONL, JSON and CSV files."""
+
+import csv
+from typing import Iterable
+from loguru import logger
+
+from promptmage.run_data import RunData
+from promptmage.codec import dumps
+from promptmage.storage.utils import open_backup
+
+EXPORT_FORMATS = ["jsonl", "json", "csv"]
+
+# The columns of a CSV export, nested values are written as JSON strings
+CSV_COLUMNS = [
+    "step_run_id",
+    "run_id",
+    "step_name",
+    "run_time",
+    "execution_time",
+    "status",
+    "model",
+    "prompt",
+    "input_data",
+    "output_data",
+]
+
+
+def export_runs(
+    runs: Iterable[RunData],
+    path: str,
+    export_format: str = "jsonl",
+    compress: bool | None = None,
+) -> int:
+    """Write run data to a file one run at a time.
+
+    Args:
+        runs (Iterable[RunData]): The runs to export, usually streamed with `SQLiteDataBackend.iter_data`.
+        path (str): The path of the file to write.
+        export_format (str): One of `jsonl`, `json` or `csv`. Defaults to `jsonl`.
+        compress (bool | None): Whether to gzip the file. Defaults to compressing if the path ends with `.gz`.
+
+    Returns:
+        int: The number of exported runs.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'.")
+    if compress is None:
+        compress = path.endswith(".gz")
+    logger.info(f"Exporting runs as {export_format} to '{path}' ...")
+    count = 0
+    with open_backup(path, "w", compress) as f:
+        if export_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+        elif export_format == "json":
+            f.write("[")
+        for run in runs:
+            data = run.to_dict()
+            if export_format == "csv":
+                writer.writerow([to_csv_value(data[column]) for column in CSV_COLUMNS])
+            elif export_format == "json":
+                f.write(("," if count else "") + "\n" + dumps(data))
+            else:
+                f.write(dumps(data) + "\n")
+            count += 1
+        if export_format == "json":
+            f.write("\n]\n")
+    logger.info(f"Exported {count} runs.")
+    return count
+
+
+def to_csv_value(value):
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return value
@@ -1,10 +1,563 @@
-"""This module contains the FileBackend class, which is a subclass of the StorageBackend class. It is used to store the data in a file on the local filesystem."""
+"""This module contains the FileBackend class, which is a subclass of the StorageBackend class. It is used to store the data in a file on the local filesystem.
 
+Runs and prompts are appended to a log of segment files. Every record is written as a header
+with the payload length, a CRC32 checksum and the record kind, followed by the JSON payload:
+
+    segment-00000001.log    records of the first, sealed segment
+    segment-00000001.idx    sorted index of the sealed segment, memory-mapped for lookups
+    segment-00000002.log    the active segment, indexed in memory
+
+When the active segment grows beyond `segment_size` it is sealed: its index is written to disk
+and a new segment is started. Compaction merges the sealed segments into one, dropping records
+that were overwritten. After a crash, a torn record at the end of the active segment is cut off.
+"""
+
+import os
+import mmap
+import zlib
+import time
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+from loguru import logger
+
+from promptmage.codec import dumps_bytes, loads
+from promptmage.prompt import Prompt
+from promptmage.run_data import RunData, epoch_time
 from promptmage.storage.storage_backend import StorageBackend
+from promptmage.storage.memory_backend import InMemoryPromptBackend
+from promptmage.storage.sqlite_backend import time_bound
+
+# record header: payload length, crc32 of kind and payload, kind
+RECORD_HEADER = struct.Struct("<IIB")
+# index header: magic, length of the indexed segment, number of entries
+INDEX_HEADER = struct.Struct("<8sQI")
+# index entry: key, kind, offset of the record, length of the payload
+INDEX_ENTRY = struct.Struct("<36sBQI")
+INDEX_MAGIC = b"PMIDX001"
+KEY_SIZE = 36
+
+RUN = 1
+RUN_DELETED = 2
+PROMPT = 3
+PROMPT_DELETED = 4
+FLOW_RUN = 5
+
+
+class SegmentIndex:
+    """The memory-mapped index of a sealed segment, entries are sorted by key."""
+
+    def __init__(self, path: Path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.segment_size, self.count = INDEX_HEADER.unpack_from(self.map, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a segment index.")
+
+    def entry(self, i: int) -> Tuple[bytes, int, int, int]:
+        return INDEX_ENTRY.unpack_from(
+            self.map, INDEX_HEADER.size + i * INDEX_ENTRY.size
+        )
+
+    def find(self, key: bytes) -> Tuple[int, int, int] | None:
+        """Binary search the entry of a key, returns its kind, offset and length."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            entry_key, kind, offset, length = self.entry(lo)
+            if entry_key == key:
+                return kind, offset, length
+        return None
+
+    def __iter__(self) -> Iterator[Tuple[bytes, int, int, int]]:
+        for i in range(self.count):
+            yield self.entry(i)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
 
 
 class FileBackend(StorageBackend):
-    """A class that stores the data in a file on the local filesystem."""
+    """A class that stores run data and prompts in an append-only log of segment files.
+
+    Attributes:
+        file_path (str): The directory to store the segment files in.
+        segment_size (int): The size in bytes after which the active segment is sealed.
+        fsync (bool): Whether to fsync every write, otherwise writes are flushed to the OS only.
+        compaction_interval (float | None): Seconds between background compactions, disabled if None.
+        min_segments (int): The number of sealed segments from which on they are compacted.
+    """
 
-    def __init__(self, file_path: str):
+    def __init__(
+        self,
+        file_path: str,
+        segment_size: int = 64 * 1024 * 1024,
+        fsync: bool = False,
+        compaction_interval: float | None = None,
+        min_segments: int = 4,
+    ):
         self.file_path = file_path
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.min_segments = min_segments
+        self.directory = Path(file_path)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._sealed: Dict[int, SegmentIndex] = {}
+        self._fds: Dict[int, int] = {}
+        self._active_index: Dict[bytes, Tuple[int, int, int]] = {}
+        self._open()
+        self.prompts = InMemoryPromptBackend()
+        for prompt in self._iter_records(PROMPT):
+            self.prompts.store_prompt(Prompt(**prompt))
+
+        self._stop = threading.Event()
+        self._compaction = None
+        if compaction_interval is not None:
+            self._compaction = threading.Thread(
+                target=self._compact_periodically,
+                args=(compaction_interval,),
+                name="promptmage-compaction",
+                daemon=True,
+            )
+            self._compaction.start()
+
+    # run data
+
+    def store_data(self, run_data: RunData):
+        self._append(run_data.step_run_id, RUN, run_data.to_dict())
+
+    def store_data_batch(self, runs: List[RunData]) -> int:
+        """Store many runs, skipping step run IDs that are already stored."""
+        stored = 0
+        with self._lock:
+            for run_data in runs:
+                if self._get(run_data.step_run_id, RUN) is None:
+                    self.store_data(run_data)
+                    stored += 1
+        return stored
+
+    def get_data(self, step_run_id: str) -> RunData:
+        data = self._get(step_run_id, RUN)
+        return _run_data(data) if data else None
+
+    def get_all_data(self) -> List[RunData]:
+        return [_run_data(data) for data in self._iter_records(RUN)]
+
+    def iter_data(
+        self,
+        step_names: List[str] | None = None,
+        status: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[RunData]:
+        """Iterate over the run data matching the filters, ordered by start time."""
+        since = time_bound(since) if since is not None else None
+        until = time_bound(until) if until is not None else None
+        runs = []
+        for data in self._iter_records(RUN):
+            if (step_names is not None and data["step_name"] not in step_names) or (
+                status is not None and data["status"] != status
+            ):
+                continue
+            started_at = _started_at(data)
+            if (since is not None or until is not None) and started_at is None:
+                continue
+            if (since is not None and started_at < since) or (
+                until is not None and started_at >= until
+            ):
+                continue
+            runs.append((started_at or 0.0, data))
+        for _, data in sorted(runs, key=lambda run: run[0]):
+            yield _run_data(data)
+
+    def delete_data(self, step_run_ids: List[str]):
+        for step_run_id in step_run_ids:
+            self._append(step_run_id, RUN_DELETED, step_run_id)
+
+    # flow runs
+
+    def start_run(self, run_id: str, flow_name: str, started_at: float | None = None):
+        self._append(
+            run_id,
+            FLOW_RUN,
+            {
+                "run_id": run_id,
+                "flow_name": flow_name,
+                "status": "running",
+                "started_at": started_at if started_at is not None else time.time(),
+                "ended_at": None,
+            },
+        )
+
+    def end_run(self, run_id: str, status: str, ended_at: float | None = None):
+        with self._lock:
+            run = self._get(run_id, FLOW_RUN)
+            if run is None:
+                return
+            run.update(
+                status=status,
+                ended_at=ended_at if ended_at is not None else time.time(),
+            )
+            self._append(run_id, FLOW_RUN, run)
+
+    def get_run(self, run_id: str) -> Dict | None:
+        return self._get(run_id, FLOW_RUN)
+
+    def get_runs(self, flow_name: str | None = None, limit: int = 100) -> List[Dict]:
+        runs = [
+            run
+            for run in self._iter_records(FLOW_RUN)
+            if flow_name is None or run["flow_name"] == flow_name
+        ]
+        runs.sort(key=lambda run: run["started_at"], reverse=True)
+        return runs[:limit]
+
+    def get_step_runs(self, run_id: str) -> List[RunData]:
+        """Get the step runs of a flow run, ordered by their start time.
+
+        The log is only indexed by key, so this scans all run records.
+        """
+        runs = [
+            _run_data(data)
+            for data in self._iter_records(RUN)
+            if data["run_id"] == run_id
+        ]
+        return sorted(runs, key=lambda run_data: run_data.started_at or 0.0)
+
+    # prompts
+
+    def store_prompt(self, prompt: Prompt):
+        with self._lock:
+            self.prompts.store_prompt(prompt)
+            self._append(prompt.id, PROMPT, prompt.to_dict())
+
+    def update_prompt(self, prompt: Prompt):
+        with self._lock:
+            before = {p.id: p.to_dict() for p in self.prompts.get_prompts()}
+            self.prompts.update_prompt(prompt)
+            for changed in self.prompts.get_prompts():
+                if before.get(changed.id) != changed.to_dict():
+                    self._append(changed.id, PROMPT, changed.to_dict())
+
+    def get_prompt(
+        self, prompt_name: str, version: int | None = None, active: bool | None = None
+    ) -> Prompt:
+        return self.prompts.get_prompt(prompt_name, version, active)
+
+    def get_prompt_by_id(self, prompt_id: str) -> Prompt:
+        return self.prompts.get_prompt_by_id(prompt_id)
+
+    def get_prompts(self) -> List[Prompt]:
+        return self.prompts.get_prompts()
+
+    def delete_prompt(self, prompt_id: str):
+        with self._lock:
+            self.prompts.delete_prompt(prompt_id)
+            self._append(prompt_id, PROMPT_DELETED, prompt_id)
+
+    # segments
+
+    def compact(self) -> bool:
+        """Merge the sealed segments into one, dropping records that were overwritten.
+
+        The merged segment is written next to the sealed segments while writes continue, and
+        replaces them at the end. Deletion markers are kept, so a crash in the middle of the
+        replacement can never bring back deleted records.
+
+        Returns:
+            bool: Whether segments were compacted.
+        """
+        with self._compaction_lock:
+            return self._compact()
+
+    def _compact(self) -> bool:
+        with self._lock:
+            numbers = sorted(self._sealed)
+            if len(numbers) < 2:
+                return False
+            live: Dict[bytes, Tuple[int, int, int, int]] = {}
+            for number in numbers:
+                for key, kind, offset, length in self._sealed[number]:
+                    live[key] = (number, offset, kind, length)
+            fds = {number: self._fds[number] for number in numbers}
+
+        target = numbers[-1]
+        log_tmp = self._segment_path(target, ".log.compact")
+        idx_tmp = self._segment_path(target, ".idx.compact")
+        entries = []
+        with open(log_tmp, "wb") as f:
+            offset = 0
+            for key, (number, record_offset, kind, length) in sorted(
+                live.items(), key=lambda item: item[1][:2]
+            ):
+                record = os.pread(
+                    fds[number], RECORD_HEADER.size + length, record_offset
+                )
+                f.write(record)
+                entries.append((key, kind, offset, length))
+                offset += len(record)
+            f.flush()
+            os.fsync(f.fileno())
+        _write_index(idx_tmp, offset, entries)
+
+        with self._lock:
+            for number in numbers:
+                self._sealed.pop(number).close()
+                os.close(self._fds.pop(number))
+            os.replace(log_tmp, self._segment_path(target, ".log"))
+            os.replace(idx_tmp, self._segment_path(target, ".idx"))
+            for number in numbers[:-1]:
+                self._segment_path(number, ".log").unlink()
+                self._segment_path(number, ".idx").unlink()
+            self._fds[target] = os.open(self._segment_path(target, ".log"), os.O_RDONLY)
+            self._sealed[target] = SegmentIndex(self._segment_path(target, ".idx"))
+        logger.info(f"Compacted {len(numbers)} segments into segment {target}.")
+        return True
+
+    def close(self):
+        """Stop the background compaction and close all segment files."""
+        self._stop.set()
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._active_file.close()
+            for index in self._sealed.values():
+                index.close()
+            for fd in self._fds.values():
+                os.close(fd)
+            self._sealed.clear()
+            self._fds.clear()
+
+    def _open(self):
+        """Open the segments, rebuilding missing indexes and cutting off a torn tail."""
+        for path in self.directory.glob("segment-*.compact"):
+            # left behind by an interrupted compaction
+            path.unlink()
+        numbers = sorted(
+            int(path.stem.split("-")[1])
+            for path in self.directory.glob("segment-*.log")
+        )
+        for number in numbers:
+            self._fds[number] = os.open(self._segment_path(number, ".log"), os.O_RDONLY)
+        active = numbers[-1] if numbers else 1
+        for number in numbers[:-1]:
+            self._sealed[number] = self._load_index(number)
+
+        path = self._segment_path(active, ".log")
+        index = self._load_index(active, rebuild=False) if numbers else None
+        if index is not None:
+            # the last segment was sealed before a new one was started
+            self._sealed[active] = index
+            active += 1
+            path = self._segment_path(active, ".log")
+        elif numbers:
+            entries = _recover_segment(path)
+            for key, kind, offset, length in entries:
+                self._active_index[key] = (kind, offset, length)
+
+        self._active = active
+        self._active_file = open(path, "ab")
+        self._active_size = self._active_file.tell()
+        if active not in self._fds:
+            self._fds[active] = os.open(path, os.O_RDONLY)
+
+    def _load_index(self, number: int, rebuild: bool = True) -> SegmentIndex | None:
+        """Load the index of a sealed segment, rebuilding it if it is missing or stale."""
+        log_path = self._segment_path(number, ".log")
+        idx_path = self._segment_path(number, ".idx")
+        if idx_path.exists():
+            try:
+                index = SegmentIndex(idx_path)
+                if index.segment_size == log_path.stat().st_size:
+                    return index
+                index.close()
+            except (ValueError, struct.error):
+                pass
+        if not rebuild:
+            return None
+        logger.info(f"Rebuilding the index of '{log_path}' ...")
+        entries = _recover_segment(log_path)
+        latest = {
+            key: (key, kind, offset, length) for key, kind, offset, length in entries
+        }
+        _write_index(idx_path, log_path.stat().st_size, latest.values())
+        return SegmentIndex(idx_path)
+
+    def _append(self, key: str, kind: int, value):
+        key_bytes = _key(key)
+        payload = dumps_bytes(value)
+        header = RECORD_HEADER.pack(len(payload), _checksum(kind, payload), kind)
+        with self._lock:
+            offset = self._active_size
+            self._active_file.write(header + payload)
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            self._active_size += len(header) + len(payload)
+            self._active_index[key_bytes] = (kind, offset, len(payload))
+            if self._active_size >= self.segment_size:
+                self._rotate()
+
+    def _rotate(self):
+        """Seal the active segment and start a new one."""
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+        self._active_file.close()
+        _write_index(
+            self._segment_path(self._active, ".idx"),
+            self._active_size,
+            [(key, *location) for key, location in self._active_index.items()],
+        )
+        self._sealed[self._active] = SegmentIndex(
+            self._segment_path(self._active, ".idx")
+        )
+        self._active += 1
+        self._active_index = {}
+        path = self._segment_path(self._active, ".log")
+        self._active_file = open(path, "ab")
+        self._active_size = 0
+        self._fds[self._active] = os.open(path, os.O_RDONLY)
+
+    def _get(self, key: str, kind: int) -> Dict | None:
+        """Read the latest record of a key, newest segment first."""
+        key_bytes = _key(key)
+        with self._lock:
+            location = self._active_index.get(key_bytes)
+            number = self._active
+            if location is None:
+                for number in sorted(self._sealed, reverse=True):
+                    location = self._sealed[number].find(key_bytes)
+                    if location is not None:
+                        break
+            if location is None or location[0] != kind:
+                return None
+            return self._read(number, *location)
+
+    def _iter_records(self, kind: int) -> Iterator[Dict]:
+        """Iterate over the latest live records of a kind in the order they were written."""
+        with self._lock:
+            live = {}
+            for number in sorted(self._sealed):
+                for key, entry_kind, offset, length in self._sealed[number]:
+                    live[key] = (number, offset, entry_kind, length)
+            for key, (entry_kind, offset, length) in self._active_index.items():
+                live[key] = (self._active, offset, entry_kind, length)
+            locations = sorted(
+                location for location in live.values() if location[2] == kind
+            )
+            records = [
+                self._read(number, entry_kind, offset, length)
+                for number, offset, entry_kind, length in locations
+            ]
+        yield from records
+
+    def _read(self, number: int, kind: int, offset: int, length: int) -> Dict:
+        record = os.pread(self._fds[number], RECORD_HEADER.size + length, offset)
+        _, checksum, _ = RECORD_HEADER.unpack_from(record)
+        payload = record[RECORD_HEADER.size :]
+        if checksum != _checksum(kind, payload):
+            raise ValueError(f"Corrupt record in segment {number} at offset {offset}.")
+        return loads(payload)
+
+    def _segment_path(self, number: int, suffix: str) -> Path:
+        return self.directory / f"segment-{number:08d}{suffix}"
+
+    def _compact_periodically(self, interval: float):
+        while not self._stop.wait(interval):
+            if len(self._sealed) >= self.min_segments:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Error compacting segments: {e}")
+
+
+def _key(key: str) -> bytes:
+    key_bytes = key.encode("ascii")
+    if len(key_bytes) > KEY_SIZE:
+        raise ValueError(f"Key '{key}' is longer than {KEY_SIZE} characters.")
+    return key_bytes.ljust(KEY_SIZE, b"\0")
+
+
+def _checksum(kind: int, payload: bytes) -> int:
+    return zlib.crc32(payload, zlib.crc32(bytes([kind])))
+
+
+def _run_data(data: Dict) -> RunData:
+    run_data = RunData(**data)
+    if run_data.prompt:
+        run_data.prompt = Prompt(**run_data.prompt)
+    return run_data
+
+
+def _started_at(data: Dict) -> float | None:
+    """Get the start time of a run record, records of older versions only have a run time."""
+    if data.get("started_at") is not None:
+        return data["started_at"]
+    return epoch_time(data.get("run_time"))
+
+
+def _scan_segment(path: Path) -> Tuple[List[Tuple[bytes, int, int, int]], int]:
+    """Read the records of a segment up to the first torn or corrupt one.
+
+    Returns:
+        Tuple[List, int]: The (key, kind, offset, length) entries and the end of the last valid record.
+    """
+    entries = []
+    offset = 0
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, checksum, kind = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or checksum != _checksum(kind, payload):
+                break
+            value = loads(payload)
+            if kind == RUN:
+                key = value["step_run_id"]
+            elif kind == PROMPT:
+                key = value["id"]
+            elif kind == FLOW_RUN:
+                key = value["run_id"]
+            else:
+                key = value
+            entries.append((_key(key), kind, offset, length))
+            offset += RECORD_HEADER.size + length
+    return entries, offset
+
+
+def _recover_segment(path: Path) -> List[Tuple[bytes, int, int, int]]:
+    """Scan a segment and cut off a torn or corrupt record at its end."""
+    entries, end = _scan_segment(path)
+    if end < path.stat().st_size:
+        logger.warning(f"Cutting off a torn record at the end of '{path}'.")
+        os.truncate(path, end)
+    return entries
+
+
+def _write_index(path: Path, segment_size: int, entries):
+    """Write a sorted segment index, replacing the previous index atomically."""
+    entries = sorted(entries)
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, segment_size, len(entries)))
+        for key, kind, offset, length in entries:
+            f.write(INDEX_ENTRY.pack(key, kind, offset, length))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
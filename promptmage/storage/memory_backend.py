@@ -1,48 +1,537 @@
-"""This module contains the InMemoryBackend class, which implements a simple in-memory storage backend for prompts."""
+"""This module contains the InMemoryBackend classes, which implement the prompt and data storage backends in memory.
 
-from typing import Dict
+They support the same interface as the SQLite backends without any I/O, which makes them a
+drop-in store for tests and benchmarks.
+"""
 
+import time
+import bisect
+import copy
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from promptmage.ids import uuid7
 from promptmage.prompt import Prompt
 from promptmage.run_data import RunData
 from promptmage.storage import StorageBackend
+from promptmage.storage.sqlite_backend import (
+    EvaluationDatasetModel,
+    EvaluationDatapointModel,
+    DEFAULT_PERCENTILES,
+    ROLLUP_DIMENSIONS,
+    latency_bin,
+    percentile,
+    rollup_bucket,
+    run_time_bound,
+    search_document,
+    time_bound,
+)
 from promptmage.exceptions import PromptNotFoundException
 
 
 class InMemoryPromptBackend(StorageBackend):
-    """A simple in-memory storage backend for prompts."""
+    """A storage backend that keeps prompts in memory.
+
+    Prompts are stored by ID with a secondary index from name to version to ID and a sorted
+    list of the versions of each name.
+    """
 
     def __init__(self):
         self.prompts: Dict[str, Prompt] = {}
+        self.versions: Dict[str, Dict[int, str]] = {}
+        self.sorted_versions: Dict[str, List[int]] = {}
 
     def store_prompt(self, prompt: Prompt):
         """Store a prompt in memory."""
-        self.prompts[prompt.name] = prompt.to_dict()
+        self._add(copy.copy(prompt))
+
+    def update_prompt(self, prompt: Prompt):
+        """Update an existing prompt by id.
+
+        Changes to the system or user prompt are stored as a new version.
+
+        Args:
+            prompt (Prompt): The prompt to update.
+        """
+        existing_prompt = self.prompts.get(prompt.id)
+        if existing_prompt is None:
+            raise PromptNotFoundException(
+                f"Prompt with name {prompt.name} and {prompt.id} not found."
+            )
+        if (
+            existing_prompt.system != prompt.system
+            or existing_prompt.user != prompt.user
+        ):
+            new_prompt = copy.copy(prompt)
+            new_prompt.version = self.sorted_versions[prompt.name][-1] + 1
+            new_prompt.id = uuid7()
+            if prompt.active:
+                existing_prompt.active = False
+            self._add(new_prompt)
+        else:
+            existing_prompt.active = prompt.active
+
+    def get_prompt(
+        self, prompt_name: str, version: int | None = None, active: bool | None = None
+    ) -> Prompt:
+        """Get the latest version of a prompt by name.
 
-    def get_prompt(self, prompt_name: str) -> str:
-        """Retrieve a prompt from memory."""
-        if prompt_name not in self.prompts:
-            raise PromptNotFoundException(f"Prompt with name {prompt_name} not found.")
-        return Prompt.from_dict(self.prompts.get(prompt_name))
+        Args:
+            prompt_name (str): The name of the prompt to retrieve.
+            version (int): The version of the prompt to retrieve.
+            active (bool): Whether to retrieve only the active prompt.
+        """
+        versions = self.versions.get(prompt_name, {})
+        if version is not None:
+            candidates = [version] if version in versions else []
+        else:
+            candidates = reversed(self.sorted_versions.get(prompt_name, []))
+        for candidate in candidates:
+            prompt = self.prompts[versions[candidate]]
+            if active is None or prompt.active == active:
+                return copy.copy(prompt)
+        raise PromptNotFoundException(f"Prompt with name {prompt_name} not found.")
 
-    def get_prompts(self) -> Dict:
+    def get_prompt_by_id(self, prompt_id: str) -> Prompt:
+        if prompt_id not in self.prompts:
+            raise PromptNotFoundException(f"Prompt with ID {prompt_id} not found.")
+        return copy.copy(self.prompts[prompt_id])
+
+    def get_prompts(self) -> List[Prompt]:
         """Retrieve all prompts from memory."""
-        return self.prompts
+        return [copy.copy(prompt) for prompt in self.prompts.values()]
+
+    def delete_prompt(self, prompt_id: str):
+        prompt = self.prompts.pop(prompt_id, None)
+        if prompt is None:
+            raise PromptNotFoundException(f"Prompt with ID {prompt_id} not found.")
+        versions = self.versions[prompt.name]
+        if versions.get(prompt.version) == prompt_id:
+            del versions[prompt.version]
+            self.sorted_versions[prompt.name].remove(prompt.version)
+        if not versions:
+            del self.versions[prompt.name]
+            del self.sorted_versions[prompt.name]
+
+    def _add(self, prompt: Prompt):
+        self.prompts[prompt.id] = prompt
+        versions = self.versions.setdefault(prompt.name, {})
+        if prompt.version not in versions:
+            bisect.insort(
+                self.sorted_versions.setdefault(prompt.name, []), prompt.version
+            )
+        versions[prompt.version] = prompt.id
 
 
 class InMemoryDataBackend(StorageBackend):
-    """A simple in-memory storage backend for data."""
+    """A storage backend that keeps run data and evaluation datasets in memory.
+
+    Runs are stored by step run ID with secondary indexes by step name and by flow run ID,
+    datapoints are indexed by their dataset.
+    """
 
     def __init__(self):
         self.data: Dict[str, RunData] = {}
+        self.steps: Dict[str, Dict[str, None]] = {}
+        self.runs: Dict[str, Dict] = {}
+        self.run_steps: Dict[str, Dict[str, None]] = {}
+        self.datasets: Dict[str, EvaluationDatasetModel] = {}
+        self.datapoints: Dict[str, EvaluationDatapointModel] = {}
+        self.dataset_datapoints: Dict[str, Dict[str, None]] = {}
+
+    def store_data(self, run_data: RunData):
+        """Store run data in memory."""
+        self.data[run_data.step_run_id] = copy.copy(run_data)
+        self.steps.setdefault(run_data.step_name, {})[run_data.step_run_id] = None
+        self.run_steps.setdefault(run_data.run_id, {})[run_data.step_run_id] = None
+
+    def store_data_batch(self, runs: List[RunData]) -> int:
+        """Store many runs, skipping step run IDs that are already stored."""
+        stored = 0
+        for run_data in runs:
+            if run_data.step_run_id not in self.data:
+                self.store_data(run_data)
+                stored += 1
+        return stored
+
+    def get_data(self, step_run_id: str) -> RunData:
+        """Retrieve run data from memory."""
+        run_data = self.data.get(step_run_id)
+        return copy.copy(run_data) if run_data else None
+
+    def get_all_data(self) -> List[RunData]:
+        """Retrieve all run data from memory."""
+        return [copy.copy(run_data) for run_data in self.data.values()]
+
+    def iter_data(
+        self,
+        step_names: List[str] | None = None,
+        status: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[RunData]:
+        """Iterate over the run data matching the filters, ordered by start time."""
+        since = time_bound(since) if since is not None else None
+        until = time_bound(until) if until is not None else None
+        runs = [
+            run_data
+            for run_data in self._runs_of_steps(step_names)
+            if (status is None or run_data.status == status)
+            and _in_time_range(run_data.started_at, since, until)
+        ]
+        for run_data in sorted(runs, key=lambda run_data: run_data.started_at or 0.0):
+            yield copy.copy(run_data)
+
+    def search_data(
+        self, query: str, limit: int = 50, step_names: List[str] | None = None
+    ) -> List[RunData]:
+        """Search the inputs, outputs and prompts of the stored runs, most recently stored first."""
+        terms = query.lower().split()
+        if not terms:
+            return []
+        matches = []
+        for run_data in reversed(list(self._runs_of_steps(step_names))):
+            text = " ".join(search_document(run_data).values()).lower()
+            if all(term in text for term in terms):
+                matches.append(copy.copy(run_data))
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def delete_data(self, step_run_ids: List[str]):
+        """Delete run data by step run ID."""
+        for step_run_id in step_run_ids:
+            run_data = self.data.pop(step_run_id, None)
+            if run_data is not None:
+                self.steps[run_data.step_name].pop(step_run_id, None)
+                self.run_steps[run_data.run_id].pop(step_run_id, None)
+
+    def start_run(self, run_id: str, flow_name: str, started_at: float | None = None):
+        """Record the start of a flow run."""
+        self.runs[run_id] = {
+            "run_id": run_id,
+            "flow_name": flow_name,
+            "status": "running",
+            "started_at": started_at if started_at is not None else time.time(),
+            "ended_at": None,
+        }
+
+    def end_run(self, run_id: str, status: str, ended_at: float | None = None):
+        """Record the end and the final status of a flow run."""
+        if run_id in self.runs:
+            self.runs[run_id].update(
+                status=status,
+                ended_at=ended_at if ended_at is not None else time.time(),
+            )
+
+    def get_run(self, run_id: str) -> Dict | None:
+        run = self.runs.get(run_id)
+        return dict(run) if run else None
+
+    def get_runs(self, flow_name: str | None = None, limit: int = 100) -> List[Dict]:
+        runs = [
+            run
+            for run in self.runs.values()
+            if flow_name is None or run["flow_name"] == flow_name
+        ]
+        runs.sort(key=lambda run: run["started_at"], reverse=True)
+        return [dict(run) for run in runs[:limit]]
+
+    def get_step_runs(self, run_id: str) -> List[RunData]:
+        """Get the step runs of a flow run, ordered by their start time."""
+        runs = [
+            self.data[step_run_id] for step_run_id in self.run_steps.get(run_id, {})
+        ]
+        runs.sort(key=lambda run_data: run_data.started_at or 0.0)
+        return [copy.copy(run_data) for run_data in runs]
+
+    def get_latency_stats(
+        self,
+        step_name: str | None = None,
+        model: str | None = None,
+        prompt_version: int | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        group_by: List[str] | None = None,
+        percentiles: List[float] | None = None,
+    ) -> List[Dict]:
+        """Get run counts, error counts and latency percentiles, computed like the SQLite rollups."""
+        if group_by is None:
+            group_by = ROLLUP_DIMENSIONS
+        if percentiles is None:
+            percentiles = DEFAULT_PERCENTILES
+        for dimension in group_by:
+            if dimension not in ROLLUP_DIMENSIONS:
+                raise ValueError(f"Can not group run rollups by '{dimension}'.")
+        since_bucket = (
+            rollup_bucket(run_time_bound(since)) if since is not None else None
+        )
+        until_time = run_time_bound(until) if until is not None else None
+        groups: Dict[Tuple, Dict] = {}
+        for run_data in self._runs_of_steps(
+            [step_name] if step_name is not None else None
+        ):
+            dimensions = {
+                "step_name": run_data.step_name,
+                "model": run_data.model,
+                "prompt_version": run_data.prompt.version if run_data.prompt else None,
+            }
+            bucket = rollup_bucket(run_data.run_time)
+            if (
+                (model is not None and dimensions["model"] != model)
+                or (
+                    prompt_version is not None
+                    and dimensions["prompt_version"] != prompt_version
+                )
+                or (since is not None and bucket < since_bucket)
+                or (until is not None and bucket >= until_time)
+            ):
+                continue
+            key = tuple(dimensions[dimension] for dimension in group_by)
+            group = groups.setdefault(
+                key, {"runs": 0, "errors": 0, "latencies": [], "bins": {}}
+            )
+            group["runs"] += 1
+            group["errors"] += run_data.status != "success"
+            if run_data.execution_time is not None:
+                group["latencies"].append(run_data.execution_time)
+                bin = latency_bin(run_data.execution_time)
+                group["bins"][bin] = group["bins"].get(bin, 0) + 1
+
+        stats = []
+        for key, group in groups.items():
+            latencies = group["latencies"]
+            latency_max = max(latencies) if latencies else None
+            result = dict(zip(group_by, key))
+            result.update(
+                {
+                    "runs": group["runs"],
+                    "errors": group["errors"],
+                    "error_rate": group["errors"] / group["runs"],
+                    "latency_mean": (
+                        sum(latencies) / len(latencies) if latencies else None
+                    ),
+                    "latency_max": latency_max,
+                }
+            )
+            bins = sorted(group["bins"].items())
+            for q in percentiles:
+                value = percentile(bins, q)
+                result[f"p{q:g}"] = (
+                    min(value, latency_max) if value is not None else None
+                )
+            stats.append(result)
+        return stats
+
+    def get_run_timeline(
+        self,
+        bucket: float = 3600.0,
+        step_name: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> List[Dict]:
+        """Get run counts, error counts and mean latencies per time bucket, like the SQLite backend."""
+        if bucket <= 0:
+            raise ValueError("The bucket size has to be positive.")
+        since = time_bound(since) if since is not None else None
+        until = time_bound(until) if until is not None else None
+        buckets: Dict[int, List] = {}
+        for run_data in self._runs_of_steps(
+            [step_name] if step_name is not None else None
+        ):
+            if run_data.started_at is None or not _in_time_range(
+                run_data.started_at, since, until
+            ):
+                continue
+            totals = buckets.setdefault(
+                int(run_data.started_at / bucket), [0, 0, 0, 0.0]
+            )
+            totals[0] += 1
+            totals[1] += run_data.status != "success"
+            if run_data.execution_time is not None:
+                totals[2] += 1
+                totals[3] += run_data.execution_time
+        return [
+            {
+                "start": index * bucket,
+                "runs": runs,
+                "errors": errors,
+                "latency_mean": latency_sum / timed_runs if timed_runs else None,
+            }
+            for index, (runs, errors, timed_runs, latency_sum) in sorted(
+                buckets.items()
+            )
+        ]
+
+    def create_dataset(self, name: str, description: str = None):
+        dataset = EvaluationDatasetModel(
+            id=uuid7(),
+            name=name,
+            description=description,
+            created=datetime.now(),
+        )
+        self.datasets[dataset.id] = dataset
+        self.dataset_datapoints[dataset.id] = {}
+
+    def delete_dataset(self, dataset_id: str):
+        if dataset_id not in self.datasets:
+            raise ValueError(f"Dataset with ID {dataset_id} not found.")
+        del self.datasets[dataset_id]
+        for datapoint_id in self.dataset_datapoints.pop(dataset_id):
+            del self.datapoints[datapoint_id]
+
+    def add_datapoint_to_dataset(self, datapoint_id, dataset_id):
+        self.add_datapoints_to_dataset([datapoint_id], dataset_id)
+
+    def add_datapoints_to_dataset(self, datapoint_ids: List[str], dataset_id: str):
+        """Add many runs to a dataset.
+
+        Args:
+            datapoint_ids (List[str]): The step run IDs of the runs to add.
+            dataset_id (str): The ID of the dataset.
+        """
+        if not datapoint_ids:
+            return
+        for run_data_id in datapoint_ids:
+            datapoint = EvaluationDatapointModel(
+                id=uuid7(), dataset_id=dataset_id, run_data_id=run_data_id
+            )
+            self.datapoints[datapoint.id] = datapoint
+            self.dataset_datapoints.setdefault(dataset_id, {})[datapoint.id] = None
+        self._touch_datasets([dataset_id])
+
+    def get_datasets(self) -> List[EvaluationDatasetModel]:
+        return [_copy_dataset(dataset) for dataset in self.datasets.values()]
+
+    def get_dataset(self, dataset_id: str) -> EvaluationDatasetModel:
+        if dataset_id not in self.datasets:
+            raise ValueError(f"Dataset with ID {dataset_id} not found.")
+        return _copy_dataset(self.datasets[dataset_id])
+
+    def get_datapoints(self, dataset_id: str) -> List[EvaluationDatapointModel]:
+        return [
+            _copy_datapoint(self.datapoints[datapoint_id])
+            for datapoint_id in self.dataset_datapoints.get(dataset_id, {})
+        ]
+
+    def get_dataset_stats(self) -> Dict[str, Dict]:
+        """Get the number of datapoints, rated datapoints, the rating sum and the last update per dataset."""
+        stats = {}
+        for dataset_id, dataset in self.datasets.items():
+            ratings = [
+                self.datapoints[datapoint_id].rating
+                for datapoint_id in self.dataset_datapoints[dataset_id]
+            ]
+            rated = [rating for rating in ratings if rating is not None]
+            stats[dataset_id] = {
+                "datapoints": len(ratings),
+                "rated": len(rated),
+                "rating_sum": sum(rated),
+                "last_updated": dataset.updated or dataset.created,
+            }
+        return stats
+
+    def get_datapoints_with_runs(
+        self, dataset_id: str, offset: int = 0, limit: int | None = None
+    ) -> List[Tuple[EvaluationDatapointModel, RunData]]:
+        """Get the datapoints of a dataset with their run data, ordered by datapoint ID."""
+        rows = [
+            (
+                _copy_datapoint(self.datapoints[datapoint_id]),
+                copy.copy(self.data[self.datapoints[datapoint_id].run_data_id]),
+            )
+            for datapoint_id in sorted(self.dataset_datapoints.get(dataset_id, {}))
+            if self.datapoints[datapoint_id].run_data_id in self.data
+        ]
+        end = offset + limit if limit is not None else None
+        return rows[offset:end]
+
+    def get_datapoint(self, datapoint_id: str) -> EvaluationDatapointModel:
+        if datapoint_id not in self.datapoints:
+            raise ValueError(f"Datapoint with ID {datapoint_id} not found.")
+        return _copy_datapoint(self.datapoints[datapoint_id])
+
+    def rate_datapoint(self, datapoint_id: str, rating: int):
+        if datapoint_id not in self.datapoints:
+            raise ValueError(f"Datapoint with ID {datapoint_id} not found.")
+        self.rate_datapoints({datapoint_id: rating})
+
+    def rate_datapoints(self, ratings: Dict[str, int]):
+        """Rate many datapoints.
+
+        Args:
+            ratings (Dict[str, int]): A mapping from datapoint ID to rating.
+        """
+        dataset_ids = set()
+        for datapoint_id, rating in ratings.items():
+            datapoint = self.datapoints.get(datapoint_id)
+            if datapoint is not None:
+                datapoint.rating = rating
+                dataset_ids.add(datapoint.dataset_id)
+        self._touch_datasets(dataset_ids)
+
+    def remove_datapoints(self, datapoint_ids: List[str]):
+        """Remove many datapoints from their datasets.
+
+        Args:
+            datapoint_ids (List[str]): The IDs of the datapoints to remove.
+        """
+        dataset_ids = set()
+        for datapoint_id in datapoint_ids:
+            datapoint = self.datapoints.pop(datapoint_id, None)
+            if datapoint is not None:
+                self.dataset_datapoints[datapoint.dataset_id].pop(datapoint_id, None)
+                dataset_ids.add(datapoint.dataset_id)
+        self._touch_datasets(dataset_ids)
+
+    def remove_datapoint_from_dataset(self, datapoint_id: str, dataset_id: str):
+        if datapoint_id not in self.datapoints:
+            raise ValueError(f"Datapoint with ID {datapoint_id} not found.")
+        self.remove_datapoints([datapoint_id])
+
+    def _runs_of_steps(self, step_names: List[str] | None) -> Iterator[RunData]:
+        """Iterate over the stored runs in insertion order, using the step index if filtered."""
+        if step_names is None:
+            yield from self.data.values()
+            return
+        step_run_ids = [
+            step_run_id
+            for step_name in step_names
+            for step_run_id in self.steps.get(step_name, {})
+        ]
+        if len(step_names) > 1:
+            order = {step_run_id: i for i, step_run_id in enumerate(self.data)}
+            step_run_ids.sort(key=order.get)
+        for step_run_id in step_run_ids:
+            yield self.data[step_run_id]
+
+    def _touch_datasets(self, dataset_ids):
+        now = datetime.now()
+        for dataset_id in dataset_ids:
+            if dataset_id in self.datasets:
+                self.datasets[dataset_id].updated = now
+
+
+def _copy_dataset(dataset: EvaluationDatasetModel) -> EvaluationDatasetModel:
+    return EvaluationDatasetModel(
+        id=dataset.id,
+        name=dataset.name,
+        description=dataset.description,
+        created=dataset.created,
+        updated=dataset.updated,
+    )
+
 
-    def store_data(self, run: RunData):
-        """Store data in memory."""
-        self.data[run.run_id] = run.to_dict()
+def _copy_datapoint(datapoint: EvaluationDatapointModel) -> EvaluationDatapointModel:
+    return EvaluationDatapointModel.from_dict(datapoint.to_dict())
 
-    def get_data(self, run_id: str) -> str:
-        """Retrieve data from memory."""
-        return RunData.from_dict(self.data.get(run_id))
 
-    def get_all_data(self) -> Dict:
-        """Retrieve all data from memory."""
-        return self.data
+def _in_time_range(timestamp: float | None, since: float | None, until: float | None):
+    if since is None and until is None:
+        return True
+    return (
+        timestamp is not None
+        and (since is None or timestamp >= since)
+        and (until is None or timestamp < until)
+    )
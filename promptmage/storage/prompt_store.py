@@ -1,6 +1,8 @@
 """This module contains the PromptStore class, which implements the storage and retrieval of prompts with different backends."""
 
-from typing import List
+import time
+import threading
+from typing import Dict, List, Tuple
 from loguru import logger
 
 from promptmage.storage import StorageBackend
@@ -9,15 +11,41 @@ from promptmage.exceptions import PromptNotFoundException
 
 
 class PromptStore:
-    """A class that stores and retrieves prompts with different backends."""
+    """A class that stores and retrieves prompts with different backends.
 
-    def __init__(self, backend):
+    Prompts are cached in-process by `(name, version, active)`. Every write through the store
+    bumps a monotonically increasing revision which invalidates all cached entries, and the
+    `cache_ttl` bounds how long changes made by other processes can go unnoticed.
+
+    Attributes:
+        backend (StorageBackend): The backend to store the prompts in.
+        cache_ttl (float): Seconds a cached prompt is served without asking the backend. Set to 0 to disable the cache.
+    """
+
+    def __init__(self, backend, cache_ttl: float = 30.0):
         self.backend: StorageBackend = backend
+        self.cache_ttl = cache_ttl
+        self.revision = 0
+        self._cache: Dict[Tuple, Tuple[int, float, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def _invalidate(self):
+        """Bump the store revision, which invalidates every cached prompt."""
+        with self._lock:
+            self.revision += 1
+            self._cache.clear()
+
+    def clear_cache(self):
+        """Drop all cached prompts."""
+        self._invalidate()
 
     def store_prompt(self, prompt: Prompt):
         """Store a prompt in the backend."""
         logger.info(f"Storing prompt: {prompt}")
-        self.backend.store_prompt(prompt)
+        try:
+            self.backend.store_prompt(prompt)
+        finally:
+            self._invalidate()
 
     def get_prompt(
         self, prompt_name: str, version: int | None = None, active: bool | None = None
@@ -32,9 +60,22 @@ class PromptStore:
         Returns:
             Prompt: The retrieved prompt.
         """
+        key = (prompt_name, version, active)
+        cached = self._cache.get(key)
+        if cached is not None:
+            revision, fetched_at, prompt_dict = cached
+            if (
+                revision == self.revision
+                and time.monotonic() - fetched_at < self.cache_ttl
+            ):
+                # hand out a copy so callers can not mutate the cached prompt
+                return Prompt.from_dict(
+                    {**prompt_dict, "template_vars": list(prompt_dict["template_vars"])}
+                )
         logger.info(f"Retrieving prompt with name: {prompt_name}")
+        revision = self.revision
         try:
-            return self.backend.get_prompt(prompt_name, version, active)
+            prompt = self.backend.get_prompt(prompt_name, version, active)
         except PromptNotFoundException:
             logger.error(
                 f"Prompt with ID {prompt_name} not found, returning an empty prompt."
@@ -48,6 +89,19 @@ class PromptStore:
                 template_vars=[],
                 active=False,
             )
+        if self.cache_ttl > 0:
+            with self._lock:
+                # do not cache results that raced with a write
+                if revision == self.revision:
+                    self._cache[key] = (
+                        revision,
+                        time.monotonic(),
+                        {
+                            **prompt.to_dict(),
+                            "template_vars": list(prompt.template_vars),
+                        },
+                    )
+        return prompt
 
     def get_prompt_by_id(self, prompt_id: str) -> Prompt:
         logger.info(f"Retrieving prompt with ID {prompt_id}")
@@ -60,9 +114,15 @@ class PromptStore:
     def delete_prompt(self, prompt_id: str):
         """Delete a prompt from the backend."""
         logger.info(f"Deleting prompt with ID: {prompt_id}")
-        self.backend.delete_prompt(prompt_id)
+        try:
+            self.backend.delete_prompt(prompt_id)
+        finally:
+            self._invalidate()
 
     def update_prompt(self, prompt: Prompt):
         """Update the prompt by id."""
         logger.info(f"Update prompt: {prompt}")
-        self.backend.update_prompt(prompt)
+        try:
+            self.backend.update_prompt(prompt)
+        finally:
+            self._invalidate()
@@ -1,32 +1,228 @@
+import atexit
+import threading
 import requests
 from loguru import logger
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from promptmage.run_data import RunData, Prompt
+from promptmage.storage.sqlite_backend import EvaluationDatapointModel
+from promptmage.codec import JSON_HEADERS, NDJSON_CONTENT_TYPE, dumps_bytes, loads
+from promptmage.storage.transport import (
+    Transport,
+    get_async_transport,
+    get_transport,
+    httpx,
+)
+
+
+# Stored runs are sent by the caller instead of in the background beyond this many batches
+MAX_BUFFERED_BATCHES = 10
+# The server refused the runs as invalid, sending them again would fail the same way
+REJECTED_STATUS_CODES = (400, 422)
+# The server has no batch endpoint, e.g. an older version of promptmage
+NO_BATCH_ENDPOINT_STATUS_CODES = (404, 405)
 
 
 class RemoteDataBackend:
-    def __init__(self, url: str):
+    """A class that stores run data on a remote backend server.
+
+    Stored runs are buffered and sent in batches by a background thread, every
+    `flush_interval` seconds or as soon as `batch_size` runs are waiting. Runs that could not
+    be sent stay buffered for the next flush, and the buffer is flushed before reading runs
+    and when the interpreter exits. Invalid runs the server rejects with status 400 or 422 are
+    logged and dropped. Batches the server finds too large are split, and runs are sent one
+    by one to servers without the batch endpoint.
+
+    Attributes:
+        url (str): The URL of the remote server.
+        transport (Transport): The transport to send requests with. Defaults to the pooled
+            transport shared by all backends of the server.
+        batch_size (int): The maximum number of runs per request.
+        flush_interval (float | None): Seconds between background flushes. Set to None to
+            send every run right away.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        transport: Transport | None = None,
+        batch_size: int = 100,
+        flush_interval: float | None = 1.0,
+    ):
         self.url = url
+        self.transport = transport if transport else get_transport(url)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict] = []
+        # cleared if the server has no batch endpoint
+        self._batch_endpoint = True
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+        if flush_interval is not None:
+            atexit.register(self.close)
 
     def store_data(self, run_data: RunData):
-        """Store the run data."""
-        # Send the run data to the remote server
+        """Store the run data, buffered unless `flush_interval` is None or the backend is closed."""
+        if self.flush_interval is None or self._stop.is_set():
+            self._send(run_data)
+            return
+        with self._buffer_lock:
+            self._buffer.append(run_data.to_dict())
+            pending = len(self._buffer)
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_periodically,
+                    name="promptmage-remote-flush",
+                    daemon=True,
+                )
+                self._flusher.start()
+        if pending >= MAX_BUFFERED_BATCHES * self.batch_size:
+            # the server does not keep up, slow down the steps instead of growing the buffer
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Send all buffered runs to the server, in batches of `batch_size` runs.
+
+        Raises:
+            requests.exceptions.RequestException: If a batch could not be sent. The runs that
+                were not sent stay buffered.
+        """
+        self._flush()
+
+    def _flush(self, full_batches_only: bool = False):
+        with self._flush_lock:
+            with self._buffer_lock:
+                size = len(self._buffer)
+                if full_batches_only:
+                    size -= size % self.batch_size
+                runs, self._buffer = self._buffer[:size], self._buffer[size:]
+            pending = [
+                runs[i : i + self.batch_size]
+                for i in range(0, len(runs), self.batch_size)
+            ]
+            try:
+                while pending:
+                    batch = pending[0]
+                    if not self._batch_endpoint:
+                        # runs are removed once sent, a failure keeps the rest buffered
+                        while batch:
+                            self._post_run(batch[0])
+                            batch.pop(0)
+                        pending.pop(0)
+                        continue
+                    response = self.transport.post(
+                        "/runs/batch",
+                        data=b"\n".join(dumps_bytes(run) for run in batch),
+                        headers={"Content-Type": NDJSON_CONTENT_TYPE},
+                    )
+                    status = response.status_code
+                    if status in NO_BATCH_ENDPOINT_STATUS_CODES:
+                        logger.warning(
+                            f"{self.url} has no batch endpoint, sending runs one by one."
+                        )
+                        self._batch_endpoint = False
+                        continue
+                    if status == 413 and len(batch) > 1:
+                        half = len(batch) // 2
+                        pending[0:1] = [batch[:half], batch[half:]]
+                        continue
+                    if status in REJECTED_STATUS_CODES or status == 413:
+                        # sending the batch again would fail the same way
+                        logger.error(
+                            f"The server rejected a batch of {len(batch)} runs: {response.text}"
+                        )
+                        pending.pop(0)
+                        continue
+                    response.raise_for_status()
+                    rejected = loads(response.content).get("rejected")
+                    if rejected:
+                        logger.error(
+                            f"The server rejected {len(rejected)} invalid runs: {rejected}"
+                        )
+                    pending.pop(0)
+            except requests.exceptions.RequestException as e:
+                remaining = [run for batch in pending for run in batch]
+                with self._buffer_lock:
+                    self._buffer[:0] = remaining
+                logger.error(f"Failed to store {len(remaining)} buffered runs: {e}")
+                raise
+            if runs:
+                logger.info(f"Sent {len(runs)} buffered runs")
+
+    def close(self):
+        """Stop the background flushes and send the remaining buffered runs."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        try:
+            self.flush()
+        except requests.exceptions.RequestException:
+            logger.error(f"{len(self._buffer)} runs were not sent to {self.url}")
+
+    def _flush_periodically(self):
+        while not self._stop.is_set():
+            # woken up early because of the number of runs, keep the rest for a full batch
+            full_batches_only = self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._flush(full_batches_only and not self._stop.is_set())
+            except requests.exceptions.RequestException:
+                # logged by flush, the runs are sent with the next flush
+                pass
+
+    def _post_run(self, run: Dict):
+        """Send a single buffered run, dropping it if the server rejects it as invalid."""
+        response = self.transport.post(
+            "/runs", data=dumps_bytes(run), headers=JSON_HEADERS
+        )
+        if response.status_code in REJECTED_STATUS_CODES:
+            logger.error(f"The server rejected an invalid run: {response.text}")
+            return
+        response.raise_for_status()
+
+    def _send(self, run_data: RunData):
         try:
-            response = requests.post(f"{self.url}/runs", json=run_data.to_dict())
+            response = self.transport.post(
+                "/runs",
+                data=dumps_bytes(run_data.to_dict()),
+                headers=JSON_HEADERS,
+            )
             response.raise_for_status()
             logger.info(f"Stored run data: {run_data}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to store run data: {e}")
             raise
 
+    async def astore_data(self, run_data: RunData):
+        """Store the run data without blocking the event loop, for async steps."""
+        transport = get_async_transport(self.transport)
+        try:
+            response = await transport.post(
+                "/runs",
+                content=dumps_bytes(run_data.to_dict()),
+                headers=JSON_HEADERS,
+            )
+            response.raise_for_status()
+            logger.info(f"Stored run data: {run_data}")
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to store run data: {e}")
+            raise
+
     def get_data(self, step_run_id: str) -> RunData:
         """Get the run data for a given step run ID."""
+        self.flush()
         try:
-            response = requests.get(f"{self.url}/runs/{step_run_id}")
+            response = self.transport.get(f"/runs/{step_run_id}")
             response.raise_for_status()
-            run_data = RunData(**response.json())
-            run_data.prompt = Prompt(**run_data.prompt)
+            run_data = RunData(**loads(response.content))
+            if run_data.prompt:
+                run_data.prompt = Prompt(**run_data.prompt)
             return run_data
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get run data: {e}")
@@ -34,19 +230,173 @@ class RemoteDataBackend:
 
     def get_all_data(self) -> List[RunData]:
         """Get all the run data."""
+        self.flush()
         try:
-            response = requests.get(f"{self.url}/runs")
+            response = self.transport.get("/runs")
             response.raise_for_status()
             run_datas = []
-            for data in response.json():
+            for data in loads(response.content):
                 run_data = RunData(**data)
-                run_data.prompt = Prompt(**run_data.prompt)
+                if run_data.prompt:
+                    run_data.prompt = Prompt(**run_data.prompt)
                 run_datas.append(run_data)
             return run_datas
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get all run data: {e}")
             raise
 
+    def search_data(
+        self, query: str, limit: int = 50, step_names: List[str] | None = None
+    ) -> List[RunData]:
+        """Search the inputs, outputs and prompts of the stored runs."""
+        self.flush()
+        try:
+            response = self.transport.get(
+                "/runs/search",
+                params={"query": query, "limit": limit, "step": step_names},
+            )
+            response.raise_for_status()
+            run_datas = []
+            for data in loads(response.content):
+                run_data = RunData(**data)
+                if run_data.prompt:
+                    run_data.prompt = Prompt(**run_data.prompt)
+                run_datas.append(run_data)
+            return run_datas
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to search run data: {e}")
+            raise
+
+    def get_latency_stats(
+        self,
+        step_name: str | None = None,
+        model: str | None = None,
+        prompt_version: int | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        group_by: List[str] | None = None,
+        percentiles: List[float] | None = None,
+    ) -> List[Dict]:
+        """Get run counts, error counts and latency percentiles per step, model and prompt version."""
+        self.flush()
+        try:
+            response = self.transport.get(
+                "/stats/latency",
+                params={
+                    "step_name": step_name,
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "since": str(since) if since else None,
+                    "until": str(until) if until else None,
+                    "group_by": group_by,
+                    "percentiles": percentiles,
+                },
+            )
+            response.raise_for_status()
+            return loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get latency stats: {e}")
+            raise
+
+    def get_run_timeline(
+        self,
+        bucket: float = 3600.0,
+        step_name: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> List[Dict]:
+        """Get run counts, error counts and mean latencies per time bucket."""
+        self.flush()
+        try:
+            response = self.transport.get(
+                "/stats/timeline",
+                params={
+                    "bucket": bucket,
+                    "step_name": step_name,
+                    "since": str(since) if since else None,
+                    "until": str(until) if until else None,
+                },
+            )
+            response.raise_for_status()
+            return loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get run timeline: {e}")
+            raise
+
+    def start_run(self, run_id: str, flow_name: str, started_at: float | None = None):
+        """Record the start of a flow run."""
+        try:
+            response = self.transport.post(
+                "/flow-runs",
+                data=dumps_bytes(
+                    {
+                        "run_id": run_id,
+                        "flow_name": flow_name,
+                        "started_at": started_at,
+                    }
+                ),
+                headers=JSON_HEADERS,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to store flow run: {e}")
+            raise
+
+    def end_run(self, run_id: str, status: str, ended_at: float | None = None):
+        """Record the end and the final status of a flow run."""
+        try:
+            response = self.transport.put(
+                f"/flow-runs/{run_id}",
+                data=dumps_bytes({"status": status, "ended_at": ended_at}),
+                headers=JSON_HEADERS,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to update flow run: {e}")
+            raise
+
+    def get_run(self, run_id: str) -> Dict | None:
+        """Get a flow run by ID."""
+        try:
+            response = self.transport.get(f"/flow-runs/{run_id}")
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get flow run: {e}")
+            raise
+
+    def get_runs(self, flow_name: str | None = None, limit: int = 100) -> List[Dict]:
+        """Get the most recent flow runs."""
+        try:
+            response = self.transport.get(
+                "/flow-runs",
+                params={"flow_name": flow_name, "limit": limit},
+            )
+            response.raise_for_status()
+            return loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get flow runs: {e}")
+            raise
+
+    def get_step_runs(self, run_id: str) -> List[RunData]:
+        """Get the step runs of a flow run."""
+        self.flush()
+        try:
+            response = self.transport.get(f"/flow-runs/{run_id}/steps")
+            response.raise_for_status()
+            run_datas = []
+            for data in loads(response.content):
+                run_data = RunData(**data)
+                if run_data.prompt:
+                    run_data.prompt = Prompt(**run_data.prompt)
+                run_datas.append(run_data)
+            return run_datas
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get the step runs of flow run: {e}")
+            raise
+
     def create_dataset(self, name: str):
         """Create a new dataset."""
         pass
@@ -57,22 +407,46 @@ class RemoteDataBackend:
     def add_datapoint_to_dataset(self, datapoint_id, dataset_id):
         pass
 
+    def add_datapoints_to_dataset(self, datapoint_ids: List[str], dataset_id: str):
+        """Add many runs to a dataset in a single request."""
+        self.flush()
+        try:
+            response = self.transport.post(
+                f"/datasets/{dataset_id}/datapoints",
+                data=dumps_bytes(datapoint_ids),
+                headers=JSON_HEADERS,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to add datapoints to dataset: {e}")
+            raise
+
     def get_datasets(self) -> List:
         """Get all the datasets."""
         try:
-            response = requests.get(f"{self.url}/datasets")
+            response = self.transport.get("/datasets")
             response.raise_for_status()
-            return response.json()
+            return loads(response.content)
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get all datasets: {e}")
             raise
 
+    def get_dataset_stats(self) -> Dict[str, Dict]:
+        """Get aggregate statistics for all datasets."""
+        try:
+            response = self.transport.get("/datasets/stats")
+            response.raise_for_status()
+            return loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get dataset stats: {e}")
+            raise
+
     def get_dataset(self, dataset_id: str):
         """Get a dataset by ID."""
         try:
-            response = requests.get(f"{self.url}/datasets/{dataset_id}")
+            response = self.transport.get(f"/datasets/{dataset_id}")
             response.raise_for_status()
-            return response.json()
+            return loads(response.content)
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get dataset: {e}")
             raise
@@ -80,11 +454,61 @@ class RemoteDataBackend:
     def get_datapoints(self, dataset_id: str) -> List:
         pass
 
+    def get_datapoints_with_runs(
+        self, dataset_id: str, offset: int = 0, limit: int | None = None
+    ) -> List[Tuple[EvaluationDatapointModel, RunData]]:
+        """Get the datapoints of a dataset together with their run data."""
+        self.flush()
+        try:
+            params = {"offset": offset}
+            if limit is not None:
+                params["limit"] = limit
+            response = self.transport.get(f"/datasets/{dataset_id}/runs", params=params)
+            response.raise_for_status()
+            rows = []
+            for row in loads(response.content):
+                run_data = RunData(**row["run"])
+                if run_data.prompt:
+                    run_data.prompt = Prompt(**run_data.prompt)
+                rows.append(
+                    (EvaluationDatapointModel.from_dict(row["datapoint"]), run_data)
+                )
+            return rows
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get datapoints with runs: {e}")
+            raise
+
     def get_datapoint(self, datapoint_id: str):
         pass
 
     def rate_datapoint(self, datapoint_id: str, rating: int):
         pass
 
+    def rate_datapoints(self, ratings: Dict[str, int]):
+        """Rate many datapoints in a single request."""
+        try:
+            response = self.transport.put(
+                "/datapoints/ratings",
+                data=dumps_bytes(ratings),
+                headers=JSON_HEADERS,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to rate datapoints: {e}")
+            raise
+
     def remove_datapoint_from_dataset(self, datapoint_id: str, dataset_id: str):
         pass
+
+    def remove_datapoints(self, datapoint_ids: List[str]):
+        """Remove many datapoints in a single request."""
+        try:
+            response = self.transport.delete(
+                "/datapoints",
+                data=dumps_bytes(datapoint_ids),
+                headers=JSON_HEADERS,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to remove datapoints: {e}")
+            raise
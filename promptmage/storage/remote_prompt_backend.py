@@ -1,21 +1,107 @@
+import time
+import threading
 import requests
-from typing import List
+from typing import Any, Dict, List, Tuple
 from loguru import logger
 
 from promptmage.prompt import Prompt
+from promptmage.codec import JSON_HEADERS, dumps_bytes, loads
+from promptmage.storage.transport import (
+    Transport,
+    get_async_transport,
+    get_transport,
+    httpx,
+)
 
 
 class RemotePromptBackend:
+    """A class that stores prompts on a remote backend server.
 
-    def __init__(self, url: str):
+    Attributes:
+        url (str): The URL of the remote server.
+        transport (Transport): The transport to send requests with. Defaults to the pooled
+            transport shared by all backends of the server.
+        cache_ttl (float): The number of seconds a fetched prompt is used without asking the
+            server. After that, the server is asked with the ETag of the prompt and answers
+            with an empty 304 response if the prompt did not change.
+    """
+
+    def __init__(
+        self, url: str, transport: Transport | None = None, cache_ttl: float = 0.0
+    ):
         self.url = url
+        self.transport = transport if transport else get_transport(url)
+        self.cache_ttl = cache_ttl
+        # (path, params) -> (etag, fetched at, response body)
+        self._cache: Dict[Tuple, Tuple[str | None, float, bytes]] = {}
+        self._cache_lock = threading.Lock()
+
+    def _get_cached(self, path: str, params: Dict[str, Any] | None = None) -> Any:
+        """Get the JSON content of a path, revalidating a cached response with its ETag."""
+        params, key, cached, now = self._lookup(path, params)
+        if cached is not None and now - cached[1] < self.cache_ttl:
+            return loads(cached[2])
+        response = self.transport.get(
+            path, params=params, headers=self._revalidation_headers(cached)
+        )
+        return loads(self._remember(key, cached, now, response))
+
+    async def _aget_cached(
+        self, path: str, params: Dict[str, Any] | None = None
+    ) -> Any:
+        """Like `_get_cached`, without blocking the event loop."""
+        params, key, cached, now = self._lookup(path, params)
+        if cached is not None and now - cached[1] < self.cache_ttl:
+            return loads(cached[2])
+        response = await get_async_transport(self.transport).get(
+            path, params=params, headers=self._revalidation_headers(cached)
+        )
+        return loads(self._remember(key, cached, now, response))
+
+    def _lookup(self, path: str, params: Dict[str, Any] | None) -> Tuple:
+        """Get the request parameters, the cache key and the cached response of a path."""
+        params = {
+            key: value for key, value in (params or {}).items() if value is not None
+        }
+        key = (path, tuple(sorted(params.items())))
+        return params, key, self._cache.get(key), time.monotonic()
+
+    @staticmethod
+    def _revalidation_headers(cached: Tuple | None) -> Dict[str, str] | None:
+        return {"If-None-Match": cached[0]} if cached and cached[0] else None
+
+    def _remember(
+        self, key: Tuple, cached: Tuple | None, now: float, response
+    ) -> bytes:
+        """Cache the body of a requests or httpx response, or reuse the cached one on a 304."""
+        if response.status_code == 304 and cached is not None:
+            body = cached[2]
+        else:
+            response.raise_for_status()
+            body = response.content
+        etag = response.headers.get("ETag")
+        if etag or self.cache_ttl > 0:
+            with self._cache_lock:
+                self._cache[key] = (etag, now, body)
+        # decoded for every call, callers may change the returned prompts
+        return body
+
+    def clear_cache(self):
+        """Forget all fetched prompts, e.g. after changing prompts on the server."""
+        with self._cache_lock:
+            self._cache.clear()
 
     def store_prompt(self, prompt: Prompt):
         """Store a prompt in the database."""
         # Send the prompt to the remote server
         try:
-            response = requests.post(f"{self.url}/prompts", json=prompt.to_dict())
+            response = self.transport.post(
+                "/prompts",
+                data=dumps_bytes(prompt.to_dict()),
+                headers=JSON_HEADERS,
+            )
             response.raise_for_status()
+            self.clear_cache()
             logger.info(f"Stored prompt {prompt}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to store run data: {e}")
@@ -28,8 +114,13 @@ class RemotePromptBackend:
             prompt (Prompt): The prompt to update.
         """
         try:
-            response = requests.put(f"{self.url}/prompts", json=prompt.to_dict())
+            response = self.transport.put(
+                "/prompts",
+                data=dumps_bytes(prompt.to_dict()),
+                headers=JSON_HEADERS,
+            )
             response.raise_for_status()
+            self.clear_cache()
             logger.info(f"Updated prompt {prompt}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to update prompt: {e}")
@@ -50,18 +141,35 @@ class RemotePromptBackend:
         """
         logger.info(f"Retrieving prompt with name: {prompt_name}")
         try:
-            path = f"{self.url}/prompts/{prompt_name}"
-            if version:
-                path += f"?version={version}"
-            if active:
-                path += f"&active={active}"
-            response = requests.get(path)
-            response.raise_for_status()
-            return Prompt(**response.json())
+            return Prompt(
+                **self._get_cached(
+                    f"/prompts/{prompt_name}",
+                    params={"version": version, "active": active},
+                )
+            )
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get prompt: {e}")
             raise
 
+    async def aget_prompt(
+        self, prompt_name: str, version: int | None = None, active: bool | None = None
+    ) -> Prompt:
+        """Retrieve a prompt without blocking the event loop, for async steps.
+
+        See `get_prompt` for the arguments.
+        """
+        logger.info(f"Retrieving prompt with name: {prompt_name}")
+        try:
+            return Prompt(
+                **await self._aget_cached(
+                    f"/prompts/{prompt_name}",
+                    params={"version": version, "active": active},
+                )
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to get prompt: {e}")
+            raise
+
     def get_prompt_by_id(self, prompt_id: str) -> Prompt:
         """Get the prompt by id.
 
@@ -70,10 +178,7 @@ class RemotePromptBackend:
         """
         logger.info(f"Retrieving prompt with ID {prompt_id}")
         try:
-            response = requests.get(f"{self.url}/prompts/id/{prompt_id}")
-            response.raise_for_status()
-            logger.info(f"{response.json()}")
-            return Prompt(**response.json())
+            return Prompt(**self._get_cached(f"/prompts/id/{prompt_id}"))
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get prompt by id: {e}")
             raise
@@ -81,9 +186,7 @@ class RemotePromptBackend:
     def get_prompts(self) -> List[Prompt]:
         """Get all prompts from the database."""
         try:
-            response = requests.get(f"{self.url}/prompts")
-            response.raise_for_status()
-            return [Prompt(**prompt) for prompt in response.json()]
+            return [Prompt(**prompt) for prompt in self._get_cached("/prompts")]
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get prompts: {e}")
             raise
@@ -95,8 +198,9 @@ class RemotePromptBackend:
             prompt_id (str): The id of the prompt to delete.
         """
         try:
-            response = requests.delete(f"{self.url}/prompts/{prompt_id}")
+            response = self.transport.delete(f"/prompts/{prompt_id}")
             response.raise_for_status()
+            self.clear_cache()
             logger.info(f"Deleted prompt with id {prompt_id}")
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to delete prompt: {e}")
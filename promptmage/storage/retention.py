@@ -0,0 +1,307 @@
+"""This module contains the retention subsystem, which archives and deletes old run data from a SQLite data backend."""
+
+import os
+import gzip
+import time
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from loguru import logger
+from typing import Dict, List
+
+from sqlalchemy import select, delete, or_, text
+from sqlalchemy.sql import func
+
+from promptmage.codec import dumps_bytes
+from promptmage.run_data import RunData
+from promptmage.storage.sqlite_backend import (
+    SQLiteDataBackend,
+    RunDataModel,
+    FlowRunModel,
+    EvaluationDatapointModel,
+)
+
+
+class RetentionPolicy:
+    """A class that describes which run data expires.
+
+    A run expires if it is older than `max_age_days` or if it is not among the `max_runs_per_step`
+    most recent runs of its step. Runs that are part of an evaluation dataset are never expired
+    when `keep_datasets` is set.
+
+    Attributes:
+        max_age_days (float | None): The maximum age of a run in days. Defaults to no age limit.
+        max_runs_per_step (int | None): The number of most recent runs to keep per step. Defaults to no limit.
+        keep_datasets (bool): Whether to keep runs that are part of an evaluation dataset. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        max_age_days: float | None = None,
+        max_runs_per_step: int | None = None,
+        keep_datasets: bool = True,
+    ):
+        self.max_age_days = max_age_days
+        self.max_runs_per_step = max_runs_per_step
+        self.keep_datasets = keep_datasets
+
+    @property
+    def is_empty(self) -> bool:
+        return self.max_age_days is None and self.max_runs_per_step is None
+
+    def __repr__(self):
+        return (
+            f"RetentionPolicy(max_age_days={self.max_age_days}, "
+            f"max_runs_per_step={self.max_runs_per_step}, "
+            f"keep_datasets={self.keep_datasets})"
+        )
+
+
+def expired_runs_query(policy: RetentionPolicy, limit: int):
+    """Build the query selecting the step run IDs of the oldest expired runs."""
+    conditions = []
+    if policy.max_age_days is not None:
+        cutoff = str(datetime.now() - timedelta(days=policy.max_age_days))
+        conditions.append(RunDataModel.run_time < cutoff)
+    if policy.max_runs_per_step is not None:
+        ranked = select(
+            RunDataModel.step_run_id,
+            func.row_number()
+            .over(
+                partition_by=RunDataModel.step_name,
+                order_by=RunDataModel.run_time.desc(),
+            )
+            .label("position"),
+        ).subquery()
+        conditions.append(
+            RunDataModel.step_run_id.in_(
+                select(ranked.c.step_run_id).where(
+                    ranked.c.position > policy.max_runs_per_step
+                )
+            )
+        )
+    query = select(RunDataModel.step_run_id).where(or_(*conditions))
+    if policy.keep_datasets:
+        query = query.where(
+            RunDataModel.step_run_id.not_in(
+                select(EvaluationDatapointModel.run_data_id).where(
+                    EvaluationDatapointModel.run_data_id.is_not(None)
+                )
+            )
+        )
+    return query.order_by(RunDataModel.run_time).limit(limit)
+
+
+def apply_retention(
+    backend: SQLiteDataBackend,
+    policy: RetentionPolicy,
+    archive_dir: str | None = ".promptmage/archive",
+    batch_size: int = 500,
+    vacuum_pages: int = 1000,
+    pause: float = 0.05,
+) -> int:
+    """Archive and delete all runs that expired under the given policy.
+
+    Expired runs are processed in small batches, each in its own short transaction, so writers
+    are never blocked for long. Every batch is appended to a gzip compressed JSONL segment file
+    in `archive_dir` before it is deleted, and freed pages are given back to the file system
+    with an incremental vacuum. Flow runs older than `max_age_days` are archived to a segment
+    of their own and deleted the same way.
+
+    On a partitioned backend, partitions older than `max_age_days` are dropped as a whole and
+    their files are moved to `archive_dir`. Runs in partitions that are partly expired are kept
+    until the whole partition expires, and the row by row policy only applies to the runs in
+    the main database.
+
+    Args:
+        backend (SQLiteDataBackend): The data backend to apply the policy to.
+        policy (RetentionPolicy): The retention policy.
+        archive_dir (str | None): The directory to write archive segments to. Set to None to delete without archiving.
+        batch_size (int): The number of runs to archive and delete per transaction.
+        vacuum_pages (int): The maximum number of free pages to release after each batch.
+        pause (float): Seconds to sleep between batches to let other writers through.
+
+    Returns:
+        int: The number of deleted runs.
+    """
+    if policy.is_empty:
+        logger.info("Retention policy is empty, nothing to do.")
+        return 0
+    logger.info(f"Applying {policy} to '{backend.db_path}' ...")
+
+    deleted = 0
+    if backend.partition_by is not None and policy.max_age_days is not None:
+        deleted += backend.drop_partitions(
+            str(datetime.now() - timedelta(days=policy.max_age_days)),
+            keep_datasets=policy.keep_datasets,
+            archive_dir=archive_dir,
+        )
+
+    archived = False
+    if archive_dir is not None:
+        Path(archive_dir).mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        segment_path = Path(archive_dir) / f"runs-{stamp}.jsonl.gz"
+        flow_segment_path = Path(archive_dir) / f"flow-runs-{stamp}.jsonl.gz"
+
+    incremental_vacuum = _auto_vacuum_mode(backend) == 2
+    if not incremental_vacuum:
+        logger.info(
+            "Database is not in incremental auto vacuum mode, run `promptmage prune --vacuum` once to release space."
+        )
+
+    while True:
+        session = backend.Session()
+        try:
+            rows = session.execute(
+                select(RunDataModel).where(
+                    RunDataModel.step_run_id.in_(
+                        expired_runs_query(policy, batch_size).scalar_subquery()
+                    )
+                )
+            ).scalars()
+            batch: List[RunData] = backend.rehydrate(rows)
+        finally:
+            session.close()
+        if not batch:
+            break
+
+        if archive_dir is not None:
+            # the archive has to be durable before the rows are gone
+            _append_segment(segment_path, [run_data.to_dict() for run_data in batch])
+            archived = True
+
+        backend.delete_data([run_data.step_run_id for run_data in batch])
+        deleted += len(batch)
+        logger.info(f"Deleted {deleted} expired runs so far.")
+
+        if incremental_vacuum:
+            _incremental_vacuum(backend, vacuum_pages)
+        if len(batch) < batch_size:
+            break
+        time.sleep(pause)
+
+    if policy.max_age_days is not None:
+        # flow runs expire by age like their step runs, the runs of kept datasets included
+        cutoff = (datetime.now() - timedelta(days=policy.max_age_days)).timestamp()
+        while True:
+            session = backend.Session()
+            try:
+                flow_runs = [
+                    flow_run.to_dict()
+                    for flow_run in session.execute(
+                        select(FlowRunModel)
+                        .where(FlowRunModel.started_at < cutoff)
+                        .order_by(FlowRunModel.started_at)
+                        .limit(batch_size)
+                    ).scalars()
+                ]
+                if flow_runs and archive_dir is not None:
+                    _append_segment(flow_segment_path, flow_runs)
+                session.execute(
+                    delete(FlowRunModel).where(
+                        FlowRunModel.run_id.in_(
+                            [flow_run["run_id"] for flow_run in flow_runs]
+                        )
+                    )
+                )
+                session.commit()
+            finally:
+                session.close()
+            if len(flow_runs) < batch_size:
+                break
+            time.sleep(pause)
+
+    if archived:
+        logger.info(f"Archived expired runs to '{segment_path}'.")
+    logger.info(f"Retention complete, deleted {deleted} runs.")
+    return deleted
+
+
+def _append_segment(segment_path: Path, records: List[Dict]):
+    """Append a batch of records to an archive segment as a complete gzip member and sync it to disk."""
+    with open(segment_path, "ab") as f:
+        with gzip.GzipFile(fileobj=f, mode="ab") as member:
+            for record in records:
+                member.write(dumps_bytes(record) + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def enable_incremental_vacuum(backend: SQLiteDataBackend):
+    """Switch an existing database to incremental auto vacuum.
+
+    This rewrites the whole database file once with a full VACUUM, so it should be run while
+    the database is not in use.
+    """
+    logger.info(f"Enabling incremental auto vacuum for '{backend.db_path}' ...")
+    with backend.engine.connect() as conn:
+        conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+
+
+def _incremental_vacuum(backend: SQLiteDataBackend, pages: int):
+    """Release up to `pages` free pages of the database to the file system."""
+    connection = backend.engine.raw_connection()
+    try:
+        # sqlite3 steps a statement without result columns only once, which frees a single
+        # page, executescript runs the pragma to completion. The database file only shrinks
+        # once the write-ahead log is checkpointed, a passive checkpoint does not wait for
+        # the readers and writers of a running app.
+        connection.driver_connection.executescript(
+            f"PRAGMA incremental_vacuum({int(pages)}); PRAGMA wal_checkpoint(PASSIVE);"
+        )
+    finally:
+        connection.close()
+
+
+def _auto_vacuum_mode(backend: SQLiteDataBackend) -> int:
+    with backend.engine.connect() as conn:
+        return conn.execute(text("PRAGMA auto_vacuum")).scalar()
+
+
+class RetentionTask:
+    """A background task that applies a retention policy periodically.
+
+    Attributes:
+        backend (SQLiteDataBackend): The data backend to apply the policy to.
+        policy (RetentionPolicy): The retention policy.
+        interval (float): Seconds between two retention runs.
+        archive_dir (str | None): The directory to write archive segments to.
+    """
+
+    def __init__(
+        self,
+        backend: SQLiteDataBackend,
+        policy: RetentionPolicy,
+        interval: float = 3600.0,
+        archive_dir: str | None = ".promptmage/archive",
+    ):
+        self.backend = backend
+        self.policy = policy
+        self.interval = interval
+        self.archive_dir = archive_dir
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="promptmage-retention", daemon=True
+        )
+
+    def start(self):
+        """Start applying the policy in the background."""
+        logger.info(
+            f"Starting retention task every {self.interval}s with {self.policy}"
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background task after the current run."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                apply_retention(self.backend, self.policy, archive_dir=self.archive_dir)
+            except Exception as e:
+                logger.error(f"Error applying retention policy: {e}")
+            self._stop.wait(self.interval)
@@ -1,9 +1,18 @@
 """This module contains the SQLiteBackend class, which is a subclass of the StorageBackend class. It is used to store the data in a SQLite database."""
 
+import os
+import re
+import copy
+import glob
 import json
-import uuid
+import math
+import time
+import heapq
+import shutil
+import threading
+from datetime import datetime
 from loguru import logger
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple, Iterable, Callable
 from sqlalchemy import (
     create_engine,
     Column,
@@ -12,27 +21,215 @@ from sqlalchemy import (
     Text,
     select,
     delete,
+    insert,
+    update,
     DateTime,
     ForeignKey,
     Boolean,
     and_,
+    case,
+    cast,
     Float,
+    LargeBinary,
+    Index,
+    event,
+    or_,
+    text,
+    table,
+    column,
+    literal_column,
+    inspect,
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 
+from promptmage.ids import uuid7
 from promptmage.prompt import Prompt
 from promptmage.exceptions import PromptNotFoundException
-from promptmage.run_data import RunData
+from promptmage.run_data import RunData, epoch_time
+from promptmage.codec import dumps, loads
 from promptmage.storage.storage_backend import StorageBackend
+from promptmage.storage.compression import (
+    DICTIONARIES,
+    MAGIC,
+    CODEC_NAMES,
+    add_dictionary_loader,
+    check_codec,
+    compress_payload,
+    decompress_payload,
+    payload_header,
+    train_dictionary,
+    dictionary_id,
+)
+from promptmage.storage.blob_store import (
+    BLOB_KEY,
+    BlobStore,
+    externalize,
+    internalize,
+    blob_references,
+)
 
 Base = declarative_base()
 
 
 def generate_uuid():
-    return str(uuid.uuid4())
+    return uuid7()
+
+
+def create_sqlite_engine(db_path: str):
+    """Create the SQLAlchemy engine for a promptmage SQLite database."""
+    engine = create_engine(f"sqlite:///{db_path}")
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # only takes effect for new databases, lets retention give back space in small steps
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # readers, like backups and snapshots, do not block writers and the other way round
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.close()
+
+    return engine
+
+
+def create_missing_indexes(engine):
+    """Create the indexes declared on the models that do not exist in the database yet.
+
+    `create_all` only creates indexes together with new tables, so databases created by
+    older versions of promptmage would never get them.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def create_missing_columns(engine) -> Dict[str, List[str]]:
+    """Add the columns declared on the models that do not exist in the database yet.
+
+    New columns have to be nullable, the rows stored before keep NULL in them.
+
+    Returns:
+        Dict[str, List[str]]: The names of the added columns by table.
+    """
+    inspector = inspect(engine)
+    added = {}
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                    )
+                )
+                added.setdefault(table.name, []).append(column.name)
+    return added
+
+
+def migrate_database(engine):
+    """Bring a database created by an older version of promptmage up to date."""
+    added_columns = create_missing_columns(engine)
+    if "prompt_id" in added_columns.get("data", []):
+        logger.info("Replacing the prompts stored with each run by references ...")
+        migrated = migrate_prompt_references(engine)
+        logger.info(f"Migrated {migrated} runs.")
+    backfill_run_times(engine)
+    create_missing_indexes(engine)
+    track_run_changes(engine)
+
+
+# the next change sequence number, larger than those of all stored and deleted runs
+NEXT_CHANGE_SEQ = (
+    "max(COALESCE((SELECT MAX(change_seq) FROM data), 0), "
+    "COALESCE((SELECT MAX(seq) FROM data_deletions), 0)) + 1"
+)
+
+
+def track_run_changes(engine):
+    """Number the changes of runs and record deleted runs for incremental backups.
+
+    Every inserted or updated run gets the next change sequence number and every deleted run
+    a row in `data_deletions`, whichever code path changes them. Writes to a database are
+    serialized, so a backup that read up to a sequence number never misses a later change.
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS data_change_seq_insert AFTER INSERT ON data "
+                f"BEGIN UPDATE data SET change_seq = {NEXT_CHANGE_SEQ} "
+                "WHERE rowid = NEW.rowid; END"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS data_change_seq_update AFTER UPDATE ON data "
+                "WHEN NEW.change_seq IS OLD.change_seq "
+                f"BEGIN UPDATE data SET change_seq = {NEXT_CHANGE_SEQ} "
+                "WHERE rowid = NEW.rowid; END"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE TRIGGER IF NOT EXISTS data_deletions_insert AFTER DELETE ON data "
+                "BEGIN INSERT INTO data_deletions (seq, step_run_id) "
+                f"VALUES ({NEXT_CHANGE_SEQ}, OLD.step_run_id); END"
+            )
+        )
+
+
+def backfill_run_times(engine) -> int:
+    """Set the start and end timestamps of runs stored by older versions from their run time.
+
+    Run times are naive local times, SQLite converts them to UTC with the `utc` modifier.
+    Runs with a run time that can not be parsed keep NULL timestamps.
+
+    Returns:
+        int: The number of updated runs.
+    """
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                "UPDATE data SET "
+                "started_at = (julianday(run_time, 'utc') - 2440587.5) * 86400.0, "
+                "ended_at = (julianday(run_time, 'utc') - 2440587.5) * 86400.0 "
+                "+ execution_time "
+                "WHERE started_at IS NULL AND julianday(run_time) IS NOT NULL"
+            )
+        )
+    if result.rowcount:
+        logger.info(f"Backfilled the start and end times of {result.rowcount} runs.")
+    return result.rowcount
+
+
+def chunked(items: List, size: int = 500):
+    """Yield successive chunks of a list, keeping IN clauses below SQLite's variable limit."""
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+# The number of referenced prompts a data backend keeps in memory
+PROMPT_CACHE_SIZE = 1000
+
+# Bumped per database file whenever a prompt backend of this process changes prompts in
+# place or deletes them, data backends then forget the prompts they cached
+_prompt_revisions: Dict[str, int] = {}
+
+
+def prompt_revision(db_path: str) -> int:
+    return _prompt_revisions.get(os.path.abspath(db_path), 0)
+
+
+def bump_prompt_revision(db_path: str):
+    key = os.path.abspath(db_path)
+    _prompt_revisions[key] = _prompt_revisions.get(key, 0) + 1
 
 
 def get_next_version(session, name):
@@ -59,6 +256,12 @@ class PromptModel(Base):
     template_vars = Column(Text, nullable=False)
     active = Column(Boolean, nullable=False, default=False)
 
+    __table_args__ = (
+        # head and active lookups are served by ordered-limit scans on these indexes
+        Index("ix_prompts_name_version", "name", "version"),
+        Index("ix_prompts_name_active_version", "name", "active", "version"),
+    )
+
     def to_dict(self) -> Dict:
         return {
             "id": self.id,
@@ -103,8 +306,9 @@ class SQLitePromptBackend(StorageBackend):
 
     def __init__(self, db_path: str | None = None):
         self.db_path = db_path if db_path else ".promptmage/promptmage.db"
-        self.engine = create_engine(f"sqlite:///{self.db_path}")
+        self.engine = create_sqlite_engine(self.db_path)
         Base.metadata.create_all(self.engine)
+        migrate_database(self.engine)
 
         # Define the SQL command to update the existing rows
         # update_command = text("UPDATE prompts SET active = false WHERE active IS NULL")
@@ -159,6 +363,7 @@ class SQLitePromptBackend(StorageBackend):
                 existing_prompt.active = prompt.active
 
             session.commit()
+            bump_prompt_revision(self.db_path)
         except SQLAlchemyError as e:
             session.rollback()
             logger.error(f"Error updating prompt: {e}")
@@ -184,17 +389,17 @@ class SQLitePromptBackend(StorageBackend):
             if active is not None:
                 where_clause.append(PromptModel.active == active)
             combined_where_clause = and_(*where_clause)
-            # run the query to get the prompt
-            rows = (
-                session.execute(select(PromptModel).where(combined_where_clause))
-                .scalars()
-                .all()
-            )
-            if not rows:
+            # fetch only the latest matching version, this is an index seek
+            latest_prompt = session.execute(
+                select(PromptModel)
+                .where(combined_where_clause)
+                .order_by(PromptModel.version.desc())
+                .limit(1)
+            ).scalar_one_or_none()
+            if latest_prompt is None:
                 raise PromptNotFoundException(
                     f"Prompt with name {prompt_name} not found."
                 )
-            latest_prompt = max(rows, key=lambda p: p.version)
             return Prompt(**latest_prompt.to_dict())
         finally:
             session.close()
@@ -222,12 +427,23 @@ class SQLitePromptBackend(StorageBackend):
     def delete_prompt(self, prompt_id: str):
         session = self.Session()
         try:
-            result = session.execute(
-                delete(PromptModel).where(PromptModel.id == prompt_id)
-            )
-            if result.rowcount == 0:
+            prompt = session.execute(
+                select(PromptModel).where(PromptModel.id == prompt_id)
+            ).scalar_one_or_none()
+            if prompt is None:
                 raise PromptNotFoundException(f"Prompt with ID {prompt_id} not found.")
+            # runs only reference their prompt, they get a copy before it is gone
+            materialize_prompt(session, prompt.to_dict())
+            for path in find_partitions(self.db_path).values():
+                engine = create_sqlite_engine(path)
+                try:
+                    with engine.begin() as conn:
+                        materialize_prompt(conn, prompt.to_dict())
+                finally:
+                    engine.dispose()
+            session.delete(prompt)
             session.commit()
+            bump_prompt_revision(self.db_path)
         except SQLAlchemyError as e:
             session.rollback()
             logger.error(f"Error deleting prompt: {e}")
@@ -240,13 +456,35 @@ class RunDataModel(Base):
     step_run_id = Column(String, primary_key=True)
     run_time = Column(String, nullable=False)
     execution_time = Column(Float, nullable=True)
+    # start and end of the step execution as Unix timestamps, for time range queries
+    started_at = Column(Float, nullable=True)
+    ended_at = Column(Float, nullable=True)
     model = Column(String, nullable=True)
     step_name = Column(String, nullable=False)
     run_id = Column(String)
     status = Column(String, nullable=False)
+    # the prompt is stored as JSON only if it is not a row of the prompts table
+    prompt_id = Column(String, nullable=True)
     prompt = Column(Text)
     input_data = Column(Text)
     output_data = Column(Text)
+    # increases with every insert or update of a row, set by the `track_run_changes` triggers
+    change_seq = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_data_step_name_run_time", "step_name", "run_time"),
+        Index("ix_data_change_seq", "change_seq"),
+        Index("ix_data_run_id", "run_id"),
+        # the status and execution time make the time indexes covering for `get_run_timeline`
+        Index("ix_data_started_at", "started_at", "status", "execution_time"),
+        Index(
+            "ix_data_step_name_started_at",
+            "step_name",
+            "started_at",
+            "status",
+            "execution_time",
+        ),
+    )
 
     def to_dict(self) -> Dict:
         return {
@@ -256,14 +494,17 @@ class RunDataModel(Base):
             "run_id": self.run_id,
             "status": self.status,
             "execution_time": self.execution_time,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
             "model": self.model,
-            "prompt": Prompt(**json.loads(self.prompt)) if self.prompt else None,
-            "input_data": json.loads(self.input_data),
-            "output_data": json.loads(self.output_data),
+            "prompt": Prompt(**loads(self.prompt)) if self.prompt else None,
+            "input_data": loads(decompress_payload(self.input_data)),
+            "output_data": loads(decompress_payload(self.output_data)),
         }
 
     @classmethod
-    def from_dict(cls, data: Dict) -> "RunDataModel":
+    def from_dict(cls, data: Dict, prompt_reference: bool = False) -> "RunDataModel":
+        prompt = data["prompt"]
         return cls(
             step_run_id=data["step_run_id"],
             run_time=data["run_time"],
@@ -271,10 +512,13 @@ class RunDataModel(Base):
             run_id=data["run_id"],
             status=data["status"],
             execution_time=data["execution_time"],
+            started_at=data.get("started_at"),
+            ended_at=data.get("ended_at"),
             model=data["model"],
-            prompt=json.dumps(data["prompt"]) if data["prompt"] else None,
-            input_data=json.dumps(data["input_data"]),
-            output_data=json.dumps(data["output_data"]),
+            prompt_id=prompt["id"] if prompt else None,
+            prompt=dumps(prompt) if prompt and not prompt_reference else None,
+            input_data=dumps(data["input_data"]),
+            output_data=dumps(data["output_data"]),
         )
 
     def __repr__(self):
@@ -284,14 +528,125 @@ class RunDataModel(Base):
             f"step_name={self.step_name}, "
             f"run_id={self.run_id}, "
             f"status={self.status}, "
+            f"prompt_id={self.prompt_id}, "
             f"prompt={self.prompt}, "
             f"execution_time={self.execution_time}, "
+            f"started_at={self.started_at}, "
+            f"ended_at={self.ended_at}, "
             f"model={self.model}, "
             f"input_data={self.input_data}, "
             f"output_data={self.output_data})"
         )
 
 
+def is_stored_prompt(session, prompt: Prompt | None) -> bool:
+    """Check whether a prompt is a row of the prompts table, so runs can reference it by ID."""
+    if prompt is None:
+        return False
+    stored = session.execute(
+        select(PromptModel).where(PromptModel.id == prompt.id)
+    ).scalar_one_or_none()
+    # versions are immutable apart from the active flag, which runs do not keep track of
+    return (
+        stored is not None
+        and stored.name == prompt.name
+        and stored.version == prompt.version
+        and stored.system == prompt.system
+        and stored.user == prompt.user
+    )
+
+
+def materialize_prompt(connection, prompt: Dict):
+    """Store a copy of a prompt in the runs that reference it, before the prompt is deleted.
+
+    Args:
+        connection: A session or connection of the database with the runs.
+        prompt (Dict): The prompt as a dictionary.
+    """
+    connection.execute(
+        update(RunDataModel)
+        .where(RunDataModel.prompt_id == prompt["id"], RunDataModel.prompt.is_(None))
+        .values(prompt=dumps(prompt))
+    )
+
+
+def migrate_prompt_references(engine) -> int:
+    """Replace the prompt JSON of runs stored by older versions with references to the prompts table.
+
+    Only prompts that still match their row in the prompts table are replaced.
+
+    Returns:
+        int: The number of migrated runs.
+    """
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                "UPDATE data SET prompt_id = json_extract(prompt, '$.id'), prompt = NULL "
+                "WHERE prompt_id IS NULL AND prompt IS NOT NULL AND EXISTS ("
+                "SELECT 1 FROM prompts WHERE prompts.id = json_extract(data.prompt, '$.id') "
+                "AND prompts.name = json_extract(data.prompt, '$.name') "
+                "AND prompts.version = json_extract(data.prompt, '$.version') "
+                "AND prompts.system = json_extract(data.prompt, '$.system') "
+                "AND prompts.user = json_extract(data.prompt, '$.user'))"
+            )
+        )
+    return result.rowcount
+
+
+class FlowRunModel(Base):
+    """A run of a flow, the step runs it executed reference it by `run_id`.
+
+    The status is `running` until the flow ends, then `success` or `failed`.
+    """
+
+    __tablename__ = "runs"
+    run_id = Column(String, primary_key=True)
+    flow_name = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    started_at = Column(Float, nullable=False)
+    ended_at = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_runs_flow_name_started_at", "flow_name", "started_at"),
+        Index("ix_runs_started_at", "started_at"),
+    )
+
+    def to_dict(self) -> Dict:
+        return {
+            "run_id": self.run_id,
+            "flow_name": self.flow_name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+        }
+
+    def __repr__(self):
+        return (
+            f"FlowRunModel(run_id={self.run_id}, "
+            f"flow_name={self.flow_name}, "
+            f"status={self.status}, "
+            f"started_at={self.started_at}, "
+            f"ended_at={self.ended_at})"
+        )
+
+
+class DataDeletionModel(Base):
+    """A deleted run, recorded with its change sequence number for incremental backups."""
+
+    __tablename__ = "data_deletions"
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    step_run_id = Column(String, nullable=False)
+
+
+class CompressionDictionaryModel(Base):
+    """A trained zstd dictionary for compressing run payloads, by its zstd dictionary ID."""
+
+    __tablename__ = "compression_dictionaries"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created = Column(DateTime(timezone=True), server_default=func.now())
+    data = Column(LargeBinary, nullable=False)
+
+
 class EvaluationDatasetModel(Base):
     __tablename__ = "evaluation_datasets"
     id = Column("id", String, primary_key=True, default=generate_uuid)
@@ -327,7 +682,7 @@ class EvaluationDatasetModel(Base):
 class EvaluationDatapointModel(Base):
     __tablename__ = "evaluation_datapoints"
     id = Column("id", String, primary_key=True, default=generate_uuid)
-    dataset_id = Column(String, ForeignKey("evaluation_datasets.id"))
+    dataset_id = Column(String, ForeignKey("evaluation_datasets.id"), index=True)
     dataset = relationship("EvaluationDatasetModel", back_populates="datapoints")
     run_data_id = Column(String, ForeignKey("data.step_run_id"))
     rating = Column(Integer, nullable=True, default=None)
@@ -353,50 +708,1482 @@ class EvaluationDatapointModel(Base):
         return f"EvaluationDatapointModel(id={self.id}, dataset_id={self.dataset_id}, run_data_id={self.run_data_id}, rating={self.rating})"
 
 
+# Latency histograms use logarithmic bins, the upper bound of a bin is LATENCY_GAMMA times its
+# lower bound, so percentiles estimated from them are off by at most 5%
+LATENCY_GAMMA = 1.1
+LATENCY_MIN = 0.001
+
+# The dimensions rollups can be grouped and filtered by
+ROLLUP_DIMENSIONS = ["step_name", "model", "prompt_version"]
+DEFAULT_PERCENTILES = [50, 90, 95, 99]
+
+
+class RunRollupModel(Base):
+    """Hourly counts and latencies of runs per step, model and prompt version.
+
+    Runs without a model are stored with an empty model and runs without a prompt with prompt
+    version 0, as primary key columns can not be null.
+    """
+
+    __tablename__ = "run_rollups"
+    bucket = Column(String, primary_key=True)
+    step_name = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    prompt_version = Column(Integer, primary_key=True)
+    runs = Column(Integer, nullable=False)
+    errors = Column(Integer, nullable=False)
+    timed_runs = Column(Integer, nullable=False)
+    latency_sum = Column(Float, nullable=False)
+    latency_max = Column(Float, nullable=True)
+
+
+class LatencyHistogramModel(Base):
+    """The number of runs per latency bin, for each row of the run rollups."""
+
+    __tablename__ = "run_latency_histograms"
+    bucket = Column(String, primary_key=True)
+    step_name = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    prompt_version = Column(Integer, primary_key=True)
+    bin = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+
+def time_bound(value) -> float:
+    """Convert the bound of a time range to a Unix timestamp, see `epoch_time`.
+
+    Raises:
+        ValueError: If the value is not a time.
+    """
+    timestamp = epoch_time(value)
+    if timestamp is None:
+        raise ValueError(f"Can not parse the time '{value}'.")
+    return timestamp
+
+
+def rollup_bucket(run_time) -> str:
+    """Get the hourly bucket of a run time."""
+    return f"{str(run_time)[:13]}:00:00"
+
+
+def run_time_bound(value) -> str:
+    """Convert the bound of a time range to a run time, like `2024-08-01 00:00:00` for `2024-08-01`.
+
+    Raises:
+        ValueError: If the value is not a time.
+    """
+    return str(datetime.fromtimestamp(time_bound(value)).replace(microsecond=0))
+
+
+def latency_bin(seconds: float) -> int:
+    return math.ceil(math.log(max(seconds, LATENCY_MIN)) / math.log(LATENCY_GAMMA))
+
+
+def latency_bin_value(latency_bin: int) -> float:
+    """Estimate the latencies of a bin by the value with the same relative error to both bounds."""
+    return 2 * LATENCY_GAMMA**latency_bin / (LATENCY_GAMMA + 1)
+
+
+def update_rollups(session, records: List[Tuple]):
+    """Add runs to the rollups with upserts, in the transaction that stores them.
+
+    Args:
+        session: The session of the transaction.
+        records (List[Tuple]): Tuples of run time, step name, model, prompt version, status and execution time.
+    """
+    rollups = {}
+    histograms = {}
+    for run_time, step_name, model, prompt_version, status, execution_time in records:
+        key = (rollup_bucket(run_time), step_name, model or "", prompt_version or 0)
+        rollup = rollups.setdefault(key, [0, 0, 0, 0.0, None])
+        rollup[0] += 1
+        rollup[1] += status != "success"
+        if execution_time is not None:
+            rollup[2] += 1
+            rollup[3] += execution_time
+            rollup[4] = max(execution_time, rollup[4] or execution_time)
+            bin_key = (*key, latency_bin(execution_time))
+            histograms[bin_key] = histograms.get(bin_key, 0) + 1
+    if not rollups:
+        return
+
+    columns = ["bucket", "step_name", "model", "prompt_version"]
+    statement = sqlite_insert(RunRollupModel).values(
+        [
+            dict(
+                zip(
+                    columns
+                    + ["runs", "errors", "timed_runs", "latency_sum", "latency_max"],
+                    (*key, *values),
+                )
+            )
+            for key, values in rollups.items()
+        ]
+    )
+    excluded = statement.excluded
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=columns,
+            set_={
+                "runs": RunRollupModel.runs + excluded.runs,
+                "errors": RunRollupModel.errors + excluded.errors,
+                "timed_runs": RunRollupModel.timed_runs + excluded.timed_runs,
+                "latency_sum": RunRollupModel.latency_sum + excluded.latency_sum,
+                "latency_max": func.max(
+                    func.coalesce(RunRollupModel.latency_max, excluded.latency_max),
+                    func.coalesce(excluded.latency_max, RunRollupModel.latency_max),
+                ),
+            },
+        )
+    )
+    if histograms:
+        statement = sqlite_insert(LatencyHistogramModel).values(
+            [
+                dict(zip(columns + ["bin", "count"], (*key, count)))
+                for key, count in histograms.items()
+            ]
+        )
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=columns + ["bin"],
+                set_={"count": LatencyHistogramModel.count + statement.excluded.count},
+            )
+        )
+
+
+def rollup_record(run_data: RunData) -> Tuple:
+    return (
+        run_data.run_time,
+        run_data.step_name,
+        run_data.model,
+        run_data.prompt.version if run_data.prompt else None,
+        run_data.status,
+        run_data.execution_time,
+    )
+
+
+def percentile(bins: List[Tuple[int, int]], q: float) -> float | None:
+    """Estimate a percentile from the sorted (bin, count) pairs of a latency histogram."""
+    total = sum(count for _, count in bins)
+    if not total:
+        return None
+    rank = q / 100 * (total - 1)
+    seen = 0
+    for latency_bin, count in bins:
+        seen += count
+        if seen > rank:
+            return latency_bin_value(latency_bin)
+    return latency_bin_value(bins[-1][0])
+
+
+def touch_datasets(session, dataset_ids):
+    """Mark datasets as updated, changes to their datapoints are picked up by incremental backups.
+
+    Args:
+        session: The session of the current transaction.
+        dataset_ids: A list or a select of dataset IDs.
+    """
+    session.execute(
+        update(EvaluationDatasetModel)
+        .where(EvaluationDatasetModel.id.in_(dataset_ids))
+        .values(updated=func.now())
+    )
+
+
+def datasets_of_datapoints(datapoint_ids: List[str]):
+    """Select the IDs of the datasets the given datapoints belong to."""
+    return select(EvaluationDatapointModel.dataset_id).where(
+        EvaluationDatapointModel.id.in_(datapoint_ids)
+    )
+
+
+# The FTS5 full-text index over run data, its rowids are the rowids of the data table. The
+# index is contentless, it keeps no copy of the (uncompressed) payloads of the runs.
+data_fts = table("data_fts", column("rowid"), column("rank"), column("data_fts"))
+SEARCH_INDEX_SQL = "CREATE VIRTUAL TABLE data_fts USING fts5(input_data, output_data, prompt, content='')"
+
+
+def create_search_index(
+    engine, rehydrate: Callable[[List["RunDataModel"]], List[RunData]] | None = None
+) -> bool:
+    """Create the full-text index over run data and fill it with the existing runs.
+
+    Args:
+        engine: The engine of the database with the runs.
+        rehydrate (Callable | None): Turns rows into runs with their referenced prompts.
+
+    Returns:
+        bool: Whether the index is available, False if SQLite was built without FTS5.
+    """
+    with engine.begin() as conn:
+        existing = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE name = 'data_fts'")
+        ).scalar()
+        if existing == SEARCH_INDEX_SQL:
+            return True
+        if existing is not None:
+            # older versions stored a copy of every run in the index
+            logger.info("Rebuilding the search index without a copy of the runs ...")
+            conn.execute(text("DROP TABLE data_fts"))
+        try:
+            conn.execute(text(SEARCH_INDEX_SQL))
+        except OperationalError:
+            logger.warning("SQLite has no FTS5 support, searching runs will be slow.")
+            return False
+        # index the runs stored before the index existed, in rowid order
+        logger.info("Indexing the stored runs for search ...")
+        last_rowid = 0
+        while True:
+            rows = (
+                conn.execute(
+                    select(
+                        literal_column("data.rowid").label("rowid"),
+                        *RunDataModel.__table__.columns,
+                    )
+                    .where(literal_column("data.rowid") > last_rowid)
+                    .order_by(literal_column("data.rowid"))
+                    .limit(1000)
+                )
+                .mappings()
+                .all()
+            )
+            if not rows:
+                break
+            columns = RunDataModel.__table__.columns.keys()
+            models = [
+                RunDataModel(**{name: row[name] for name in columns}) for row in rows
+            ]
+            if rehydrate is not None:
+                runs = rehydrate(models)
+            else:
+                runs = [RunData(**model.to_dict()) for model in models]
+            conn.execute(
+                text(
+                    "INSERT INTO data_fts(rowid, input_data, output_data, prompt) "
+                    "VALUES (:rowid, :input_data, :output_data, :prompt)"
+                ),
+                [
+                    {"rowid": row["rowid"], **search_document(run)}
+                    for row, run in zip(rows, runs)
+                ],
+            )
+            last_rowid = rows[-1]["rowid"]
+    return True
+
+
+def search_document(run_data: RunData) -> Dict[str, str]:
+    """Get the text of a run that is indexed for full-text search."""
+    return {
+        "input_data": search_text(run_data.input_data),
+        "output_data": search_text(run_data.output_data),
+        "prompt": (
+            f"{run_data.prompt.system}\n{run_data.prompt.user}"
+            if run_data.prompt
+            else ""
+        ),
+    }
+
+
+def search_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def index_runs(session, runs: List[RunData]):
+    """Add stored runs to the full-text index, in the transaction that stores them."""
+    session.execute(
+        text(
+            "INSERT INTO data_fts(rowid, input_data, output_data, prompt) "
+            "SELECT rowid, :input_data, :output_data, :prompt FROM data WHERE step_run_id = :step_run_id"
+        ),
+        [{"step_run_id": run.step_run_id, **search_document(run)} for run in runs],
+    )
+
+
+def unindex_runs(
+    session,
+    step_run_ids: List[str],
+    rehydrate: Callable[[List["RunDataModel"]], List[RunData]],
+):
+    """Remove runs from the full-text index, before they are deleted.
+
+    The index keeps no copy of the runs, so the indexed text of the runs is handed to it
+    again to remove it.
+    """
+    rows = session.execute(
+        select(literal_column("data.rowid"), RunDataModel).where(
+            RunDataModel.step_run_id.in_(step_run_ids)
+        )
+    ).all()
+    if not rows:
+        return
+    runs = rehydrate([model for _, model in rows])
+    session.execute(
+        text(
+            "INSERT INTO data_fts(data_fts, rowid, input_data, output_data, prompt) "
+            "VALUES ('delete', :rowid, :input_data, :output_data, :prompt)"
+        ),
+        [
+            {"rowid": rowid, **search_document(run)}
+            for (rowid, _), run in zip(rows, runs)
+        ],
+    )
+
+
+def fts_query(query: str) -> str:
+    """Turn a search string into an FTS5 query matching runs that contain all of its terms."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+# The length of the run time prefix that names a partition, per partitioning period
+PARTITION_PERIODS = {"year": 4, "month": 7, "day": 10}
+PARTITION_KEY = re.compile(r"\d{4}(-\d{2}(-\d{2})?)?")
+
+
+def partition_path(db_path: str, key: str) -> str:
+    """Get the path of the database file of a partition, next to the main database."""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.{key}{ext}"
+
+
+def find_partitions(db_path: str) -> Dict[str, str]:
+    """Find the partition files of a database, by partition key."""
+    root, ext = os.path.splitext(db_path)
+    partitions = {}
+    for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+        key = path[len(root) + 1 : len(path) - len(ext)]
+        if PARTITION_KEY.fullmatch(key):
+            partitions[key] = path
+    return partitions
+
+
+def partition_in_range(key: str, since=None, until=None) -> bool:
+    """Check whether a partition can contain runs at or after `since` and before `until`."""
+    if since is not None and key < str(since)[: len(key)]:
+        return False
+    # the first day of the partition, a key of 2024-08 starts at 2024-08-01
+    start = (key + "-01-01")[:10]
+    return until is None or start < str(until)
+
+
+def payload_encoding(payload: str | bytes | None) -> Tuple[str | None, int]:
+    """Get the codec and dictionary ID a payload column is stored with, (None, 0) for plain text."""
+    if not isinstance(payload, bytes):
+        return None, 0
+    magic, _, codec, dictionary_id = payload_header(payload)
+    if magic != MAGIC:
+        return None, 0
+    return CODEC_NAMES.get(codec), dictionary_id
+
+
 class SQLiteDataBackend(StorageBackend):
     """A class that stores the data in a SQLite database.
 
+    With `partition_by` set, runs are stored in one database file per period next to the main
+    database, e.g. `.promptmage/promptmage.2024-08.db`. Queries with a time range only touch
+    the partitions in that range and old partitions can be dropped as a whole. Datasets and
+    rollups stay in the main database, as do the runs stored before partitioning was enabled.
+
+    With `blob_threshold` set, values of run inputs and outputs that are larger than the
+    threshold are stored once in a content-addressed blob store and rows only reference them.
+
     Attributes:
         db_path (str): The path to the SQLite database. Defaults to ".promptmage/promptmage.db".
+        partition_by (str | None): Partition runs by `year`, `month` or `day`. Defaults to the
+            period of existing partition files, or no partitioning.
+        blob_threshold (int | None): The size in bytes above which payload values are moved to
+            the blob store. Defaults to storing all values inline.
+        blob_dir (str | None): The directory of the blob store. Defaults to `blobs` next to the database.
+        compression (str | None): Compress run inputs and outputs with `zlib` or `zstd`. zstd
+            uses the newest trained dictionary. Defaults to no compression, compressed rows
+            are always readable.
     """
 
-    def __init__(self, db_path: str | None = None):
+    def __init__(
+        self,
+        db_path: str | None = None,
+        partition_by: str | None = None,
+        blob_threshold: int | None = None,
+        blob_dir: str | None = None,
+        compression: str | None = None,
+    ):
+        if compression is not None:
+            check_codec(compression)
         self.db_path = db_path if db_path else ".promptmage/promptmage.db"
-        self.engine = create_engine(f"sqlite:///{self.db_path}")
+        self.compression = compression
+        self.blob_threshold = blob_threshold
+        # blobs of earlier runs stay readable when the threshold is unset
+        self.blobs = BlobStore(
+            blob_dir
+            if blob_dir
+            else os.path.join(os.path.dirname(self.db_path), "blobs")
+        )
+        self.engine = create_sqlite_engine(self.db_path)
+        has_rollups = inspect(self.engine).has_table(RunRollupModel.__tablename__)
         Base.metadata.create_all(self.engine)
+        migrate_database(self.engine)
         self.Session = sessionmaker(bind=self.engine)
+        # referenced prompts by ID, the texts of prompt versions never change, only whether
+        # they are active, so the cache is cleared when prompts are updated or deleted
+        self._prompts: Dict[str, Prompt] = {}
+        self._prompts_revision = prompt_revision(self.db_path)
+        self.search_index = create_search_index(self.engine, self.rehydrate)
+
+        self.partitions: Dict[str, sessionmaker] = {}
+        self._partitions_lock = threading.Lock()
+        existing_partitions = find_partitions(self.db_path)
+        if partition_by is None and existing_partitions:
+            # continue with the period of the newest partition
+            newest = max(existing_partitions)
+            partition_by = next(
+                period
+                for period, length in PARTITION_PERIODS.items()
+                if length == len(newest)
+            )
+        if partition_by is not None and partition_by not in PARTITION_PERIODS:
+            raise ValueError(f"Can not partition runs by '{partition_by}'.")
+        self.partition_by = partition_by
+        for key in sorted(existing_partitions):
+            self._open_partition(key)
+
+        self.dictionary_id = self._load_dictionaries()
+        # dictionaries trained later by `promptmage compress` are loaded when runs use them
+        add_dictionary_loader(self._load_dictionary)
+
+        if not has_rollups:
+            self.rebuild_rollups()
+
+    def _open_partition(self, key: str) -> sessionmaker:
+        engine = create_sqlite_engine(partition_path(self.db_path, key))
+        RunDataModel.__table__.create(engine, checkfirst=True)
+        create_missing_columns(engine)
+        backfill_run_times(engine)
+        for index in RunDataModel.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        if self.search_index:
+            create_search_index(engine, self.rehydrate)
+        self.partitions[key] = sessionmaker(bind=engine)
+        return self.partitions[key]
+
+    def _partition_for(self, run_time) -> sessionmaker:
+        """Get the sessionmaker of the database a run is stored in, creating its partition."""
+        if self.partition_by is None:
+            return self.Session
+        key = str(run_time)[: PARTITION_PERIODS[self.partition_by]]
+        with self._partitions_lock:
+            if key in self.partitions:
+                return self.partitions[key]
+            logger.info(f"Creating run partition '{key}' ...")
+            return self._open_partition(key)
+
+    def _run_sessions(self, since=None, until=None) -> List[sessionmaker]:
+        """Get the sessionmakers of the main database and the partitions in a time range, oldest first."""
+        with self._partitions_lock:
+            partitions = sorted(self.partitions.items())
+        return [self.Session] + [
+            Session
+            for key, Session in partitions
+            if partition_in_range(key, since, until)
+        ]
 
     def store_data(self, run_data: RunData):
-        session = self.Session()
+        prompt_reference = self._is_stored_prompt(run_data.prompt)
+        session = self._partition_for(run_data.run_time)()
         try:
-            session.add(RunDataModel.from_dict(run_data.to_dict()))
+            session.add(self._to_model(run_data, prompt_reference))
+            if self.search_index:
+                session.flush()
+                index_runs(session, [run_data])
+            if self.partition_by is None:
+                update_rollups(session, [rollup_record(run_data)])
             session.commit()
         except SQLAlchemyError as e:
             session.rollback()
             logger.error(f"Error storing run data: {e}")
+            return
         finally:
             session.close()
+        if self.partition_by is not None:
+            # the rollups live in the main database
+            self._update_rollups([rollup_record(run_data)])
 
-    def get_data(self, step_run_id: str) -> RunData:
+    def store_data_batch(self, runs: List[RunData]) -> int:
+        """Store many runs in one transaction per database file.
+
+        Runs with a step run ID that is already stored are skipped, so a batch that is sent
+        again after a lost response is not stored twice. If a run violates a constraint of
+        the database, the other runs are stored and the invalid one is skipped.
+
+        Args:
+            runs (List[RunData]): The runs to store.
+
+        Returns:
+            int: The number of stored runs.
+        """
+        # the last of several runs with the same ID wins, like repeated store_data calls
+        runs = list({run.step_run_id: run for run in runs}.values())
+        prompt_references = {}
         session = self.Session()
         try:
-            run_data = session.execute(
-                select(RunDataModel).where(RunDataModel.step_run_id == step_run_id)
-            ).scalar_one_or_none()
-            if run_data is None:
-                return None
-            return RunData(**run_data.to_dict())
+            for run in runs:
+                if run.prompt is not None and run.prompt.id not in prompt_references:
+                    prompt_references[run.prompt.id] = is_stored_prompt(
+                        session, run.prompt
+                    )
+        finally:
+            session.close()
+
+        by_database: Dict[sessionmaker, List[RunData]] = {}
+        for run in runs:
+            by_database.setdefault(self._partition_for(run.run_time), []).append(run)
+        stored = []
+        for Session, batch in by_database.items():
+            try:
+                stored.extend(self._store_batch(Session, batch, prompt_references))
+            except IntegrityError as e:
+                # keep the valid runs of the batch, like store_data skips invalid runs
+                logger.error(
+                    f"Error storing a batch of run data, storing the runs one by one: {e}"
+                )
+                for run in batch:
+                    try:
+                        stored.extend(
+                            self._store_batch(Session, [run], prompt_references)
+                        )
+                    except IntegrityError as e:
+                        logger.error(f"Error storing run data: {e}")
+            except SQLAlchemyError as e:
+                logger.error(f"Error storing a batch of run data: {e}")
+                raise
+        if self.partition_by is not None:
+            self._update_rollups([rollup_record(run) for run in stored])
+        return len(stored)
+
+    def _store_batch(
+        self,
+        Session: sessionmaker,
+        batch: List[RunData],
+        prompt_references: Dict[str, bool],
+    ) -> List[RunData]:
+        """Store the runs of one database file in one transaction, returns the stored runs."""
+        session = Session()
+        try:
+            existing = set()
+            for chunk in chunked([run.step_run_id for run in batch]):
+                existing.update(
+                    session.execute(
+                        select(RunDataModel.step_run_id).where(
+                            RunDataModel.step_run_id.in_(chunk)
+                        )
+                    ).scalars()
+                )
+            batch = [run for run in batch if run.step_run_id not in existing]
+            session.add_all(
+                self._to_model(
+                    run,
+                    run.prompt is not None and prompt_references[run.prompt.id],
+                )
+                for run in batch
+            )
+            if self.search_index and batch:
+                session.flush()
+                index_runs(session, batch)
+            if self.partition_by is None:
+                update_rollups(session, [rollup_record(run) for run in batch])
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return batch
+
+    def _is_stored_prompt(self, prompt: Prompt | None) -> bool:
+        if prompt is None:
+            return False
+        session = self.Session()
+        try:
+            return is_stored_prompt(session, prompt)
         finally:
             session.close()
 
+    def _get_prompts(self, prompt_ids: Iterable[str]) -> Dict[str, Prompt]:
+        """Get prompts by ID, from the cache or the prompts table.
+
+        The prompts are the cached instances, callers that hand them out have to copy them.
+        """
+        revision = prompt_revision(self.db_path)
+        if revision != self._prompts_revision:
+            self._prompts = {}
+            self._prompts_revision = revision
+        missing = [
+            prompt_id for prompt_id in set(prompt_ids) if prompt_id not in self._prompts
+        ]
+        if missing:
+            session = self.Session()
+            try:
+                for chunk in chunked(missing):
+                    for prompt in session.execute(
+                        select(PromptModel).where(PromptModel.id.in_(chunk))
+                    ).scalars():
+                        self._prompts[prompt.id] = Prompt(**prompt.to_dict())
+            finally:
+                session.close()
+        prompts = {
+            prompt_id: self._prompts[prompt_id]
+            for prompt_id in set(prompt_ids)
+            if prompt_id in self._prompts
+        }
+        # forget the prompts cached first
+        for prompt_id in list(self._prompts)[: len(self._prompts) - PROMPT_CACHE_SIZE]:
+            del self._prompts[prompt_id]
+        return prompts
+
+    def _to_model(self, run_data: RunData, prompt_reference: bool) -> RunDataModel:
+        data = run_data.to_dict()
+        if self.blob_threshold is not None:
+            for key in ["input_data", "output_data"]:
+                data[key] = externalize(data[key], self.blobs, self.blob_threshold)
+        model = RunDataModel.from_dict(data, prompt_reference)
+        model.input_data = self._compress(model.input_data)
+        model.output_data = self._compress(model.output_data)
+        return model
+
+    def _compress(self, payload: str | bytes | None) -> str | bytes | None:
+        """Encode a payload column with the configured compression."""
+        text = decompress_payload(payload)
+        if self.compression is None or text is None:
+            return text
+        return compress_payload(text, self.compression, self.dictionary_id)
+
+    def _load_dictionaries(self) -> int:
+        """Register the stored zstd dictionaries and get the ID of the newest one, 0 for none."""
+        session = self.Session()
+        try:
+            dictionaries = session.execute(
+                select(CompressionDictionaryModel).order_by(
+                    CompressionDictionaryModel.created
+                )
+            ).scalars()
+            newest = 0
+            for dictionary in dictionaries:
+                DICTIONARIES[dictionary.id] = dictionary.data
+                newest = dictionary.id
+        finally:
+            session.close()
+        return newest if self.compression == "zstd" else 0
+
+    def _load_dictionary(self, dictionary_id: int) -> bytes | None:
+        """Get a stored zstd dictionary by ID, None if it is not stored in this database."""
+        session = self.Session()
+        try:
+            dictionary = session.get(CompressionDictionaryModel, dictionary_id)
+            return dictionary.data if dictionary is not None else None
+        finally:
+            session.close()
+
+    def train_compression_dictionary(
+        self, samples: int = 1000, size: int = 110 * 1024
+    ) -> int:
+        """Train a zstd dictionary on the most recent payloads and use it for new runs.
+
+        Dictionaries help most with many small payloads that share their structure.
+
+        Args:
+            samples (int): The number of recent runs to train on.
+            size (int): The maximum size of the dictionary in bytes.
+
+        Returns:
+            int: The ID of the new dictionary.
+        """
+        texts = []
+        for Session in reversed(self._run_sessions()):
+            session = Session()
+            try:
+                rows = session.execute(
+                    select(RunDataModel.input_data, RunDataModel.output_data)
+                    .order_by(literal_column("data.rowid").desc())
+                    .limit(samples - len(texts) // 2)
+                )
+                for input_data, output_data in rows:
+                    texts.append(decompress_payload(input_data))
+                    texts.append(decompress_payload(output_data))
+            finally:
+                session.close()
+            if len(texts) >= 2 * samples:
+                break
+        dictionary = train_dictionary(texts, size)
+        new_id = dictionary_id(dictionary)
+        session = self.Session()
+        try:
+            session.merge(CompressionDictionaryModel(id=new_id, data=dictionary))
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error storing compression dictionary: {e}")
+            raise
+        finally:
+            session.close()
+        DICTIONARIES[new_id] = dictionary
+        if self.compression == "zstd":
+            self.dictionary_id = new_id
+        logger.info(
+            f"Trained compression dictionary {new_id} on {len(texts)} payloads."
+        )
+        return new_id
+
+    def recompress(self, batch_size: int = 500, pause: float = 0.05) -> int:
+        """Rewrite stored payloads with the configured compression, in small batches.
+
+        Rows written uncompressed, with another codec or an older dictionary are rewritten,
+        each batch in its own short transaction so writers are not blocked for long. Without
+        compression configured, compressed rows are written back as plain text.
+
+        Args:
+            batch_size (int): The number of rows to read per transaction.
+            pause (float): Seconds to sleep between batches to let other writers through.
+
+        Returns:
+            int: The number of rewritten rows.
+        """
+        target = (self.compression, self.dictionary_id)
+        rewritten = 0
+        for Session in self._run_sessions():
+            last_rowid = 0
+            while True:
+                session = Session()
+                try:
+                    rows = session.execute(
+                        select(
+                            literal_column("data.rowid"),
+                            RunDataModel.step_run_id,
+                            RunDataModel.input_data,
+                            RunDataModel.output_data,
+                        )
+                        .where(literal_column("data.rowid") > last_rowid)
+                        .order_by(literal_column("data.rowid"))
+                        .limit(batch_size)
+                    ).all()
+                    if not rows:
+                        break
+                    last_rowid = rows[-1][0]
+                    updates = []
+                    for _, step_run_id, input_data, output_data in rows:
+                        if all(
+                            payload_encoding(payload) == target
+                            for payload in [input_data, output_data]
+                        ):
+                            continue
+                        payloads = [
+                            self._compress(input_data),
+                            self._compress(output_data),
+                        ]
+                        # small payloads stay plain text
+                        if payloads == [input_data, output_data]:
+                            continue
+                        updates.append(
+                            {
+                                "step_run_id": step_run_id,
+                                "input_data": payloads[0],
+                                "output_data": payloads[1],
+                            }
+                        )
+                    if updates:
+                        session.execute(update(RunDataModel), updates)
+                        session.commit()
+                        rewritten += len(updates)
+                except SQLAlchemyError as e:
+                    session.rollback()
+                    logger.error(f"Error recompressing run data: {e}")
+                    raise
+                finally:
+                    session.close()
+                if len(rows) < batch_size:
+                    break
+                time.sleep(pause)
+        logger.info(f"Recompressed {rewritten} runs.")
+        return rewritten
+
+    def rehydrate(self, rows: Iterable[RunDataModel]) -> List[RunData]:
+        """Turn stored rows into runs, resolving the prompts and blobs they reference.
+
+        Rows that store their prompt as JSON, from older versions or with prompts that are not
+        in the prompts table, are returned as they are.
+
+        Args:
+            rows (Iterable[RunDataModel]): The rows to turn into runs.
+
+        Returns:
+            List[RunData]: The runs.
+        """
+        rows = list(rows)
+        prompts = self._get_prompts(
+            [row.prompt_id for row in rows if row.prompt is None and row.prompt_id]
+        )
+        runs = []
+        for row in rows:
+            run_data = RunData(**row.to_dict())
+            if run_data.prompt is None and row.prompt_id in prompts:
+                run_data.prompt = copy.deepcopy(prompts[row.prompt_id])
+            if blob_references(run_data.input_data):
+                run_data.input_data = self._internalize(run_data.input_data)
+            if blob_references(run_data.output_data):
+                run_data.output_data = self._internalize(run_data.output_data)
+            runs.append(run_data)
+        return runs
+
+    def _internalize(self, value):
+        try:
+            return internalize(value, self.blobs)
+        except FileNotFoundError as e:
+            logger.warning(f"Blob of a run payload is missing: {e}")
+            return value
+
+    def collect_blobs(self, min_age: float = 3600.0) -> int:
+        """Delete the blobs that no stored run references anymore.
+
+        Args:
+            min_age (float): Only delete blobs older than this many seconds, as runs that are
+                being stored right now may reference blobs that are not committed yet.
+
+        Returns:
+            int: The number of deleted blobs.
+        """
+        referenced = set()
+        pattern = f"%{BLOB_KEY}%"
+        for Session in self._run_sessions():
+            session = Session()
+            try:
+                rows = session.execute(
+                    select(RunDataModel.input_data, RunDataModel.output_data)
+                    .where(
+                        or_(
+                            RunDataModel.input_data.like(pattern),
+                            RunDataModel.output_data.like(pattern),
+                            func.typeof(RunDataModel.input_data) == "blob",
+                            func.typeof(RunDataModel.output_data) == "blob",
+                        )
+                    )
+                    .execution_options(yield_per=1000)
+                )
+                for input_data, output_data in rows:
+                    for payload in [input_data, output_data]:
+                        payload = decompress_payload(payload)
+                        if payload and BLOB_KEY in payload:
+                            referenced |= blob_references(loads(payload))
+            finally:
+                session.close()
+
+        deleted = 0
+        now = time.time()
+        for digest in self.blobs:
+            if digest in referenced:
+                continue
+            if now - self.blobs.modified(digest) < min_age:
+                continue
+            self.blobs.delete(digest)
+            deleted += 1
+        logger.info(f"Deleted {deleted} unreferenced blobs.")
+        return deleted
+
+    def _update_rollups(self, records: List[Tuple]):
+        session = self.Session()
+        try:
+            update_rollups(session, records)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error updating run rollups: {e}")
+        finally:
+            session.close()
+
+    def get_data(self, step_run_id: str) -> RunData:
+        # recent runs are looked up most often
+        for Session in reversed(self._run_sessions()):
+            session = Session()
+            try:
+                run_data = session.execute(
+                    select(RunDataModel).where(RunDataModel.step_run_id == step_run_id)
+                ).scalar_one_or_none()
+                if run_data is not None:
+                    return self.rehydrate([run_data])[0]
+            finally:
+                session.close()
+        return None
+
     def get_all_data(self) -> List[RunData]:
+        run_data_list = []
+        for Session in self._run_sessions():
+            session = Session()
+            try:
+                rows = session.execute(select(RunDataModel)).scalars().all()
+                run_data_list.extend(self.rehydrate(rows))
+            finally:
+                session.close()
+        return run_data_list
+
+    def iter_data(
+        self,
+        step_names: List[str] | None = None,
+        status: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[RunData]:
+        """Iterate over the run data matching the filters without loading all of it into memory.
+
+        Rows are streamed from the database cursor in batches of `batch_size` and ordered by
+        their run time. Only the partitions between `since` and `until` are read.
+
+        Args:
+            step_names (List[str] | None): Only return runs of these steps.
+            status (str | None): Only return runs with this status.
+            since (str | None): Only return runs started at or after this time.
+            until (str | None): Only return runs started before this time.
+            batch_size (int): The number of rows to fetch from the database at once.
+
+        Raises:
+            ValueError: If `since` or `until` is not a time.
+        """
+        query = select(RunDataModel)
+        if step_names is not None:
+            query = query.where(RunDataModel.step_name.in_(step_names))
+        if status is not None:
+            query = query.where(RunDataModel.status == status)
+        if since is not None:
+            query = query.where(RunDataModel.started_at >= time_bound(since))
+        if until is not None:
+            query = query.where(RunDataModel.started_at < time_bound(until))
+        query = query.order_by(RunDataModel.started_at).execution_options(
+            yield_per=batch_size
+        )
+
+        def stream(Session: sessionmaker) -> Iterator[RunData]:
+            session = Session()
+            try:
+                for rows in session.execute(query).scalars().partitions():
+                    yield from self.rehydrate(rows)
+            finally:
+                session.close()
+
+        streams = [stream(Session) for Session in self._run_sessions(since, until)]
+        if len(streams) == 1:
+            yield from streams[0]
+        else:
+            # the main database can hold runs of any time, so the streams are merged
+            yield from heapq.merge(*streams, key=lambda run: run.started_at or 0.0)
+
+    def drop_partitions(
+        self,
+        before: str,
+        keep_datasets: bool = True,
+        archive_dir: str | None = None,
+    ) -> int:
+        """Drop the partitions that only contain runs before the given time.
+
+        A partition is dropped by deleting or moving its database file, without touching its
+        rows one by one. The rollups keep counting the dropped runs.
+
+        Args:
+            before (str): Drop the partitions of the periods that end at or before this time.
+            keep_datasets (bool): Whether to copy the runs that are part of an evaluation dataset to the main database first.
+            archive_dir (str | None): Move the partition files to this directory instead of deleting them.
+
+        Returns:
+            int: The number of runs in the dropped partitions.
+        """
+        with self._partitions_lock:
+            expired = sorted(
+                (key, Session)
+                for key, Session in self.partitions.items()
+                if key < str(before)[: len(key)]
+            )
+
+        dropped = 0
+        for key, Session in expired:
+            session = Session()
+            try:
+                dropped += session.execute(
+                    select(func.count()).select_from(RunDataModel)
+                ).scalar()
+                if keep_datasets:
+                    self._copy_dataset_runs(session)
+            finally:
+                session.close()
+            with self._partitions_lock:
+                del self.partitions[key]
+            Session.kw["bind"].dispose()
+            path = partition_path(self.db_path, key)
+            if archive_dir is not None:
+                os.makedirs(archive_dir, exist_ok=True)
+                shutil.move(path, os.path.join(archive_dir, os.path.basename(path)))
+            else:
+                os.remove(path)
+            logger.info(f"Dropped run partition '{key}'.")
+        return dropped
+
+    def _copy_dataset_runs(self, partition_session):
+        """Copy the runs of a partition that are part of an evaluation dataset to the main database."""
+        session = self.Session()
+        try:
+            run_data_ids = (
+                session.execute(
+                    select(EvaluationDatapointModel.run_data_id)
+                    .where(EvaluationDatapointModel.run_data_id.is_not(None))
+                    .distinct()
+                )
+                .scalars()
+                .all()
+            )
+            for chunk in chunked(run_data_ids):
+                runs = self.rehydrate(
+                    partition_session.execute(
+                        select(RunDataModel).where(RunDataModel.step_run_id.in_(chunk))
+                    ).scalars()
+                )
+                if not runs:
+                    continue
+                session.add_all(
+                    self._to_model(run, is_stored_prompt(session, run.prompt))
+                    for run in runs
+                )
+                if self.search_index:
+                    session.flush()
+                    index_runs(session, runs)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error keeping the dataset runs of a partition: {e}")
+            raise
+        finally:
+            session.close()
+
+    def rebuild_rollups(self, batch_size: int = 10000):
+        """Recompute the run rollups from all stored runs.
+
+        Rollups are updated whenever a run is stored, this is only needed for runs stored
+        before the rollups existed.
+        """
+        session = self.Session()
+        try:
+            session.execute(delete(RunRollupModel))
+            session.execute(delete(LatencyHistogramModel))
+            for Session in self._run_sessions():
+                run_session = session if Session is self.Session else Session()
+                try:
+                    rows = run_session.execute(
+                        select(
+                            RunDataModel.run_time,
+                            RunDataModel.step_name,
+                            RunDataModel.model,
+                            func.json_extract(RunDataModel.prompt, "$.version"),
+                            RunDataModel.prompt_id,
+                            RunDataModel.status,
+                            RunDataModel.execution_time,
+                        ).execution_options(yield_per=batch_size)
+                    )
+                    for batch in rows.partitions():
+                        update_rollups(session, list(self._rollup_records(batch)))
+                finally:
+                    if run_session is not session:
+                        run_session.close()
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error rebuilding run rollups: {e}")
+        finally:
+            session.close()
+
+    def _rollup_records(self, rows: List[Tuple]) -> Iterator[Tuple]:
+        """Turn rows with the prompt version or the referenced prompt ID into rollup records."""
+        prompts = self._get_prompts(
+            [
+                prompt_id
+                for _, _, _, version, prompt_id, _, _ in rows
+                if version is None and prompt_id
+            ]
+        )
+        for run_time, step_name, model, version, prompt_id, status, latency in rows:
+            if version is None and prompt_id in prompts:
+                version = prompts[prompt_id].version
+            yield run_time, step_name, model, version, status, latency
+
+    def get_latency_stats(
+        self,
+        step_name: str | None = None,
+        model: str | None = None,
+        prompt_version: int | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        group_by: List[str] | None = None,
+        percentiles: List[float] | None = None,
+    ) -> List[Dict]:
+        """Get run counts, error counts and latency percentiles from the hourly rollups.
+
+        The time window is extended to whole hours. Latency percentiles are estimated from
+        logarithmic histograms and are accurate to 5%.
+
+        Args:
+            step_name (str | None): Only include runs of this step.
+            model (str | None): Only include runs with this model.
+            prompt_version (int | None): Only include runs with this prompt version.
+            since (str | None): Only include runs at or after this time.
+            until (str | None): Only include runs before this time.
+            group_by (List[str] | None): The dimensions to group by, any of step_name, model and prompt_version. Defaults to all of them.
+            percentiles (List[float] | None): The latency percentiles to estimate. Defaults to 50, 90, 95 and 99.
+
+        Returns:
+            List[Dict]: The statistics per group, with the group dimensions, `runs`, `errors`,
+                `error_rate`, `latency_mean`, `latency_max` and a `p<q>` key per percentile.
+        """
+        if group_by is None:
+            group_by = ROLLUP_DIMENSIONS
+        if percentiles is None:
+            percentiles = DEFAULT_PERCENTILES
+        for dimension in group_by:
+            if dimension not in ROLLUP_DIMENSIONS:
+                raise ValueError(f"Can not group run rollups by '{dimension}'.")
+
+        def query(model_class, *columns):
+            keys = [getattr(model_class, dimension) for dimension in group_by]
+            statement = select(*keys, *columns)
+            if step_name is not None:
+                statement = statement.where(model_class.step_name == step_name)
+            if model is not None:
+                statement = statement.where(model_class.model == model)
+            if prompt_version is not None:
+                statement = statement.where(
+                    model_class.prompt_version == prompt_version
+                )
+            if since is not None:
+                statement = statement.where(model_class.bucket >= since_bucket)
+            if until is not None:
+                statement = statement.where(model_class.bucket < until_time)
+            return statement.group_by(*keys)
+
+        since_bucket = (
+            rollup_bucket(run_time_bound(since)) if since is not None else None
+        )
+        until_time = run_time_bound(until) if until is not None else None
+
+        session = self.Session()
+        try:
+            totals = session.execute(
+                query(
+                    RunRollupModel,
+                    func.sum(RunRollupModel.runs),
+                    func.sum(RunRollupModel.errors),
+                    func.sum(RunRollupModel.timed_runs),
+                    func.sum(RunRollupModel.latency_sum),
+                    func.max(RunRollupModel.latency_max),
+                )
+            ).all()
+            histograms: Dict[Tuple, List[Tuple[int, int]]] = {}
+            for row in session.execute(
+                query(
+                    LatencyHistogramModel,
+                    LatencyHistogramModel.bin,
+                    func.sum(LatencyHistogramModel.count),
+                )
+                .group_by(LatencyHistogramModel.bin)
+                .order_by(LatencyHistogramModel.bin)
+            ):
+                histograms.setdefault(tuple(row[: len(group_by)]), []).append(
+                    tuple(row[len(group_by) :])
+                )
+        finally:
+            session.close()
+
+        stats = []
+        for row in totals:
+            key = tuple(row[: len(group_by)])
+            runs, errors, timed_runs, latency_sum, latency_max = row[len(group_by) :]
+            group = dict(zip(group_by, key))
+            if "model" in group:
+                group["model"] = group["model"] or None
+            if "prompt_version" in group:
+                group["prompt_version"] = group["prompt_version"] or None
+            group.update(
+                {
+                    "runs": runs,
+                    "errors": errors,
+                    "error_rate": errors / runs if runs else 0.0,
+                    "latency_mean": latency_sum / timed_runs if timed_runs else None,
+                    "latency_max": latency_max,
+                }
+            )
+            for q in percentiles:
+                value = percentile(histograms.get(key, []), q)
+                # the estimate of the highest bin can exceed the slowest run
+                group[f"p{q:g}"] = (
+                    min(value, latency_max) if value is not None else None
+                )
+            stats.append(group)
+        return stats
+
+    def get_run_timeline(
+        self,
+        bucket: float = 3600.0,
+        step_name: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> List[Dict]:
+        """Get run counts, error counts and mean latencies per time bucket.
+
+        Unlike the hourly rollups, buckets can have any size. The runs are aggregated with a
+        scan of the start time index, which also holds the status and execution time, and
+        only the partitions between `since` and `until` are read.
+
+        Args:
+            bucket (float): The size of the buckets in seconds. Buckets are aligned to the Unix epoch.
+            step_name (str | None): Only include runs of this step.
+            since (str | None): Only include runs started at or after this time.
+            until (str | None): Only include runs started before this time.
+
+        Returns:
+            List[Dict]: The buckets with runs, ordered by time, with `start` as Unix timestamp,
+                `runs`, `errors` and `latency_mean`.
+
+        Raises:
+            ValueError: If the bucket size is not positive or `since` or `until` is not a time.
+        """
+        if bucket <= 0:
+            raise ValueError("The bucket size has to be positive.")
+        # run times are after the epoch, so truncating rounds down
+        bucket_index = cast(RunDataModel.started_at / bucket, Integer)
+        query = select(
+            bucket_index,
+            func.count(),
+            func.sum(case((RunDataModel.status != "success", 1), else_=0)),
+            func.count(RunDataModel.execution_time),
+            func.sum(RunDataModel.execution_time),
+        ).where(RunDataModel.started_at.is_not(None))
+        if step_name is not None:
+            query = query.where(RunDataModel.step_name == step_name)
+        if since is not None:
+            query = query.where(RunDataModel.started_at >= time_bound(since))
+        if until is not None:
+            query = query.where(RunDataModel.started_at < time_bound(until))
+        query = query.group_by(bucket_index)
+
+        buckets: Dict[int, List] = {}
+        for Session in self._run_sessions(since, until):
+            session = Session()
+            try:
+                for index, runs, errors, timed_runs, latency_sum in session.execute(
+                    query
+                ):
+                    totals = buckets.setdefault(index, [0, 0, 0, 0.0])
+                    totals[0] += runs
+                    totals[1] += errors
+                    totals[2] += timed_runs
+                    totals[3] += latency_sum or 0.0
+            finally:
+                session.close()
+        return [
+            {
+                "start": index * bucket,
+                "runs": runs,
+                "errors": errors,
+                "latency_mean": latency_sum / timed_runs if timed_runs else None,
+            }
+            for index, (runs, errors, timed_runs, latency_sum) in sorted(
+                buckets.items()
+            )
+        ]
+
+    def search_data(
+        self, query: str, limit: int = 50, step_names: List[str] | None = None
+    ) -> List[RunData]:
+        """Search the inputs, outputs and prompts of the stored runs.
+
+        Runs matching all terms of the query are returned, most recently stored first. Without
+        FTS5 support the runs are scanned for the query as a substring instead, which misses
+        compressed payloads.
+
+        Args:
+            query (str): The terms to search for.
+            limit (int): The maximum number of runs to return.
+            step_names (List[str] | None): Only search runs of these steps.
+
+        Returns:
+            List[RunData]: The matching runs.
+        """
+        if not query.strip():
+            return []
+        statement = select(RunDataModel)
+        if self.search_index:
+            statement = (
+                statement.join(
+                    data_fts, data_fts.c.rowid == literal_column("data.rowid")
+                ).where(data_fts.c.data_fts.op("MATCH")(fts_query(query)))
+                # newest first, fts5 walks its rowids in order instead of ranking every match
+                .order_by(data_fts.c.rowid.desc())
+            )
+        else:
+            pattern = f"%{query.strip()}%"
+            session = self.Session()
+            try:
+                # runs reference most prompts by ID, they live in the main database
+                prompt_ids = (
+                    session.execute(
+                        select(PromptModel.id).where(
+                            or_(
+                                PromptModel.system.like(pattern),
+                                PromptModel.user.like(pattern),
+                            )
+                        )
+                    )
+                    .scalars()
+                    .all()
+                )
+            finally:
+                session.close()
+            statement = statement.where(
+                or_(
+                    RunDataModel.input_data.like(pattern),
+                    RunDataModel.output_data.like(pattern),
+                    RunDataModel.prompt.like(pattern),
+                    and_(
+                        RunDataModel.prompt.is_(None),
+                        RunDataModel.prompt_id.in_(prompt_ids),
+                    ),
+                )
+            ).order_by(RunDataModel.run_time.desc())
+        if step_names is not None:
+            statement = statement.where(RunDataModel.step_name.in_(step_names))
+        results = []
+        # newest partitions first, until enough runs are found
+        for Session in reversed(self._run_sessions()):
+            session = Session()
+            try:
+                rows = session.execute(statement.limit(limit - len(results))).scalars()
+                results.extend(self.rehydrate(rows))
+            finally:
+                session.close()
+            if len(results) >= limit:
+                break
+        return results
+
+    def delete_data(self, step_run_ids: List[str]):
+        """Delete run data by step run ID, in a single transaction per database file.
+
+        Args:
+            step_run_ids (List[str]): The step run IDs of the runs to delete.
+        """
+        for Session in self._run_sessions():
+            session = Session()
+            try:
+                for chunk in chunked(step_run_ids):
+                    if self.search_index:
+                        unindex_runs(session, chunk, self.rehydrate)
+                    session.execute(
+                        delete(RunDataModel).where(RunDataModel.step_run_id.in_(chunk))
+                    )
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                logger.error(f"Error deleting run data: {e}")
+                raise
+            finally:
+                session.close()
+
+    def start_run(self, run_id: str, flow_name: str, started_at: float | None = None):
+        """Record the start of a flow run.
+
+        Args:
+            run_id (str): The ID of the run, shared by the step runs it executes.
+            flow_name (str): The name of the flow.
+            started_at (float | None): The start time as Unix timestamp. Defaults to now.
+        """
+        session = self.Session()
+        try:
+            session.add(
+                FlowRunModel(
+                    run_id=run_id,
+                    flow_name=flow_name,
+                    status="running",
+                    started_at=started_at if started_at is not None else time.time(),
+                )
+            )
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error storing flow run: {e}")
+        finally:
+            session.close()
+
+    def end_run(self, run_id: str, status: str, ended_at: float | None = None):
+        """Record the end and the final status of a flow run.
+
+        Args:
+            run_id (str): The ID of the run.
+            status (str): Either `success` or `failed`.
+            ended_at (float | None): The end time as Unix timestamp. Defaults to now.
+        """
         session = self.Session()
         try:
-            run_data_list = session.execute(select(RunDataModel)).scalars().all()
-            return [RunData(**d.to_dict()) for d in run_data_list]
+            session.execute(
+                update(FlowRunModel)
+                .where(FlowRunModel.run_id == run_id)
+                .values(
+                    status=status,
+                    ended_at=ended_at if ended_at is not None else time.time(),
+                )
+            )
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error updating flow run: {e}")
         finally:
             session.close()
 
+    def get_run(self, run_id: str) -> Dict | None:
+        """Get a flow run by ID, None if there is no such run."""
+        session = self.Session()
+        try:
+            run = session.get(FlowRunModel, run_id)
+            return run.to_dict() if run else None
+        finally:
+            session.close()
+
+    def get_runs(self, flow_name: str | None = None, limit: int = 100) -> List[Dict]:
+        """Get the most recent flow runs, optionally of one flow only."""
+        query = select(FlowRunModel)
+        if flow_name is not None:
+            query = query.where(FlowRunModel.flow_name == flow_name)
+        query = query.order_by(FlowRunModel.started_at.desc()).limit(limit)
+        session = self.Session()
+        try:
+            return [run.to_dict() for run in session.execute(query).scalars()]
+        finally:
+            session.close()
+
+    def get_step_runs(self, run_id: str) -> List[RunData]:
+        """Get the step runs of a flow run, ordered by their start time.
+
+        The lookup uses the run ID index of the data table. On a partitioned backend only the
+        partitions between the start and end of the flow run are read.
+        """
+        run = self.get_run(run_id)
+        since = until = None
+        if run is not None:
+            since = str(datetime.fromtimestamp(run["started_at"]))
+            # flows still running or without an end are looked up up to now
+            until = str(datetime.fromtimestamp((run["ended_at"] or time.time()) + 1))
+        runs = []
+        for Session in self._run_sessions(since, until):
+            session = Session()
+            try:
+                rows = session.execute(
+                    select(RunDataModel).where(RunDataModel.run_id == run_id)
+                ).scalars()
+                runs.extend(self.rehydrate(rows))
+            finally:
+                session.close()
+        return sorted(runs, key=lambda run_data: run_data.started_at or 0.0)
+
     def create_dataset(self, name: str, description: str = None):
         session = self.Session()
         try:
@@ -433,6 +2220,7 @@ class SQLiteDataBackend(StorageBackend):
                 run_data_id=datapoint_id, dataset_id=dataset_id
             )
             session.add(datapoint)
+            touch_datasets(session, [dataset_id])
             session.commit()
         except SQLAlchemyError as e:
             session.rollback()
@@ -440,6 +2228,36 @@ class SQLiteDataBackend(StorageBackend):
         finally:
             session.close()
 
+    def add_datapoints_to_dataset(self, datapoint_ids: List[str], dataset_id: str):
+        """Add many runs to a dataset in a single transaction.
+
+        Args:
+            datapoint_ids (List[str]): The step run IDs of the runs to add.
+            dataset_id (str): The ID of the dataset.
+        """
+        if not datapoint_ids:
+            return
+        session = self.Session()
+        try:
+            session.execute(
+                insert(EvaluationDatapointModel),
+                [
+                    {
+                        "id": generate_uuid(),
+                        "run_data_id": datapoint_id,
+                        "dataset_id": dataset_id,
+                    }
+                    for datapoint_id in datapoint_ids
+                ],
+            )
+            touch_datasets(session, [dataset_id])
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error adding datapoints to dataset: {e}")
+        finally:
+            session.close()
+
     def get_datasets(self) -> List[EvaluationDatasetModel]:
         session = self.Session()
         try:
@@ -479,6 +2297,143 @@ class SQLiteDataBackend(StorageBackend):
         finally:
             session.close()
 
+    def get_dataset_stats(self) -> Dict[str, Dict]:
+        """Get aggregate statistics for all datasets in one grouped query.
+
+        Returns:
+            Dict[str, Dict]: A mapping from dataset ID to the number of datapoints, the number of
+                rated datapoints, the sum of the ratings and the last time the dataset was updated.
+        """
+        session = self.Session()
+        try:
+            rows = session.execute(
+                select(
+                    EvaluationDatasetModel.id,
+                    func.count(EvaluationDatapointModel.id),
+                    func.count(EvaluationDatapointModel.rating),
+                    func.coalesce(func.sum(EvaluationDatapointModel.rating), 0),
+                    func.coalesce(
+                        EvaluationDatasetModel.updated, EvaluationDatasetModel.created
+                    ),
+                )
+                .outerjoin(
+                    EvaluationDatapointModel,
+                    EvaluationDatapointModel.dataset_id == EvaluationDatasetModel.id,
+                )
+                .group_by(EvaluationDatasetModel.id)
+            ).all()
+            return {
+                dataset_id: {
+                    "datapoints": datapoints,
+                    "rated": rated,
+                    "rating_sum": rating_sum,
+                    "last_updated": last_updated,
+                }
+                for dataset_id, datapoints, rated, rating_sum, last_updated in rows
+            }
+        finally:
+            session.close()
+
+    def get_datapoints_with_runs(
+        self, dataset_id: str, offset: int = 0, limit: int | None = None
+    ) -> List[Tuple[EvaluationDatapointModel, RunData]]:
+        """Get the datapoints of a dataset joined with their run data in one query.
+
+        Args:
+            dataset_id (str): The ID of the dataset.
+            offset (int): The number of datapoints to skip.
+            limit (int | None): The maximum number of datapoints to return. Defaults to all.
+
+        Returns:
+            List[Tuple[EvaluationDatapointModel, RunData]]: The datapoints and their runs.
+        """
+        if self.partition_by is not None:
+            return self._get_partitioned_datapoints_with_runs(dataset_id, offset, limit)
+        session = self.Session()
+        try:
+            query = (
+                select(EvaluationDatapointModel, RunDataModel)
+                .join(
+                    RunDataModel,
+                    RunDataModel.step_run_id == EvaluationDatapointModel.run_data_id,
+                )
+                .where(EvaluationDatapointModel.dataset_id == dataset_id)
+                .order_by(EvaluationDatapointModel.id)
+                .offset(offset)
+            )
+            if limit is not None:
+                query = query.limit(limit)
+            rows = session.execute(query).all()
+            runs = self.rehydrate(run_data for _, run_data in rows)
+            return [(datapoint, run) for (datapoint, _), run in zip(rows, runs)]
+        finally:
+            session.close()
+
+    def _get_partitioned_datapoints_with_runs(
+        self, dataset_id: str, offset: int = 0, limit: int | None = None
+    ) -> List[Tuple[EvaluationDatapointModel, RunData]]:
+        """Get datapoints with their runs when the runs are spread over partition files.
+
+        Like the join of the unpartitioned database, datapoints whose run is gone are skipped
+        before paging, so every page but the last one is full.
+        """
+        rows: List[Tuple[EvaluationDatapointModel, RunDataModel]] = []
+        skipped = 0
+        last_id = None
+        batch_size = max(limit or 0, 500)
+        while limit is None or len(rows) < limit:
+            session = self.Session()
+            try:
+                query = select(EvaluationDatapointModel).where(
+                    EvaluationDatapointModel.dataset_id == dataset_id
+                )
+                if last_id is not None:
+                    query = query.where(EvaluationDatapointModel.id > last_id)
+                datapoints = (
+                    session.execute(
+                        query.order_by(EvaluationDatapointModel.id).limit(batch_size)
+                    )
+                    .scalars()
+                    .all()
+                )
+            finally:
+                session.close()
+            if not datapoints:
+                break
+            last_id = datapoints[-1].id
+
+            models = self._get_run_models(
+                list({datapoint.run_data_id for datapoint in datapoints})
+            )
+            for datapoint in datapoints:
+                model = models.get(datapoint.run_data_id)
+                if model is None:
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                rows.append((datapoint, model))
+                if limit is not None and len(rows) == limit:
+                    break
+        # only the runs of the page are resolved
+        runs = self.rehydrate(model for _, model in rows)
+        return [(datapoint, run) for (datapoint, _), run in zip(rows, runs)]
+
+    def _get_run_models(self, step_run_ids: List[str]) -> Dict[str, RunDataModel]:
+        """Get the stored rows of runs from all database files, by step run ID."""
+        models: Dict[str, RunDataModel] = {}
+        for Session in self._run_sessions():
+            session = Session()
+            try:
+                for chunk in chunked(step_run_ids):
+                    for model in session.execute(
+                        select(RunDataModel).where(RunDataModel.step_run_id.in_(chunk))
+                    ).scalars():
+                        models[model.step_run_id] = model
+            finally:
+                session.close()
+        return models
+
     def get_datapoint(self, datapoint_id: str) -> EvaluationDatapointModel:
         session = self.Session()
         try:
@@ -504,6 +2459,7 @@ class SQLiteDataBackend(StorageBackend):
             if datapoint is None:
                 raise ValueError(f"Datapoint with ID {datapoint_id} not found.")
             datapoint.rating = rating
+            touch_datasets(session, [datapoint.dataset_id])
             session.commit()
         except SQLAlchemyError as e:
             session.rollback()
@@ -511,9 +2467,58 @@ class SQLiteDataBackend(StorageBackend):
         finally:
             session.close()
 
+    def rate_datapoints(self, ratings: Dict[str, int]):
+        """Rate many datapoints in a single transaction.
+
+        Args:
+            ratings (Dict[str, int]): A mapping from datapoint ID to rating.
+        """
+        if not ratings:
+            return
+        session = self.Session()
+        try:
+            session.execute(
+                update(EvaluationDatapointModel),
+                [
+                    {"id": datapoint_id, "rating": rating}
+                    for datapoint_id, rating in ratings.items()
+                ],
+            )
+            for chunk in chunked(list(ratings)):
+                touch_datasets(session, datasets_of_datapoints(chunk))
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error rating datapoints: {e}")
+        finally:
+            session.close()
+
+    def remove_datapoints(self, datapoint_ids: List[str]):
+        """Remove many datapoints from their datasets in a single transaction.
+
+        Args:
+            datapoint_ids (List[str]): The IDs of the datapoints to remove.
+        """
+        session = self.Session()
+        try:
+            for chunk in chunked(datapoint_ids):
+                touch_datasets(session, datasets_of_datapoints(chunk))
+                session.execute(
+                    delete(EvaluationDatapointModel).where(
+                        EvaluationDatapointModel.id.in_(chunk)
+                    )
+                )
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error removing datapoints: {e}")
+        finally:
+            session.close()
+
     def remove_datapoint_from_dataset(self, datapoint_id: str, dataset_id: str):
         session = self.Session()
         try:
+            touch_datasets(session, [dataset_id])
             result = session.execute(
                 delete(EvaluationDatapointModel).where(
                     EvaluationDatapointModel.id == datapoint_id
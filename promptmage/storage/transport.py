@@ -0,0 +1,201 @@
+"""This module contains the HTTP transport shared by the remote backends.
+
+Requests go through a keep-alive session with a connection pool, so only the first request to
+a server pays for the TCP and TLS handshake. Requests that never reached the server are
+retried, and idempotent requests are retried on 429, 502, 503 and 504 responses as well, with
+exponential backoff between the attempts.
+"""
+
+import asyncio
+import weakref
+import threading
+from typing import Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+# connect and read timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 30.0)
+
+_transports: Dict[str, "Transport"] = {}
+_transports_lock = threading.Lock()
+# the async transports of each running event loop, by the transport they copy the settings of
+_async_transports = weakref.WeakKeyDictionary()
+
+
+class Transport:
+    """A class that sends requests to a remote backend server over a pooled session.
+
+    The session is safe to share between threads, `get_transport` gives all backends of a
+    server the same transport.
+
+    Attributes:
+        url (str): The URL of the remote server.
+        timeout (Tuple[float, float]): The connect and read timeouts in seconds.
+        retries (int): The number of retries after the first attempt.
+        backoff_factor (float): The backoff between retries is `backoff_factor * 2 ** (retry - 1)` seconds.
+        pool_size (int): The number of connections kept alive.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_size: int = 10,
+    ):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=IDEMPOTENT_METHODS,
+                # return the last response, callers raise for its status
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to a path of the server, with the default timeout unless one is given."""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, f"{self.url}{path}", **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __repr__(self):
+        return (
+            f"Transport(url={self.url}, timeout={self.timeout}, "
+            f"retries={self.retries}, pool_size={self.pool_size})"
+        )
+
+
+class AsyncTransport:
+    """The asynchronous variant of `Transport` for async steps, based on httpx.
+
+    The connection pool belongs to the event loop of the first request, `get_async_transport`
+    creates one transport per event loop.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_size: int = 10,
+    ):
+        if httpx is None:
+            raise ImportError(
+                "The async transport needs httpx, install it with `pip install promptmage[async]`."
+            )
+        self.url = url.rstrip("/")
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        connect_timeout, read_timeout = timeout
+        self.client = httpx.AsyncClient(
+            base_url=self.url,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+    async def request(self, method: str, path: str, **kwargs) -> "httpx.Response":
+        """Send a request to a path of the server, retrying like `Transport`."""
+        for retry in range(self.retries + 1):
+            last_attempt = retry == self.retries
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                # only requests that never reached the server are safe to repeat
+                never_sent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if last_attempt or not (never_sent or method in IDEMPOTENT_METHODS):
+                    raise
+            else:
+                if (
+                    last_attempt
+                    or response.status_code not in RETRY_STATUSES
+                    or method not in IDEMPOTENT_METHODS
+                ):
+                    return response
+            await asyncio.sleep(self.backoff_factor * 2**retry)
+
+    async def get(self, path: str, **kwargs) -> "httpx.Response":
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> "httpx.Response":
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> "httpx.Response":
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> "httpx.Response":
+        return await self.request("DELETE", path, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def __repr__(self):
+        return f"AsyncTransport(url={self.url}, retries={self.retries})"
+
+
+def get_transport(url: str) -> Transport:
+    """Get the shared transport of a server, creating it with the default settings."""
+    url = url.rstrip("/")
+    with _transports_lock:
+        if url not in _transports:
+            _transports[url] = Transport(url)
+        return _transports[url]
+
+
+def get_async_transport(transport: Transport) -> AsyncTransport:
+    """Get the async transport of the running event loop with the settings of a transport.
+
+    The connection pool of an async transport belongs to one event loop, so every event loop
+    gets its own, e.g. for each `asyncio.run` call.
+    """
+    loop = asyncio.get_running_loop()
+    with _transports_lock:
+        transports = _async_transports.setdefault(loop, weakref.WeakKeyDictionary())
+        if transport not in transports:
+            transports[transport] = AsyncTransport(
+                transport.url,
+                timeout=transport.timeout,
+                retries=transport.retries,
+                backoff_factor=transport.backoff_factor,
+                pool_size=transport.pool_size,
+            )
+        return transports[transport]
@@ -1,7 +1,18 @@
+import os
 import sqlite3
-import json
+import gzip
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, IO, Iterator, List
 from loguru import logger
 
+from promptmage.codec import dumps, loads
+
+BACKUP_FORMAT = "promptmage-backup"
+BACKUP_VERSION = 1
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
 
 def backup_db_to_json(db_path: str, json_path: str):
     """Backup a SQLite database to a JSON file.
@@ -16,8 +27,7 @@ def backup_db_to_json(db_path: str, json_path: str):
     cursor = conn.cursor()
 
     # Get a list of tables in the database
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+    tables = [(table["name"],) for table in get_tables(conn)]
 
     # Dictionary to hold the database structure
     db_dict = {}
@@ -38,7 +48,7 @@ def backup_db_to_json(db_path: str, json_path: str):
         # Add table data to the dictionary
         db_dict[table_name] = {
             "columns": columns,  # Store both column name and type
-            "data": rows,
+            "data": [[encode_value(value) for value in row] for row in rows],
         }
 
     # Close the connection
@@ -46,7 +56,7 @@ def backup_db_to_json(db_path: str, json_path: str):
 
     # Write the database dictionary to a JSON file
     with open(json_path, "w") as json_file:
-        json.dump(db_dict, json_file, indent=4)
+        json_file.write(dumps(db_dict))
     logger.info("Backup complete.")
 
 
@@ -60,7 +70,7 @@ def restore_db_from_json(db_path: str, json_path: str):
     logger.info(f"Restoring database from '{json_path}' to '{db_path}' ...")
     # Read the JSON file
     with open(json_path, "r") as json_file:
-        db_dict = json.load(json_file)
+        db_dict = loads(json_file.read())
 
     # Connect to the SQLite database
     conn = sqlite3.connect(db_path)
@@ -81,11 +91,581 @@ def restore_db_from_json(db_path: str, json_path: str):
         cursor.execute(f"CREATE TABLE {table_name} ({column_definitions})")
 
         # Insert rows
-        for row in table_data["data"]:
-            placeholders = ", ".join(["?" for _ in columns])
-            cursor.execute(f"INSERT INTO {table_name} VALUES ({placeholders})", row)
+        placeholders = ", ".join(["?" for _ in columns])
+        cursor.executemany(
+            f"INSERT INTO {table_name} VALUES ({placeholders})",
+            ([decode_value(value) for value in row] for row in table_data["data"]),
+        )
+
+    drop_virtual_tables(cursor)
 
     # Commit changes and close the connection
     conn.commit()
     conn.close()
     logger.info("Restore complete.")
+
+
+def backup_db_to_jsonl(
+    db_path: str,
+    backup_path: str,
+    compress: bool | None = None,
+    chunk_size: int = 1000,
+    since: Dict | None = None,
+) -> Dict:
+    """Backup a SQLite database to a line-delimited JSON file without loading it into memory.
+
+    Every line of the backup is a JSON object: a header, followed by one `table` record with the
+    schema of each table and `rows` records holding chunks of its rows.
+
+    If the watermark of a previous backup is passed as `since`, an incremental backup is written
+    which only contains the runs, prompt versions and datasets created or changed since then,
+    and the IDs of the runs deleted since then.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        backup_path (str): Path to the file to save the backup to.
+        compress (bool | None): Whether to gzip the backup. Defaults to compressing if the path ends with `.gz`.
+        chunk_size (int): The number of rows per `rows` record and per database fetch.
+        since (Dict | None): The watermark of the previous backup to write an incremental backup.
+
+    Returns:
+        Dict: The watermark of this backup, to be passed as `since` to the next incremental backup.
+    """
+    kind = "incremental" if since is not None else "full"
+    logger.info(f"Backing up database ({kind}) from '{db_path}' to '{backup_path}' ...")
+    if compress is None:
+        compress = backup_path.endswith(".gz")
+    conn = sqlite3.connect(db_path)
+    try:
+        # read everything in one transaction, so the watermark matches the exported rows
+        conn.execute("BEGIN")
+        watermark = get_watermark(conn)
+        header = {
+            "type": "header",
+            "format": BACKUP_FORMAT,
+            "version": BACKUP_VERSION,
+            "created": str(datetime.now()),
+            "kind": kind,
+            "base": since,
+            "watermark": watermark,
+        }
+        if since is not None:
+            header.update(get_incremental_state(conn, since))
+        with open_backup(backup_path, "w", compress) as f:
+            write_record(f, header)
+            for table in get_tables(conn):
+                write_record(f, {"type": "table", **table})
+                if since is None:
+                    chunks = iter_rows(
+                        conn, f"SELECT * FROM {table['name']}", chunk_size
+                    )
+                else:
+                    chunks = iter_incremental_rows(
+                        conn, table, since, watermark, chunk_size
+                    )
+                for rows in chunks:
+                    write_record(
+                        f, {"type": "rows", "table": table["name"], "rows": rows}
+                    )
+            if since is not None:
+                for ids in iter_deleted_runs(conn, since, watermark, chunk_size):
+                    write_record(f, {"type": "deleted", "table": "data", "ids": ids})
+    finally:
+        conn.close()
+    logger.info("Backup complete.")
+    return watermark
+
+
+def restore_db_from_jsonl(db_path: str, backup_path: str, batch_size: int = 10000):
+    """Restore a SQLite database from a line-delimited JSON backup.
+
+    Rows are inserted with `executemany` inside one transaction and the indexes of a table are
+    only created after all of its rows are loaded. Incremental backups are replayed on top of
+    the existing database.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        backup_path (str): Path to the backup file, optionally gzip compressed.
+        batch_size (int): The number of rows to collect before inserting them.
+
+    Returns:
+        Dict: The header of the restored backup.
+    """
+    logger.info(f"Restoring database from '{backup_path}' to '{db_path}' ...")
+    # manage the transaction explicitly, so the schema changes are rolled back on errors too
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA synchronous = OFF")
+    try:
+        with open_backup(backup_path, "r") as f:
+            records = (loads(line) for line in f if line.strip())
+            header = next(records, None)
+            if not header or header.get("format") != BACKUP_FORMAT:
+                raise ValueError(f"'{backup_path}' is not a promptmage backup.")
+            conn.execute("BEGIN")
+            if header.get("kind") == "incremental":
+                replay_incremental(conn, header, records, batch_size)
+            else:
+                load_records(conn, records, batch_size)
+            drop_virtual_tables(conn)
+            conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info("Restore complete.")
+    return header
+
+
+def restore_db_from_chain(db_path: str, backup_paths: List[str]):
+    """Restore a full backup followed by a chain of incremental backups.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        backup_paths (List[str]): The full backup followed by the incremental backups in order.
+    """
+    watermark = None
+    for i, backup_path in enumerate(backup_paths):
+        header = read_header(backup_path)
+        if header is None:
+            raise ValueError(f"'{backup_path}' is not a promptmage backup.")
+        if i == 0 and header.get("kind") == "incremental":
+            raise ValueError("The first backup of a chain has to be a full backup.")
+        if i > 0:
+            if header.get("kind") != "incremental":
+                raise ValueError(f"'{backup_path}' is not an incremental backup.")
+            if header.get("base") != watermark:
+                raise ValueError(
+                    f"'{backup_path}' does not continue the previous backup of the chain."
+                )
+        restore_db_from_jsonl(db_path, backup_path)
+        watermark = header.get("watermark")
+
+
+def snapshot_db(db_path: str, snapshot_path: str):
+    """Copy a SQLite database to a consistent snapshot with `VACUUM INTO`.
+
+    The copy is made in a single read transaction, so the snapshot reflects a single point in
+    time and is guaranteed to finish, however busy the database is. promptmage databases use
+    write-ahead logging, so a running application keeps writing meanwhile. The snapshot is
+    compacted, written next to its destination first and moved into place at the end.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        snapshot_path (str): Path to the database file to write the snapshot to.
+    """
+    logger.info(f"Taking a snapshot of '{db_path}' to '{snapshot_path}' ...")
+    tmp_path = f"{snapshot_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    source = sqlite3.connect(db_path)
+    try:
+        source.execute("VACUUM INTO ?", (tmp_path,))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    os.replace(tmp_path, snapshot_path)
+    logger.info("Snapshot complete.")
+
+
+def restore_db_from_snapshot(db_path: str, snapshot_path: str):
+    """Restore a SQLite database from a snapshot taken with `snapshot_db`.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        snapshot_path (str): Path to the snapshot database file.
+    """
+    logger.info(
+        f"Restoring database from snapshot '{snapshot_path}' to '{db_path}' ..."
+    )
+    source = sqlite3.connect(snapshot_path)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    logger.info("Restore complete.")
+
+
+def restore_db(db_path: str, backup_path: str):
+    """Restore a SQLite database from a snapshot or a backup in the JSON or line-delimited format."""
+    if is_sqlite_db(backup_path):
+        restore_db_from_snapshot(db_path, backup_path)
+    elif is_jsonl_backup(backup_path):
+        restore_db_from_jsonl(db_path, backup_path)
+    else:
+        restore_db_from_json(db_path, backup_path)
+
+
+def is_sqlite_db(path: str) -> bool:
+    """Check whether a file is a SQLite database."""
+    with open(path, "rb") as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def is_jsonl_backup(backup_path: str) -> bool:
+    """Check whether a backup file is in the line-delimited format."""
+    return read_header(backup_path) is not None
+
+
+def read_header(backup_path: str) -> Dict | None:
+    """Read the header of a line-delimited backup, returns None for other files."""
+    with open_backup(backup_path, "r") as f:
+        first_line = f.readline()
+    try:
+        header = loads(first_line)
+    except ValueError:
+        return None
+    if isinstance(header, dict) and header.get("format") == BACKUP_FORMAT:
+        return header
+    return None
+
+
+def load_records(conn: sqlite3.Connection, records: Iterator[Dict], batch_size: int):
+    """Load `table` and `rows` records into the database, creating indexes after the rows."""
+    pending_indexes: List[str] = []
+    insert_sql = None
+    batch = []
+    for record in records:
+        if record["type"] == "table":
+            if batch:
+                conn.executemany(insert_sql, batch)
+                batch = []
+            create_indexes(conn, pending_indexes)
+            conn.execute(f"DROP TABLE IF EXISTS {record['name']}")
+            conn.execute(record["sql"])
+            pending_indexes = record["indexes"]
+            placeholders = ", ".join(["?" for _ in record["columns"]])
+            insert_sql = f"INSERT INTO {record['name']} VALUES ({placeholders})"
+        elif record["type"] == "rows":
+            batch.extend(
+                [decode_value(value) for value in row] for row in record["rows"]
+            )
+            if len(batch) >= batch_size:
+                conn.executemany(insert_sql, batch)
+                batch = []
+    if batch:
+        conn.executemany(insert_sql, batch)
+    create_indexes(conn, pending_indexes)
+
+
+def drop_virtual_tables(conn: sqlite3.Connection):
+    """Drop virtual tables, like the full-text index, which are out of date after a restore.
+
+    They are not part of backups, the backends rebuild them from the restored tables.
+    """
+    virtual_tables = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"
+    ).fetchall()
+    for (name,) in virtual_tables:
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+def create_indexes(conn: sqlite3.Connection, indexes: List[str]):
+    for index_sql in indexes:
+        conn.execute(index_sql)
+
+
+# Tables that are exported incrementally, all other tables are small and exported in full
+INCREMENTAL_TABLES = ["data", "prompts", "evaluation_datasets", "evaluation_datapoints"]
+
+# Incrementals based on a watermark without a change sequence number, written by older
+# versions, select runs by their run_time and overlap by this margin
+RUN_TIME_OVERLAP = timedelta(minutes=5)
+
+# Tables with local bookkeeping that are not part of backups
+EXCLUDED_TABLES = ["data_deletions"]
+
+
+def get_watermark(conn: sqlite3.Connection) -> Dict:
+    """Get the watermark of the current database state.
+
+    The watermark holds the latest run time and change sequence number of the runs, the latest
+    version of every prompt and the latest dataset update time.
+    """
+    watermark = {"data": None, "prompts": {}, "evaluation_datasets": None}
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    if "data" in tables:
+        watermark["data"] = conn.execute("SELECT MAX(run_time) FROM data").fetchone()[0]
+        if "data_deletions" in tables:
+            watermark["data_seq"] = conn.execute(
+                "SELECT max(COALESCE((SELECT MAX(change_seq) FROM data), 0), "
+                "COALESCE((SELECT MAX(seq) FROM data_deletions), 0))"
+            ).fetchone()[0]
+    if "prompts" in tables:
+        watermark["prompts"] = dict(
+            conn.execute("SELECT name, MAX(version) FROM prompts GROUP BY name")
+        )
+    if "evaluation_datasets" in tables:
+        watermark["evaluation_datasets"] = conn.execute(
+            "SELECT MAX(COALESCE(updated, created)) FROM evaluation_datasets"
+        ).fetchone()[0]
+    return watermark
+
+
+def get_incremental_state(conn: sqlite3.Connection, since: Dict) -> Dict:
+    """Get the state an incremental backup needs to replay deletions and prompt activations."""
+    return {
+        "prompt_ids": [
+            id for (id,) in conn.execute("SELECT id FROM prompts").fetchall()
+        ],
+        "active_prompt_ids": [
+            id for (id,) in conn.execute("SELECT id FROM prompts WHERE active")
+        ],
+        "dataset_ids": [
+            id for (id,) in conn.execute("SELECT id FROM evaluation_datasets")
+        ],
+        "changed_dataset_ids": [
+            id
+            for (id,) in conn.execute(
+                "SELECT id FROM evaluation_datasets WHERE COALESCE(updated, created) >= ?",
+                (since.get("evaluation_datasets") or "",),
+            )
+        ],
+    }
+
+
+def iter_incremental_rows(
+    conn: sqlite3.Connection,
+    table: Dict,
+    since: Dict,
+    watermark: Dict,
+    chunk_size: int,
+) -> Iterator[List]:
+    """Iterate over the rows of a table that changed between two watermarks."""
+    name = table["name"]
+    if name == "data" and since.get("data_seq") is not None:
+        yield from iter_rows(
+            conn,
+            "SELECT * FROM data WHERE change_seq > ? AND change_seq <= ?",
+            chunk_size,
+            (since["data_seq"], watermark["data_seq"]),
+        )
+    elif name == "data":
+        lower = since.get("data")
+        if lower is not None:
+            lower = str(datetime.fromisoformat(lower) - RUN_TIME_OVERLAP)
+        yield from iter_rows(
+            conn,
+            "SELECT * FROM data WHERE run_time >= ? AND run_time <= ?",
+            chunk_size,
+            (lower or "", watermark["data"] or ""),
+        )
+    elif name == "prompts":
+        columns = [column for column, _ in table["columns"]]
+        name_idx, version_idx = columns.index("name"), columns.index("version")
+        base_versions = since.get("prompts", {})
+        for rows in iter_rows(conn, "SELECT * FROM prompts", chunk_size):
+            rows = [
+                row
+                for row in rows
+                if row[version_idx] > base_versions.get(row[name_idx], 0)
+            ]
+            if rows:
+                yield rows
+    elif name == "evaluation_datasets":
+        yield from iter_rows(
+            conn,
+            "SELECT * FROM evaluation_datasets WHERE COALESCE(updated, created) >= ?",
+            chunk_size,
+            (since.get("evaluation_datasets") or "",),
+        )
+    elif name == "evaluation_datapoints":
+        yield from iter_rows(
+            conn,
+            "SELECT * FROM evaluation_datapoints WHERE dataset_id IN "
+            "(SELECT id FROM evaluation_datasets WHERE COALESCE(updated, created) >= ?)",
+            chunk_size,
+            (since.get("evaluation_datasets") or "",),
+        )
+    else:
+        yield from iter_rows(conn, f"SELECT * FROM {name}", chunk_size)
+
+
+def iter_deleted_runs(
+    conn: sqlite3.Connection, since: Dict, watermark: Dict, chunk_size: int
+) -> Iterator[List[str]]:
+    """Iterate over the IDs of the runs deleted between two watermarks, in chunks."""
+    if since.get("data_seq") is None or watermark.get("data_seq") is None:
+        return
+    cursor = conn.execute(
+        "SELECT DISTINCT step_run_id FROM data_deletions WHERE seq > ? AND seq <= ? "
+        "AND step_run_id NOT IN (SELECT step_run_id FROM data)",
+        (since["data_seq"], watermark["data_seq"]),
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [step_run_id for (step_run_id,) in rows]
+
+
+def replay_incremental(
+    conn: sqlite3.Connection, header: Dict, records: Iterator[Dict], batch_size: int
+):
+    """Apply the records of an incremental backup on top of the existing database."""
+    insert_sql = None
+    batch = []
+    for record in records:
+        if record["type"] == "table":
+            if batch:
+                conn.executemany(insert_sql, batch)
+                batch = []
+            name = record["name"]
+            conn.execute(
+                record["sql"].replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1)
+            )
+            for index_sql in record["indexes"]:
+                conn.execute(index_sql.replace("INDEX", "INDEX IF NOT EXISTS", 1))
+            if name == "evaluation_datapoints":
+                # the changed datasets are exported with all of their datapoints
+                conn.execute(
+                    "DELETE FROM evaluation_datapoints WHERE dataset_id IN (SELECT value FROM json_each(?))",
+                    (dumps(header["changed_dataset_ids"]),),
+                )
+            elif name not in INCREMENTAL_TABLES:
+                conn.execute(f"DELETE FROM {name}")
+            columns = ", ".join(column for column, _ in record["columns"])
+            placeholders = ", ".join(["?" for _ in record["columns"]])
+            insert_sql = (
+                f"INSERT OR REPLACE INTO {name} ({columns}) VALUES ({placeholders})"
+            )
+        elif record["type"] == "rows":
+            batch.extend(
+                [decode_value(value) for value in row] for row in record["rows"]
+            )
+            if len(batch) >= batch_size:
+                conn.executemany(insert_sql, batch)
+                batch = []
+        elif record["type"] == "deleted":
+            if batch:
+                conn.executemany(insert_sql, batch)
+                batch = []
+            conn.execute(
+                f"DELETE FROM {record['table']} WHERE step_run_id IN (SELECT value FROM json_each(?))",
+                (dumps(record["ids"]),),
+            )
+    if batch:
+        conn.executemany(insert_sql, batch)
+
+    # replay deletions and prompt activations
+    prompt_ids = dumps(header["prompt_ids"])
+    # deleting a prompt updates the runs that reference it, but the incremental backup only
+    # holds the runs by time, so the runs get their copy of the prompt like on deletion
+    deleted_prompts = conn.execute(
+        "SELECT id, name, version, active, system, user, template_vars FROM prompts "
+        "WHERE id NOT IN (SELECT value FROM json_each(?))",
+        (prompt_ids,),
+    ).fetchall()
+    for id, name, version, active, system, user, template_vars in deleted_prompts:
+        prompt = {
+            "id": id,
+            "name": name,
+            "version": version,
+            "active": bool(active),
+            "system": system,
+            "user": user,
+            "template_vars": template_vars.split(","),
+        }
+        conn.execute(
+            "UPDATE data SET prompt = ? WHERE prompt_id = ? AND prompt IS NULL",
+            (dumps(prompt), id),
+        )
+    conn.execute(
+        "DELETE FROM prompts WHERE id NOT IN (SELECT value FROM json_each(?))",
+        (prompt_ids,),
+    )
+    conn.execute(
+        "UPDATE prompts SET active = id IN (SELECT value FROM json_each(?))",
+        (dumps(header["active_prompt_ids"]),),
+    )
+    dataset_ids = dumps(header["dataset_ids"])
+    conn.execute(
+        "DELETE FROM evaluation_datapoints WHERE dataset_id NOT IN (SELECT value FROM json_each(?))",
+        (dataset_ids,),
+    )
+    conn.execute(
+        "DELETE FROM evaluation_datasets WHERE id NOT IN (SELECT value FROM json_each(?))",
+        (dataset_ids,),
+    )
+
+
+def get_tables(conn: sqlite3.Connection) -> List[Dict]:
+    """Get the schema of all regular tables in the database.
+
+    Virtual tables, like full-text indexes, and their shadow tables are skipped, they are
+    rebuilt from the regular tables.
+    """
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    ).fetchall()
+    virtual_tables = [
+        name for name, sql in rows if sql.upper().startswith("CREATE VIRTUAL TABLE")
+    ]
+    tables = []
+    for name, sql in rows:
+        if any(name == vt or name.startswith(f"{vt}_") for vt in virtual_tables):
+            continue
+        if name in EXCLUDED_TABLES:
+            continue
+        columns = [
+            (description[1], description[2])
+            for description in conn.execute(f"PRAGMA table_info({name})").fetchall()
+        ]
+        indexes = [
+            index_sql
+            for (index_sql,) in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                (name,),
+            ).fetchall()
+        ]
+        tables.append(
+            {"name": name, "sql": sql, "columns": columns, "indexes": indexes}
+        )
+    return tables
+
+
+def iter_rows(
+    conn: sqlite3.Connection, query: str, chunk_size: int, params: tuple = ()
+) -> Iterator[List]:
+    """Iterate over the rows of a query in chunks with JSON serializable values."""
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [[encode_value(value) for value in row] for row in rows]
+
+
+def encode_value(value):
+    """Encode a column value for JSON, binary values are stored as base64."""
+    if isinstance(value, bytes):
+        return {"$b64": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and "$b64" in value:
+        return base64.b64decode(value["$b64"])
+    return value
+
+
+def write_record(f: IO, record: Dict):
+    f.write(dumps(record))
+    f.write("\n")
+
+
+def open_backup(path: str, mode: str, compress: bool | None = None) -> IO:
+    """Open a backup file for text reading or writing, reading gzip files transparently."""
+    if mode == "r":
+        with open(path, "rb") as f:
+            compress = f.read(2) == b"\x1f\x8b"
+    if compress:
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
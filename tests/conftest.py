@@ -35,17 +35,27 @@ def db_path():
     return "tests/tmp/test_promptmage.db"
 
 
+def remove_database(backend):
+    """Close the connections of a backend and remove its database with its write-ahead log."""
+    backend.engine.dispose()
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(backend.db_path + suffix):
+            os.remove(backend.db_path + suffix)
+
+
 @pytest.fixture
 def prompt_sqlite_backend(db_path):
-    yield SQLitePromptBackend(db_path)
+    backend = SQLitePromptBackend(db_path)
+    yield backend
 
     # Clean up the database
-    os.remove(db_path)
+    remove_database(backend)
 
 
 @pytest.fixture
 def data_sqlite_backend(db_path):
-    yield SQLiteDataBackend(db_path)
+    backend = SQLiteDataBackend(db_path)
+    yield backend
 
     # Clean up the database
-    os.remove(db_path)
+    remove_database(backend)
@@ -0,0 +1,283 @@
+"""Tests for the backup and restore of the database."""
+
+import gzip
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from promptmage import Prompt, RunData
+from promptmage.storage import SQLiteDataBackend, SQLitePromptBackend
+from promptmage.storage.utils import (
+    backup_db_to_json,
+    backup_db_to_jsonl,
+    restore_db,
+    restore_db_from_chain,
+    snapshot_db,
+)
+
+
+@pytest.fixture
+def filled_db(tmp_path):
+    db_path = str(tmp_path / "promptmage.db")
+    prompt_backend = SQLitePromptBackend(db_path)
+    data_backend = SQLiteDataBackend(db_path)
+    prompt = Prompt(
+        name="prompt", system="system", user="user", template_vars=["question"]
+    )
+    prompt_backend.store_prompt(prompt)
+    for i in range(25):
+        data_backend.store_data(
+            RunData(
+                step_name="step",
+                prompt=prompt,
+                input_data={"question": f"question {i}"},
+                output_data={"answer": f"answer {i}"},
+                status="success",
+                run_time=str(datetime.now() - timedelta(hours=i + 1)),
+            )
+        )
+    data_backend.create_dataset("dataset", "description")
+    return db_path
+
+
+def table_contents(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=str)
+            for table in ["prompts", "data", "evaluation_datasets"]
+        }
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("file_name", ["backup.jsonl", "backup.jsonl.gz"])
+def test_streaming_backup_roundtrip(filled_db, tmp_path, file_name):
+    """Test that a streamed backup restores the same rows and indexes."""
+    backup_path = str(tmp_path / file_name)
+    backup_db_to_jsonl(filled_db, backup_path, chunk_size=10)
+    if file_name.endswith(".gz"):
+        with gzip.open(backup_path, "rt") as f:
+            assert f.readline()
+
+    restored_path = str(tmp_path / "restored.db")
+    restore_db(restored_path, backup_path)
+
+    assert table_contents(restored_path) == table_contents(filled_db)
+    conn = sqlite3.connect(restored_path)
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(prompts)")}
+    assert "ix_prompts_name_version" in indexes
+
+
+def test_restore_legacy_json_backup(filled_db, tmp_path):
+    """Test that backups in the old JSON format can still be restored."""
+    backup_path = str(tmp_path / "backup.json")
+    backup_db_to_json(filled_db, backup_path)
+
+    restored_path = str(tmp_path / "restored.db")
+    restore_db(restored_path, backup_path)
+
+    assert table_contents(restored_path) == table_contents(filled_db)
+
+
+def test_incremental_backup_chain(filled_db, tmp_path):
+    """Test that a full backup plus incrementals restores the latest state."""
+    prompt_backend = SQLitePromptBackend(filled_db)
+    data_backend = SQLiteDataBackend(filled_db)
+    full_path = str(tmp_path / "full.jsonl")
+    watermark = backup_db_to_jsonl(filled_db, full_path)
+
+    # change the database after the full backup
+    prompt = prompt_backend.get_prompt("prompt")
+    prompt.system = "new system"
+    prompt.active = True
+    prompt_backend.update_prompt(prompt)
+    new_run = RunData(
+        step_name="step",
+        prompt=None,
+        input_data={"question": "new"},
+        output_data={"answer": "new"},
+        status="success",
+    )
+    data_backend.store_data(new_run)
+    dataset = data_backend.get_datasets()[0]
+    data_backend.add_datapoints_to_dataset([new_run.step_run_id], dataset.id)
+
+    incremental_path = str(tmp_path / "incremental.jsonl.gz")
+    backup_db_to_jsonl(filled_db, incremental_path, since=watermark)
+
+    # the incremental only holds the changed rows
+    with gzip.open(incremental_path, "rt") as f:
+        records = [json.loads(line) for line in f]
+    exported = {
+        record["table"]: len(record["rows"])
+        for record in records
+        if record["type"] == "rows"
+    }
+    assert exported["prompts"] == 1
+    assert exported["data"] == 1
+
+    restored_path = str(tmp_path / "restored.db")
+    restore_db_from_chain(restored_path, [full_path, incremental_path])
+
+    assert table_contents(restored_path) == table_contents(filled_db)
+    conn = sqlite3.connect(restored_path)
+    assert conn.execute("SELECT COUNT(*) FROM evaluation_datapoints").fetchone() == (1,)
+
+
+def test_incremental_backup_keeps_prompts_of_old_runs(filled_db, tmp_path):
+    """Test that old runs keep their prompt if it is deleted after the full backup."""
+    prompt_backend = SQLitePromptBackend(filled_db)
+    full_path = str(tmp_path / "full.jsonl")
+    watermark = backup_db_to_jsonl(filled_db, full_path)
+    prompt_backend.delete_prompt(prompt_backend.get_prompt("prompt").id)
+    incremental_path = str(tmp_path / "incremental.jsonl")
+    backup_db_to_jsonl(filled_db, incremental_path, since=watermark)
+
+    restored_path = str(tmp_path / "restored.db")
+    restore_db_from_chain(restored_path, [full_path, incremental_path])
+
+    assert table_contents(restored_path) == table_contents(filled_db)
+    runs = SQLiteDataBackend(restored_path).get_all_data()
+    assert len(runs) == 25
+    assert all(run.prompt.name == "prompt" for run in runs)
+
+
+def test_incremental_backup_keeps_late_runs_and_deletions(filled_db, tmp_path):
+    """Test that incrementals hold runs stored late with an old run time and deleted runs."""
+    data_backend = SQLiteDataBackend(filled_db)
+    full_path = str(tmp_path / "full.jsonl")
+    watermark = backup_db_to_jsonl(filled_db, full_path)
+
+    # a run that started a day ago, but was stored after the backup
+    late_run = RunData(
+        step_name="step",
+        prompt=None,
+        input_data={"question": "late"},
+        output_data={"answer": "late"},
+        status="success",
+        run_time=str(datetime.now() - timedelta(days=1)),
+    )
+    data_backend.store_data(late_run)
+    deleted_run = data_backend.get_all_data()[0]
+    data_backend.delete_data([deleted_run.step_run_id])
+    incremental_path = str(tmp_path / "incremental.jsonl")
+    backup_db_to_jsonl(filled_db, incremental_path, since=watermark)
+
+    restored_path = str(tmp_path / "restored.db")
+    restore_db_from_chain(restored_path, [full_path, incremental_path])
+
+    assert table_contents(restored_path) == table_contents(filled_db)
+    restored = SQLiteDataBackend(restored_path)
+    assert restored.get_data(late_run.step_run_id) is not None
+    assert restored.get_data(deleted_run.step_run_id) is None
+
+
+def test_incremental_chain_must_be_continuous(filled_db, tmp_path):
+    """Test that incrementals are only applied on top of the backup they continue."""
+    full_path = str(tmp_path / "full.jsonl")
+    watermark = backup_db_to_jsonl(filled_db, full_path)
+    backup_db_to_jsonl(filled_db, str(tmp_path / "first.jsonl"), since=watermark)
+    SQLiteDataBackend(filled_db).store_data(
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={},
+            output_data={},
+            status="success",
+        )
+    )
+    second = backup_db_to_jsonl(
+        filled_db, str(tmp_path / "second.jsonl"), since=watermark
+    )
+    backup_db_to_jsonl(filled_db, str(tmp_path / "third.jsonl"), since=second)
+
+    with pytest.raises(ValueError):
+        restore_db_from_chain(
+            str(tmp_path / "restored.db"),
+            [full_path, str(tmp_path / "third.jsonl")],
+        )
+
+
+def test_snapshot_roundtrip(filled_db, tmp_path):
+    """Test that a snapshot copies the database and can be restored."""
+    snapshot_path = str(tmp_path / "snapshot.db")
+    snapshot_db(filled_db, snapshot_path)
+    assert table_contents(snapshot_path) == table_contents(filled_db)
+    assert not (tmp_path / "snapshot.db.tmp").exists()
+
+    # the running app keeps writing to the database, the snapshot is unaffected
+    SQLiteDataBackend(filled_db).store_data(
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={},
+            output_data={},
+            status="success",
+        )
+    )
+    assert table_contents(snapshot_path) != table_contents(filled_db)
+
+    restored_path = str(tmp_path / "restored.db")
+    restore_db(restored_path, snapshot_path)
+    assert table_contents(restored_path) == table_contents(snapshot_path)
+
+
+def test_snapshot_finishes_while_the_database_is_written(filled_db, tmp_path):
+    """Test that a snapshot is not restarted by the writes of a running app."""
+    data_backend = SQLiteDataBackend(filled_db)
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            data_backend.store_data(
+                RunData(
+                    step_name="step",
+                    prompt=None,
+                    input_data={},
+                    output_data={},
+                    status="success",
+                )
+            )
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        snapshot_path = str(tmp_path / "snapshot.db")
+        for _ in range(5):
+            snapshot_db(filled_db, snapshot_path)
+    finally:
+        stop.set()
+        writer.join()
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        assert conn.execute("SELECT count(*) FROM data").fetchone()[0] >= 25
+    finally:
+        conn.close()
+
+
+def test_runs_are_stored_while_a_snapshot_is_taken(filled_db, tmp_path):
+    """Test that writers are not locked out by the read transaction of a long snapshot."""
+    data_backend = SQLiteDataBackend(filled_db)
+    # a long snapshot holds a read transaction like this one
+    reader = sqlite3.connect(filled_db, isolation_level=None)
+    reader.execute("BEGIN")
+    reader.execute("SELECT count(*) FROM data").fetchone()
+    try:
+        run = RunData(
+            step_name="step",
+            prompt=None,
+            input_data={},
+            output_data={},
+            status="success",
+        )
+        data_backend.store_data(run)
+        snapshot_db(filled_db, str(tmp_path / "snapshot.db"))
+    finally:
+        reader.execute("COMMIT")
+        reader.close()
+    assert data_backend.get_data(run.step_run_id) is not None
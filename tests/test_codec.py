@@ -0,0 +1,98 @@
+"""Tests for the JSON codec and its libraries."""
+
+import json
+import math
+import uuid
+import pytest
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+
+from promptmage import codec
+from promptmage.codec import CodecJSONResponse, dumps, dumps_bytes, loads
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Status(str, Enum):
+    OK = "ok"
+
+
+class Count(int):
+    pass
+
+
+@pytest.fixture(params=codec.JSON_BACKENDS)
+def json_backend(request):
+    pytest.importorskip(request.param)
+    previous = codec.json_backend
+    codec.set_json_backend(request.param)
+    yield request.param
+    codec.set_json_backend(previous)
+
+
+def test_roundtrip(json_backend):
+    """Test that payloads are read back as they were written."""
+    payload = {
+        "question": "wie geht's? ünïcode",
+        "scores": [1, 2.5, -3, True, None],
+        "nested": {"items": ({"a": 1},)},
+    }
+    assert loads(dumps(payload)) == json.loads(json.dumps(payload))
+    assert loads(dumps_bytes(payload)) == loads(dumps(payload).encode("utf-8"))
+
+
+def test_non_finite_floats_are_written_like_the_standard_library(json_backend):
+    """Test that NaN and infinity are not turned into null by the fast libraries."""
+    payload = {"nan": float("nan"), "inf": [float("inf"), float("-inf")]}
+    assert dumps(payload) == json.dumps(payload)
+    many_values = {"values": [float("nan")] + list(range(100))}
+    assert dumps(many_values) == json.dumps(many_values)
+    decoded = loads(dumps(payload))
+    assert math.isnan(decoded["nan"])
+    assert decoded["inf"] == [math.inf, -math.inf]
+
+
+@pytest.mark.parametrize(
+    "value", [datetime(2024, 8, 1), uuid.uuid4(), {1, 2}, b"bytes", Point(1, 2)]
+)
+def test_unsupported_types_are_rejected(json_backend, value):
+    """Test that every library rejects the values the standard library rejects."""
+    if json_backend == "orjson" and isinstance(value, uuid.UUID):
+        # orjson can not hand UUIDs over to the standard library
+        assert loads(dumps({"value": value})) == {"value": str(value)}
+        return
+    with pytest.raises(TypeError):
+        dumps({"value": value})
+
+
+def test_subclasses_are_written_like_the_standard_library(json_backend):
+    assert dumps({"status": Status.OK, "n": Count(1)}) == json.dumps(
+        {"status": Status.OK, "n": Count(1)}
+    )
+
+
+def test_fallbacks(json_backend):
+    """Test the values the fast libraries hand over to the standard library."""
+    for payload in [{1: "int key"}, {"big": 2**70}, {"nested": [[[1]]] * 3}]:
+        assert loads(dumps(payload)) == json.loads(json.dumps(payload))
+    circular = []
+    circular.append(circular)
+    with pytest.raises(ValueError):
+        dumps(circular)
+    # rows written by the standard library can always be read
+    assert loads('{"a": NaN, "b": [1, 2]}')["b"] == [1, 2]
+
+
+def test_codec_json_response(json_backend):
+    response = CodecJSONResponse({"score": float("nan"), "name": "p"})
+    assert response.body == dumps_bytes({"score": float("nan"), "name": "p"})
+
+
+def test_unknown_json_backend():
+    with pytest.raises(ValueError):
+        codec.set_json_backend("simplejson")
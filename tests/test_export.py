@@ -0,0 +1,52 @@
+"""Tests for the streaming export of run data."""
+
+import csv
+import gzip
+import json
+
+import pytest
+
+from promptmage import RunData
+from promptmage.storage.export import export_runs
+
+
+@pytest.fixture
+def runs():
+    return [
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={"question": f"question {i}"},
+            output_data={"answer": f"answer {i}"},
+            status="success",
+        )
+        for i in range(5)
+    ]
+
+
+@pytest.mark.parametrize("export_format", ["jsonl", "json", "csv"])
+def test_export_runs(runs, tmp_path, export_format):
+    """Test that runs are exported in every format and read back the same."""
+    path = str(tmp_path / f"runs.{export_format}.gz")
+    count = export_runs(iter(runs), path, export_format)
+    assert count == 5
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        if export_format == "jsonl":
+            rows = [json.loads(line) for line in f]
+        elif export_format == "json":
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+            for row in rows:
+                row["input_data"] = json.loads(row["input_data"])
+    assert [row["step_run_id"] for row in rows] == [run.step_run_id for run in runs]
+    assert rows[3]["input_data"] == {"question": "question 3"}
+
+
+def test_export_no_runs(tmp_path):
+    """Test that an empty JSON export is still a valid document."""
+    path = str(tmp_path / "runs.json")
+    assert export_runs([], path, "json") == 0
+    with open(path) as f:
+        assert json.load(f) == []
@@ -0,0 +1,168 @@
+"""Tests for the append-only file backend."""
+
+import os
+
+import pytest
+
+from promptmage import Prompt, RunData
+from promptmage.exceptions import PromptNotFoundException
+from promptmage.storage import FileBackend
+
+
+def make_run_data(i: int) -> RunData:
+    return RunData(
+        step_name=f"step{i % 2}",
+        prompt=None,
+        input_data={"question": f"question {i}"},
+        output_data={"answer": "x" * 100},
+        status="success",
+    )
+
+
+def test_store_and_get_data(tmp_path):
+    """Test that runs are stored, overwritten and deleted across segments."""
+    backend = FileBackend(str(tmp_path), segment_size=2000)
+    runs = [make_run_data(i) for i in range(50)]
+    for run in runs:
+        backend.store_data(run)
+    assert len(list(tmp_path.glob("*.idx"))) > 1
+
+    runs[3].status = "failed"
+    backend.store_data(runs[3])
+    backend.delete_data([runs[4].step_run_id])
+
+    assert backend.get_data(runs[0].step_run_id).input_data == {
+        "question": "question 0"
+    }
+    assert backend.get_data(runs[3].step_run_id).status == "failed"
+    assert backend.get_data(runs[4].step_run_id) is None
+    assert backend.get_data("missing") is None
+    assert len(backend.get_all_data()) == 49
+    assert len(list(backend.iter_data(step_names=["step1"], status="failed"))) == 1
+    backend.close()
+
+    reopened = FileBackend(str(tmp_path), segment_size=2000)
+    assert reopened.get_data(runs[3].step_run_id).status == "failed"
+    assert reopened.get_data(runs[4].step_run_id) is None
+    assert len(reopened.get_all_data()) == 49
+    reopened.close()
+
+
+def test_torn_tail_recovery(tmp_path):
+    """Test that a torn record at the end of the active segment is cut off on open."""
+    backend = FileBackend(str(tmp_path))
+    runs = [make_run_data(i) for i in range(3)]
+    for run in runs:
+        backend.store_data(run)
+    backend.close()
+
+    segment = next(tmp_path.glob("*.log"))
+    size = segment.stat().st_size
+    os.truncate(segment, size - 10)
+
+    reopened = FileBackend(str(tmp_path))
+    assert [run.step_run_id for run in reopened.get_all_data()] == [
+        run.step_run_id for run in runs[:2]
+    ]
+    reopened.store_data(runs[2])
+    assert reopened.get_data(runs[2].step_run_id) is not None
+    reopened.close()
+
+
+def test_compaction(tmp_path):
+    """Test that compaction drops overwritten records and keeps deletions."""
+    backend = FileBackend(str(tmp_path), segment_size=2000)
+    runs = [make_run_data(i) for i in range(20)]
+    for _ in range(3):
+        for run in runs:
+            backend.store_data(run)
+    backend.delete_data([runs[0].step_run_id])
+    size_before = sum(path.stat().st_size for path in tmp_path.glob("*.log"))
+
+    assert backend.compact()
+    size_after = sum(path.stat().st_size for path in tmp_path.glob("*.log"))
+    assert size_after < size_before / 2
+    assert backend.get_data(runs[0].step_run_id) is None
+    assert len(backend.get_all_data()) == 19
+    backend.close()
+
+    reopened = FileBackend(str(tmp_path), segment_size=2000)
+    assert len(reopened.get_all_data()) == 19
+    reopened.close()
+
+
+def test_prompts(tmp_path):
+    """Test that prompt versions are persisted in the log."""
+    backend = FileBackend(str(tmp_path))
+    prompt = Prompt(name="test", system="system", user="user", template_vars=[])
+    backend.store_prompt(prompt)
+    prompt.system = "new system"
+    prompt.active = True
+    backend.update_prompt(prompt)
+    backend.close()
+
+    reopened = FileBackend(str(tmp_path))
+    assert reopened.get_prompt("test").version == 2
+    assert reopened.get_prompt("test", active=True).system == "new system"
+    reopened.delete_prompt(reopened.get_prompt("test").id)
+    reopened.close()
+
+    reopened = FileBackend(str(tmp_path))
+    with pytest.raises(PromptNotFoundException):
+        reopened.get_prompt("test", active=True)
+    assert reopened.get_prompt("test").version == 1
+    reopened.close()
+
+
+def test_iter_data_by_start_time(tmp_path):
+    """Test that runs are filtered and ordered by their start time, whatever the time format."""
+    backend = FileBackend(str(tmp_path))
+    for run_time in [
+        "2024-08-02T08:00:00",
+        "2024-08-01 23:00:00",
+        "2024-08-01T09:00:00",
+    ]:
+        backend.store_data(
+            RunData(
+                step_name="step",
+                prompt=None,
+                input_data={},
+                output_data={},
+                status="success",
+                run_time=run_time,
+            )
+        )
+
+    day = list(backend.iter_data(since="2024-08-01 12:00:00", until="2024-08-02"))
+    assert [run.run_time for run in day] == ["2024-08-01 23:00:00"]
+    assert [run.run_time for run in backend.iter_data(since="2024-08-01")] == [
+        "2024-08-01T09:00:00",
+        "2024-08-01 23:00:00",
+        "2024-08-02T08:00:00",
+    ]
+    backend.close()
+
+
+def test_flow_runs_survive_reopening(tmp_path):
+    """Test that flow runs are read back after the backend is reopened."""
+    backend = FileBackend(str(tmp_path))
+    backend.start_run("run-1", "flow", started_at=1.0)
+    run = make_run_data(0)
+    run.run_id = "run-1"
+    backend.store_data(run)
+    backend.end_run("run-1", "success", ended_at=2.0)
+    backend.close()
+
+    reopened = FileBackend(str(tmp_path))
+    assert reopened.get_run("run-1") == {
+        "run_id": "run-1",
+        "flow_name": "flow",
+        "status": "success",
+        "started_at": 1.0,
+        "ended_at": 2.0,
+    }
+    assert [run["run_id"] for run in reopened.get_runs("flow")] == ["run-1"]
+    assert [step.step_run_id for step in reopened.get_step_runs("run-1")] == [
+        run.step_run_id
+    ]
+    reopened.close()
@@ -0,0 +1,36 @@
+"""Tests for the time-ordered identifiers."""
+
+import re
+import time
+import uuid
+
+from promptmage import Prompt, RunData
+from promptmage.ids import uuid7, uuid7_time
+from promptmage.result import MageResult
+
+UUID_FORMAT = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-7[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}"
+)
+
+
+def test_uuid7_format():
+    value = uuid7()
+    assert UUID_FORMAT.fullmatch(value)
+    assert uuid.UUID(value).version == 7
+    assert abs(uuid7_time(value) - time.time()) < 1
+
+
+def test_uuid7_is_ordered():
+    values = [uuid7() for _ in range(10000)]
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+
+
+def test_generated_ids_are_time_ordered():
+    assert UUID_FORMAT.fullmatch(
+        Prompt(name="p", system="s", user="u", template_vars=[]).id
+    )
+    assert UUID_FORMAT.fullmatch(MageResult().id)
+    first = RunData(step_name="step", prompt=None, input_data={}, output_data={})
+    second = RunData(step_name="step", prompt=None, input_data={}, output_data={})
+    assert first.step_run_id < second.step_run_id
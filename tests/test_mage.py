@@ -8,6 +8,8 @@ from promptmage.mage import combine_dicts
 from promptmage.storage import (
     PromptStore,
     DataStore,
+    InMemoryDataBackend,
+    InMemoryPromptBackend,
 )
 
 
@@ -110,3 +112,69 @@ def test_combine_dicts():
     list_of_dicts = [{"a": 1, "b": 2}, {"a": 3, "c": 4}]
     combined = combine_dicts(list_of_dicts)
     assert combined == {"a": [1, 3], "b": 2, "c": 4}
+
+
+def test_runs_share_one_run_id_per_invocation():
+    data_store = DataStore(backend=InMemoryDataBackend())
+    mage = PromptMage(
+        name="flow",
+        prompt_store=PromptStore(backend=InMemoryPromptBackend()),
+        data_store=data_store,
+    )
+
+    @mage.step(name="first", initial=True)
+    def first(question: str):
+        return MageResult(next_step="second", answer=question.upper())
+
+    @mage.step(name="second")
+    def second(answer: str):
+        if answer == "FAIL":
+            raise ValueError("failed")
+        return MageResult(result=answer)
+
+    run_function = mage.get_run_function()
+    run_function(question="a")
+    run_function(question="fail")
+
+    runs = data_store.get_runs(flow_name="flow")
+    assert [run["status"] for run in runs] == ["failed", "success"]
+    for run in runs:
+        assert run["ended_at"] >= run["started_at"]
+        step_runs = data_store.get_step_runs(run["run_id"])
+        assert [run_data.step_name for run_data in step_runs] == ["first", "second"]
+    assert len({run_data.run_id for run_data in data_store.get_all_data()}) == 2
+
+
+def test_steps_can_have_a_run_id_input():
+    data_store = DataStore(backend=InMemoryDataBackend())
+    mage = PromptMage(
+        name="flow",
+        prompt_store=PromptStore(backend=InMemoryPromptBackend()),
+        data_store=data_store,
+    )
+
+    @mage.step(name="lookup", initial=True)
+    def lookup(run_id: str):
+        return MageResult(found=run_id)
+
+    assert mage.get_run_function()(run_id="order-1") == {"found": "order-1"}
+    (run_data,) = data_store.get_all_data()
+    assert run_data.input_data == {"run_id": "order-1"}
+    assert run_data.run_id == data_store.get_runs(flow_name="flow")[0]["run_id"]
+
+
+def test_failing_end_run_does_not_fail_the_flow():
+    data_store = DataStore(backend=InMemoryDataBackend())
+    data_store.end_run = MagicMock(side_effect=ConnectionError("server gone"))
+    mage = PromptMage(
+        name="flow",
+        prompt_store=PromptStore(backend=InMemoryPromptBackend()),
+        data_store=data_store,
+    )
+
+    @mage.step(name="first", initial=True)
+    def first(question: str):
+        return MageResult(answer=question)
+
+    assert mage.get_run_function()(question="a") == {"answer": "a"}
+    data_store.end_run.assert_called_once()
@@ -0,0 +1,102 @@
+"""Tests for the in-memory storage backends."""
+
+import pytest
+
+from promptmage import Prompt, RunData
+from promptmage.exceptions import PromptNotFoundException
+from promptmage.storage import InMemoryPromptBackend, InMemoryDataBackend
+
+
+def make_run_data(step_name: str = "step", **kwargs) -> RunData:
+    return RunData(
+        step_name=step_name,
+        prompt=None,
+        input_data={"question": "What is the answer?"},
+        output_data={"answer": "42"},
+        status="success",
+        **kwargs,
+    )
+
+
+def test_prompt_versions():
+    """Test that prompts are looked up by name, version and active flag."""
+    backend = InMemoryPromptBackend()
+    prompt = Prompt(name="test", system="system", user="user", template_vars=[])
+    backend.store_prompt(prompt)
+
+    prompt.system = "new system"
+    prompt.active = True
+    backend.update_prompt(prompt)
+
+    assert backend.get_prompt("test").version == 2
+    assert backend.get_prompt("test").system == "new system"
+    assert backend.get_prompt("test", version=1).system == "system"
+    assert backend.get_prompt("test", active=True).version == 2
+    assert len(backend.get_prompts()) == 2
+
+    # returned prompts are copies
+    backend.get_prompt("test").system = "changed"
+    assert backend.get_prompt("test").system == "new system"
+
+    backend.delete_prompt(backend.get_prompt("test").id)
+    assert backend.get_prompt("test").version == 1
+    with pytest.raises(PromptNotFoundException):
+        backend.get_prompt("test", active=True)
+    with pytest.raises(PromptNotFoundException):
+        backend.get_prompt("missing")
+
+
+def test_run_data():
+    """Test that runs of different steps in one run do not overwrite each other."""
+    backend = InMemoryDataBackend()
+    runs = [
+        make_run_data(step_name=f"step{i % 2}", run_id="run", execution_time=i)
+        for i in range(6)
+    ]
+    for run in runs:
+        backend.store_data(run)
+
+    assert len(backend.get_all_data()) == 6
+    assert backend.get_data(runs[3].step_run_id).step_name == "step1"
+    assert backend.get_data("missing") is None
+    assert len(list(backend.iter_data(step_names=["step0"]))) == 3
+    assert len(backend.search_data("answer 42", step_names=["step1"])) == 3
+    stats = backend.get_latency_stats(group_by=["step_name"])
+    assert {s["step_name"]: s["runs"] for s in stats} == {"step0": 3, "step1": 3}
+    day = runs[0].run_time[:10]
+    assert backend.get_latency_stats(since=day, group_by=[])[0]["runs"] == 6
+    timeline = backend.get_run_timeline(bucket=60, step_name="step1")
+    assert sum(bucket["runs"] for bucket in timeline) == 3
+    assert timeline[-1]["latency_mean"] == 3.0
+
+    backend.delete_data([runs[0].step_run_id])
+    assert len(list(backend.iter_data(step_names=["step0"]))) == 2
+
+
+def test_datasets():
+    """Test the dataset operations of the in-memory data backend."""
+    backend = InMemoryDataBackend()
+    runs = [make_run_data() for _ in range(4)]
+    for run in runs:
+        backend.store_data(run)
+    backend.create_dataset("dataset", "description")
+    dataset = backend.get_datasets()[0]
+
+    backend.add_datapoints_to_dataset([run.step_run_id for run in runs], dataset.id)
+    datapoints = backend.get_datapoints(dataset.id)
+    backend.rate_datapoints({datapoints[0].id: 1, datapoints[1].id: -1})
+    backend.rate_datapoint(datapoints[2].id, 1)
+    backend.remove_datapoints([datapoints[3].id])
+
+    stats = backend.get_dataset_stats()[dataset.id]
+    assert stats["datapoints"] == 3
+    assert stats["rated"] == 3
+    assert stats["rating_sum"] == 1
+    rows = backend.get_datapoints_with_runs(dataset.id, offset=1, limit=5)
+    assert len(rows) == 2
+    assert all(dp.run_data_id == run.step_run_id for dp, run in rows)
+
+    backend.delete_dataset(dataset.id)
+    assert backend.get_datasets() == []
+    with pytest.raises(ValueError):
+        backend.get_datapoint(datapoints[0].id)
@@ -0,0 +1,68 @@
+"""Tests for the prompt store and its prompt cache."""
+
+from unittest.mock import MagicMock
+
+from promptmage import Prompt
+from promptmage.storage import PromptStore, SQLitePromptBackend
+
+
+def make_prompt(**kwargs) -> Prompt:
+    defaults = dict(
+        name="test",
+        system="system",
+        user="user",
+        template_vars=["question"],
+        version=1,
+        active=True,
+    )
+    defaults.update(kwargs)
+    return Prompt(**defaults)
+
+
+def test_get_prompt_is_cached():
+    """Test that repeated reads are served from the cache."""
+    backend = SQLitePromptBackend(":memory:")
+    backend.get_prompt = MagicMock(wraps=backend.get_prompt)
+    store = PromptStore(backend=backend)
+    store.store_prompt(make_prompt())
+
+    first = store.get_prompt("test", active=True)
+    second = store.get_prompt("test", active=True)
+
+    assert first.id == second.id
+    assert backend.get_prompt.call_count == 1
+
+    # cached prompts are copies and can not be mutated by callers
+    second.system = "changed"
+    assert store.get_prompt("test", active=True).system == "system"
+
+
+def test_writes_invalidate_cache():
+    """Test that writes through the store bump the revision and invalidate the cache."""
+    store = PromptStore(backend=SQLitePromptBackend(":memory:"))
+    prompt = make_prompt()
+    store.store_prompt(prompt)
+    revision = store.revision
+
+    assert store.get_prompt("test").system == "system"
+
+    prompt.system = "new system"
+    store.update_prompt(prompt)
+    assert store.revision > revision
+    assert store.get_prompt("test").system == "new system"
+
+    latest = store.get_prompt("test")
+    store.delete_prompt(latest.id)
+    assert store.get_prompt("test").system == "system"
+
+
+def test_cache_ttl_expiry():
+    """Test that entries older than the TTL are refetched."""
+    backend = MagicMock()
+    backend.get_prompt.return_value = make_prompt()
+    store = PromptStore(backend=backend, cache_ttl=0)
+
+    store.get_prompt("test")
+    store.get_prompt("test")
+
+    assert backend.get_prompt.call_count == 2
@@ -0,0 +1,441 @@
+"""Tests for the remote backend API."""
+
+import json
+import asyncio
+import time
+import pytest
+import requests
+import threading
+import uvicorn
+from fastapi.testclient import TestClient
+
+from promptmage import Prompt, RunData
+from promptmage.remote import RemoteBackendAPI
+from promptmage.storage import (
+    RemoteDataBackend,
+    RemotePromptBackend,
+    SQLiteDataBackend,
+    SQLitePromptBackend,
+)
+from promptmage.storage.transport import Transport, get_async_transport
+
+
+@pytest.fixture
+def remote_backend(tmp_path):
+    db_path = str(tmp_path / "promptmage.db")
+    return RemoteBackendAPI(
+        url="http://testserver",
+        data_backend=SQLiteDataBackend(db_path),
+        prompt_backend=SQLitePromptBackend(db_path),
+    )
+
+
+@pytest.fixture
+def client(remote_backend):
+    return TestClient(remote_backend.get_app())
+
+
+def test_bulk_dataset_endpoints(remote_backend, client):
+    """Test adding, rating and removing datapoints in bulk through the API."""
+    data_backend = remote_backend.data_backend
+    runs = [
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={"question": i},
+            output_data={"answer": i},
+            status="success",
+        )
+        for i in range(5)
+    ]
+    for run in runs:
+        data_backend.store_data(run)
+    data_backend.create_dataset("dataset")
+    dataset_id = data_backend.get_datasets()[0].id
+
+    response = client.post(
+        f"/datasets/{dataset_id}/datapoints",
+        json=[run.step_run_id for run in runs],
+    )
+    assert response.status_code == 200
+    datapoints = data_backend.get_datapoints(dataset_id)
+    assert len(datapoints) == 5
+
+    response = client.put("/datapoints/ratings", json={dp.id: 1 for dp in datapoints})
+    assert response.status_code == 200
+    assert all(dp.rating == 1 for dp in data_backend.get_datapoints(dataset_id))
+
+    response = client.request(
+        "DELETE", "/datapoints", json=[dp.id for dp in datapoints[:2]]
+    )
+    assert response.status_code == 200
+    assert len(data_backend.get_datapoints(dataset_id)) == 3
+
+
+def test_get_datapoints_with_runs_endpoint(remote_backend, client):
+    """Test that the joined datapoint endpoint returns datapoints with their runs."""
+    data_backend = remote_backend.data_backend
+    run = RunData(
+        step_name="step",
+        prompt=None,
+        input_data={"question": "q"},
+        output_data={"answer": "a"},
+        status="success",
+    )
+    data_backend.store_data(run)
+    data_backend.create_dataset("dataset")
+    dataset_id = data_backend.get_datasets()[0].id
+    data_backend.add_datapoints_to_dataset([run.step_run_id], dataset_id)
+
+    response = client.get(f"/datasets/{dataset_id}/runs", params={"limit": 10})
+    assert response.status_code == 200
+    rows = response.json()
+    assert len(rows) == 1
+    assert rows[0]["datapoint"]["run_data_id"] == run.step_run_id
+    assert rows[0]["run"]["output_data"] == {"answer": "a"}
+
+
+def test_dataset_stats_endpoint(remote_backend, client):
+    """Test that dataset statistics are served before the dataset detail route."""
+    remote_backend.data_backend.create_dataset("dataset")
+    dataset_id = remote_backend.data_backend.get_datasets()[0].id
+
+    response = client.get("/datasets/stats")
+    assert response.status_code == 200
+    assert response.json()[dataset_id]["datapoints"] == 0
+
+
+def test_search_runs_endpoint(remote_backend, client):
+    """Test that runs are searched through the API."""
+    data_backend = remote_backend.data_backend
+    for step_name, answer in [("step", "connection timeout"), ("other", "timeout")]:
+        data_backend.store_data(
+            RunData(
+                step_name=step_name,
+                prompt=None,
+                input_data={"question": "why?"},
+                output_data={"answer": answer},
+                status="success",
+            )
+        )
+
+    response = client.get("/runs/search", params={"query": "timeout"})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+    response = client.get("/runs/search", params={"query": "timeout", "step": ["step"]})
+    assert [run["step_name"] for run in response.json()] == ["step"]
+
+
+def test_latency_stats_endpoint(remote_backend, client):
+    """Test that latency statistics are served through the API."""
+    for latency in [1.0, 2.0, 3.0]:
+        remote_backend.data_backend.store_data(
+            RunData(
+                step_name="step",
+                prompt=None,
+                input_data={},
+                output_data={},
+                status="success",
+                execution_time=latency,
+            )
+        )
+
+    response = client.get(
+        "/stats/latency", params={"group_by": ["step_name"], "percentiles": [50]}
+    )
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats[0]["step_name"] == "step"
+    assert stats[0]["runs"] == 3
+    assert stats[0]["p50"] == pytest.approx(2.0, rel=0.05)
+
+    response = client.get("/stats/latency", params={"group_by": ["status"]})
+    assert response.status_code == 400
+
+
+def test_run_timeline_endpoint(remote_backend, client):
+    """Test that time-bucketed run counts are served through the API."""
+    for latency in [1.0, 3.0]:
+        remote_backend.data_backend.store_data(
+            RunData(
+                step_name="step",
+                prompt=None,
+                input_data={},
+                output_data={},
+                status="success",
+                execution_time=latency,
+            )
+        )
+
+    response = client.get("/stats/timeline", params={"bucket": 86400})
+    assert response.status_code == 200
+    timeline = response.json()
+    assert sum(bucket["runs"] for bucket in timeline) == 2
+    assert timeline[-1]["latency_mean"] == 2.0
+
+    response = client.get("/stats/timeline", params={"bucket": 0})
+    assert response.status_code == 400
+
+
+def test_batch_runs_endpoint(remote_backend, client):
+    """Test that runs are stored in batches from JSON arrays and NDJSON."""
+    runs = [
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={"i": i},
+            output_data={},
+            status="success",
+        ).to_dict()
+        for i in range(3)
+    ]
+    response = client.post("/runs/batch", content=json.dumps(runs))
+    assert response.status_code == 200
+    assert response.json() == {"stored": 3, "rejected": []}
+
+    # sending a batch again does not store the runs twice
+    response = client.post(
+        "/runs/batch",
+        content="\n".join(json.dumps(run) for run in runs),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.json() == {"stored": 0, "rejected": []}
+    assert len(remote_backend.data_backend.get_all_data()) == 3
+
+    assert client.post("/runs/batch", content="{").status_code == 400
+    assert client.post("/runs/batch", content="{}").status_code == 400
+
+
+def test_batch_runs_endpoint_rejects_invalid_runs(remote_backend, client):
+    """Test that the valid runs of a batch are stored and the invalid ones reported."""
+    runs = [
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={"i": i},
+            output_data={},
+            status="success",
+        ).to_dict()
+        for i in range(3)
+    ]
+    runs[1]["status"] = None
+    runs.append("not a run")
+    response = client.post("/runs/batch", content=json.dumps(runs))
+    assert response.status_code == 200
+    result = response.json()
+    assert result["stored"] == 2
+    assert [run["index"] for run in result["rejected"]] == [1, 3]
+    assert result["rejected"][0]["step_run_id"] == runs[1]["step_run_id"]
+
+    # the backend skips runs the database refuses as well
+    data_backend = remote_backend.data_backend
+    valid, invalid = [
+        RunData(
+            step_name="step",
+            prompt=None,
+            input_data={},
+            output_data={},
+            status=status,
+        )
+        for status in ["success", None]
+    ]
+    assert data_backend.store_data_batch([valid, invalid]) == 1
+    assert data_backend.get_data(valid.step_run_id) is not None
+    assert data_backend.get_data(invalid.step_run_id) is None
+
+
+def test_prompt_endpoints_answer_conditional_requests(remote_backend, client):
+    """Test that unchanged prompts are answered with an empty 304 response."""
+    prompt = Prompt(name="p", system="s", user="u {text}", template_vars=["text"])
+    remote_backend.prompt_backend.store_prompt(prompt)
+
+    for path in ["/prompts/p", f"/prompts/id/{prompt.id}", "/prompts"]:
+        response = client.get(path)
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    prompt.user = "changed {text}"
+    remote_backend.prompt_backend.update_prompt(prompt)
+    response = client.get("/prompts/p", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["user"] == "changed {text}"
+
+
+@pytest.fixture
+def remote_url(remote_backend):
+    config = uvicorn.Config(
+        remote_backend.get_app(), host="127.0.0.1", port=0, log_level="error"
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+def test_remote_data_backend_sends_runs_in_batches(remote_backend, remote_url):
+    """Test that a fan-out of runs is sent to the server in a few requests."""
+    transport = Transport(remote_url)
+    requests_sent = []
+    send = transport.request
+    transport.request = lambda method, path, **kwargs: (
+        requests_sent.append(path) or send(method, path, **kwargs)
+    )
+    backend = RemoteDataBackend(
+        remote_url, transport=transport, batch_size=40, flush_interval=60
+    )
+    for i in range(100):
+        backend.store_data(
+            RunData(
+                step_name="step",
+                prompt=None,
+                input_data={"i": i},
+                output_data={},
+                status="success",
+            )
+        )
+    # reads see the buffered runs
+    assert len(backend.get_all_data()) == 100
+    assert requests_sent.count("/runs/batch") <= 3
+    assert len(remote_backend.data_backend.get_all_data()) == 100
+    backend.close()
+
+
+def test_remote_prompt_backend_revalidates_prompts(remote_backend, remote_url):
+    """Test that a prompt is only downloaded again after it changed."""
+    transport = Transport(remote_url)
+    statuses = []
+    send = transport.request
+
+    def request(method, path, **kwargs):
+        response = send(method, path, **kwargs)
+        statuses.append(response.status_code)
+        return response
+
+    transport.request = request
+    backend = RemotePromptBackend(remote_url, transport=transport)
+    backend.store_prompt(
+        Prompt(name="p", system="s", user="u {text}", template_vars=["text"])
+    )
+    statuses.clear()
+
+    for _ in range(3):
+        prompt = backend.get_prompt("p")
+        assert prompt.user == "u {text}"
+    assert statuses == [200, 304, 304]
+
+    # the cached prompt is not changed by the callers
+    prompt.template_vars.append("other")
+    assert backend.get_prompt("p").template_vars == ["text"]
+
+    prompt = backend.get_prompt("p")
+    prompt.user = "changed {text}"
+    backend.update_prompt(prompt)
+    assert backend.get_prompt("p").user == "changed {text}"
+
+    # within the ttl the server is not asked at all
+    backend.cache_ttl = 60
+    statuses.clear()
+    for _ in range(3):
+        backend.get_prompt("p")
+    assert len(statuses) <= 1
+
+    # async reads revalidate the same cache
+    backend.cache_ttl = 0
+    statuses.clear()
+
+    async def read_async():
+        async_transport = get_async_transport(transport)
+        send_async = async_transport.get
+
+        async def get(path, **kwargs):
+            response = await send_async(path, **kwargs)
+            statuses.append(response.status_code)
+            return response
+
+        async_transport.get = get
+        return [(await backend.aget_prompt("p")).user for _ in range(2)]
+
+    assert asyncio.run(read_async()) == ["changed {text}"] * 2
+    assert statuses == [304, 304]
+
+
+def test_remote_prompt_backend_in_several_event_loops(remote_url):
+    """Test that async reads work in every event loop the backend is used in."""
+    backend = RemotePromptBackend(remote_url)
+    backend.store_prompt(
+        Prompt(name="p", system="s", user="u {text}", template_vars=["text"])
+    )
+    for _ in range(2):
+        assert asyncio.run(backend.aget_prompt("p")).user == "u {text}"
+
+
+def test_remote_data_backend_handles_refused_batches(remote_url):
+    """Test how batches are handled that the server answers with a client error."""
+    transport = Transport(remote_url)
+    backend = RemoteDataBackend(remote_url, transport=transport, flush_interval=60)
+    sent = []
+    status = {"/runs/batch": 422, "/runs": 200}
+
+    def post(path, data, **kwargs):
+        response = requests.Response()
+        response.status_code = status[path]
+        runs = data.split(b"\n")
+        if path == "/runs/batch" and status[path] == 413 and len(runs) <= 2:
+            response.status_code = 200
+        if response.status_code == 200:
+            sent.append((path, len(runs)))
+        response._content = b'{"stored": 0, "rejected": []}'
+        return response
+
+    transport.post = post
+
+    def store_runs(count: int):
+        for i in range(count):
+            backend.store_data(
+                RunData(
+                    step_name="step",
+                    prompt=None,
+                    input_data={"i": i},
+                    output_data={},
+                    status="success",
+                )
+            )
+
+    # invalid runs are dropped
+    store_runs(3)
+    backend.flush()
+    assert backend._buffer == []
+
+    # other client errors and a failing server keep the runs for the next flush
+    for code in [409, 503]:
+        status["/runs/batch"] = code
+        store_runs(1)
+        with pytest.raises(requests.exceptions.HTTPError):
+            backend.flush()
+        assert len(backend._buffer) == 1
+        backend._buffer.clear()
+
+    # batches that are too large are split
+    status["/runs/batch"] = 413
+    store_runs(5)
+    backend.flush()
+    assert sorted(sent) == [("/runs/batch", 1), ("/runs/batch", 2), ("/runs/batch", 2)]
+
+    # servers without the batch endpoint get the runs one by one
+    sent.clear()
+    status["/runs/batch"] = 404
+    store_runs(3)
+    backend.flush()
+    assert sent == [("/runs", 1)] * 3
+    assert backend._buffer == []
+    backend.close()
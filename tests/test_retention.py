@@ -0,0 +1,128 @@
+"""Tests for the retention of old run data."""
+
+import time
+import gzip
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from promptmage import RunData
+from promptmage.storage import SQLiteDataBackend
+from promptmage.storage.retention import (
+    RetentionPolicy,
+    apply_retention,
+    enable_incremental_vacuum,
+)
+
+
+def store_runs(backend, step_name: str, ages_in_days):
+    runs = []
+    for age in ages_in_days:
+        run = RunData(
+            step_name=step_name,
+            prompt=None,
+            input_data={"age": age},
+            output_data={"result": "x" * 100},
+            status="success",
+            run_time=str(datetime.now() - timedelta(days=age)),
+        )
+        backend.store_data(run)
+        runs.append(run)
+    return runs
+
+
+def test_age_based_retention_archives_runs(tmp_path):
+    """Test that old runs are archived and deleted while recent runs are kept."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"))
+    old_runs = store_runs(backend, "step", [100, 90, 80])
+    new_runs = store_runs(backend, "step", [1, 0])
+    backend.start_run("old", "flow", started_at=time.time() - 100 * 86400)
+    backend.start_run("new", "flow")
+
+    deleted = apply_retention(
+        backend,
+        RetentionPolicy(max_age_days=30),
+        archive_dir=str(tmp_path / "archive"),
+        batch_size=2,
+        pause=0,
+    )
+
+    assert deleted == 3
+    remaining = {run.step_run_id for run in backend.get_all_data()}
+    assert remaining == {run.step_run_id for run in new_runs}
+
+    archived = []
+    for segment in (tmp_path / "archive").glob("runs-*.jsonl.gz"):
+        with gzip.open(segment, "rt") as f:
+            archived.extend(json.loads(line) for line in f)
+    assert {run["step_run_id"] for run in archived} == {
+        run.step_run_id for run in old_runs
+    }
+
+    # expired flow runs are archived to segments of their own
+    assert [run["run_id"] for run in backend.get_runs("flow")] == ["new"]
+    (flow_segment,) = (tmp_path / "archive").glob("flow-runs-*.jsonl.gz")
+    with gzip.open(flow_segment, "rt") as f:
+        assert [json.loads(line)["run_id"] for line in f] == ["old"]
+
+
+def test_count_based_retention_keeps_dataset_runs(tmp_path):
+    """Test that only the most recent runs per step are kept, plus runs in datasets."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"))
+    enable_incremental_vacuum(backend)
+    step1_runs = store_runs(backend, "step1", [5, 4, 3, 2, 1])
+    step2_runs = store_runs(backend, "step2", [5, 4])
+    backend.create_dataset("dataset")
+    dataset = backend.get_datasets()[0]
+    backend.add_datapoints_to_dataset([step1_runs[0].step_run_id], dataset.id)
+
+    deleted = apply_retention(
+        backend, RetentionPolicy(max_runs_per_step=2), archive_dir=None, pause=0
+    )
+
+    assert deleted == 2
+    remaining = {run.step_run_id for run in backend.get_all_data()}
+    assert remaining == {
+        step1_runs[0].step_run_id,
+        step1_runs[3].step_run_id,
+        step1_runs[4].step_run_id,
+    } | {run.step_run_id for run in step2_runs}
+
+
+def test_age_based_retention_drops_partitions(tmp_path):
+    """Test that partitions older than the maximum age are moved to the archive."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"), partition_by="day")
+    store_runs(backend, "step", [100, 90])
+    new_runs = store_runs(backend, "step", [0])
+
+    deleted = apply_retention(
+        backend,
+        RetentionPolicy(max_age_days=30),
+        archive_dir=str(tmp_path / "archive"),
+        pause=0,
+    )
+
+    assert deleted == 2
+    assert [run.step_run_id for run in backend.get_all_data()] == [
+        new_runs[0].step_run_id
+    ]
+    assert len(list((tmp_path / "archive").glob("promptmage.*.db"))) == 2
+
+
+def test_retention_releases_free_pages(tmp_path):
+    """Test that the pages of deleted runs are given back to the file system."""
+    db_path = tmp_path / "promptmage.db"
+    backend = SQLiteDataBackend(str(db_path))
+    enable_incremental_vacuum(backend)
+    store_runs(backend, "step", [100] * 2000)
+    store_runs(backend, "step", [0])
+    size = db_path.stat().st_size
+
+    deleted = apply_retention(
+        backend, RetentionPolicy(max_age_days=30), archive_dir=None, pause=0
+    )
+
+    assert deleted == 2000
+    with backend.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA freelist_count")).scalar() == 0
+    assert db_path.stat().st_size < size / 2
@@ -1,10 +1,22 @@
 """Tests for the sqlite backends for prompts and run data."""
 
+import os
+import json
+import time
 import pytest
 import sqlite3
+from datetime import datetime, timedelta
 
-from promptmage.storage import SQLitePromptBackend, SQLiteDataBackend
+from promptmage.storage import SQLitePromptBackend, SQLiteDataBackend, sqlite_backend
+from promptmage.storage.compression import (
+    DICTIONARIES,
+    HEADER,
+    MAGIC,
+    compress_payload,
+    decompress_payload,
+)
 from promptmage import Prompt, RunData
+from promptmage.run_data import epoch_time
 
 
 def test_init_backend():
@@ -140,3 +152,642 @@ def test_get_run_data(data_sqlite_backend):
 
 def test_get_run_data_by_prompt(data_sqlite_backend):
     """Test that run data is retrieved correctly by prompt."""
+
+
+def test_get_prompt_latest_and_active_version(prompt_sqlite_backend):
+    """Test that head and active lookups return the right version out of many."""
+    for version in range(1, 51):
+        prompt_sqlite_backend.store_prompt(
+            Prompt(
+                name="test",
+                system=f"system {version}",
+                user="test",
+                version=version,
+                template_vars=["test"],
+                active=version == 20,
+            )
+        )
+
+    assert prompt_sqlite_backend.get_prompt("test").version == 50
+    assert prompt_sqlite_backend.get_prompt("test", active=True).version == 20
+    assert prompt_sqlite_backend.get_prompt("test", version=7).system == "system 7"
+
+    # the lookups are served by an index on (name, version)
+    conn = sqlite3.connect(prompt_sqlite_backend.db_path)
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(prompts)").fetchall()}
+    assert "ix_prompts_name_version" in indexes
+
+
+def make_run_data(step_name: str = "test", **kwargs) -> RunData:
+    return RunData(
+        step_name=step_name,
+        prompt=None,
+        input_data={"test": "test"},
+        output_data={"test": "test"},
+        status="success",
+        **kwargs,
+    )
+
+
+def test_bulk_dataset_operations(data_sqlite_backend):
+    """Test that datapoints can be added, rated and removed in bulk."""
+    runs = [make_run_data() for _ in range(10)]
+    for run in runs:
+        data_sqlite_backend.store_data(run)
+    data_sqlite_backend.create_dataset("dataset", "description")
+    dataset = data_sqlite_backend.get_datasets()[0]
+
+    data_sqlite_backend.add_datapoints_to_dataset(
+        [run.step_run_id for run in runs], dataset.id
+    )
+    datapoints = data_sqlite_backend.get_datapoints(dataset.id)
+    assert {dp.run_data_id for dp in datapoints} == {run.step_run_id for run in runs}
+
+    data_sqlite_backend.rate_datapoints(
+        {dp.id: 1 if i % 2 else -1 for i, dp in enumerate(datapoints)}
+    )
+    ratings = [dp.rating for dp in data_sqlite_backend.get_datapoints(dataset.id)]
+    assert sorted(ratings) == [-1] * 5 + [1] * 5
+
+    data_sqlite_backend.remove_datapoints([dp.id for dp in datapoints[:4]])
+    assert len(data_sqlite_backend.get_datapoints(dataset.id)) == 6
+
+
+def test_get_datapoints_with_runs(data_sqlite_backend):
+    """Test that datapoints are fetched joined with their runs and paginated."""
+    runs = [make_run_data(step_name=f"step{i}") for i in range(7)]
+    for run in runs:
+        data_sqlite_backend.store_data(run)
+    data_sqlite_backend.create_dataset("dataset")
+    dataset = data_sqlite_backend.get_datasets()[0]
+    data_sqlite_backend.add_datapoints_to_dataset(
+        [run.step_run_id for run in runs], dataset.id
+    )
+
+    rows = data_sqlite_backend.get_datapoints_with_runs(dataset.id)
+    assert len(rows) == 7
+    for datapoint, run_data in rows:
+        assert datapoint.run_data_id == run_data.step_run_id
+        assert run_data.input_data == {"test": "test"}
+
+    first_page = data_sqlite_backend.get_datapoints_with_runs(dataset.id, limit=5)
+    second_page = data_sqlite_backend.get_datapoints_with_runs(
+        dataset.id, offset=5, limit=5
+    )
+    assert len(first_page) == 5
+    assert len(second_page) == 2
+    assert {dp.id for dp, _ in first_page + second_page} == {dp.id for dp, _ in rows}
+
+
+@pytest.mark.parametrize("partition_by", [None, "month"])
+def test_datapoints_of_deleted_runs_are_skipped_before_paging(tmp_path, partition_by):
+    """Test that pages of datapoints are full, whether the runs are partitioned or not."""
+    backend = SQLiteDataBackend(
+        str(tmp_path / "promptmage.db"), partition_by=partition_by
+    )
+    runs = [
+        make_run_data(step_name="step", run_time=f"2024-0{i % 3 + 6}-01 12:00:00")
+        for i in range(9)
+    ]
+    for run in runs:
+        backend.store_data(run)
+    backend.create_dataset("dataset")
+    dataset = backend.get_datasets()[0]
+    for run in runs:
+        backend.add_datapoint_to_dataset(run.step_run_id, dataset.id)
+    deleted = {runs[0].step_run_id, runs[1].step_run_id, runs[4].step_run_id}
+    backend.delete_data(list(deleted))
+
+    pages = [
+        backend.get_datapoints_with_runs(dataset.id, offset=offset, limit=2)
+        for offset in range(0, 8, 2)
+    ]
+    assert [len(page) for page in pages] == [2, 2, 2, 0]
+    assert [run.step_run_id for page in pages for _, run in page] == [
+        run.step_run_id for run in runs if run.step_run_id not in deleted
+    ]
+
+
+def test_get_dataset_stats(data_sqlite_backend):
+    """Test that dataset statistics are aggregated per dataset."""
+    runs = [make_run_data() for _ in range(4)]
+    for run in runs:
+        data_sqlite_backend.store_data(run)
+    data_sqlite_backend.create_dataset("full")
+    data_sqlite_backend.create_dataset("empty")
+    datasets = {d.name: d for d in data_sqlite_backend.get_datasets()}
+    data_sqlite_backend.add_datapoints_to_dataset(
+        [run.step_run_id for run in runs], datasets["full"].id
+    )
+    datapoints = data_sqlite_backend.get_datapoints(datasets["full"].id)
+    data_sqlite_backend.rate_datapoints(
+        {datapoints[0].id: 1, datapoints[1].id: 1, datapoints[2].id: -1}
+    )
+
+    stats = data_sqlite_backend.get_dataset_stats()
+
+    assert stats[datasets["full"].id]["datapoints"] == 4
+    assert stats[datasets["full"].id]["rated"] == 3
+    assert stats[datasets["full"].id]["rating_sum"] == 1
+    assert stats[datasets["full"].id]["last_updated"] is not None
+    assert stats[datasets["empty"].id]["datapoints"] == 0
+    assert stats[datasets["empty"].id]["rated"] == 0
+
+
+def test_iter_data_filters(data_sqlite_backend):
+    """Test that run data is streamed in run time order with filters applied."""
+    for i in range(6):
+        data_sqlite_backend.store_data(
+            make_run_data(
+                step_name="even" if i % 2 == 0 else "odd",
+                run_time=f"2024-08-0{i + 1} 12:00:00",
+            )
+        )
+    data_sqlite_backend.store_data(
+        RunData(
+            step_name="even",
+            prompt=None,
+            input_data={},
+            output_data={},
+            status="failed",
+            run_time="2024-08-07 12:00:00",
+        )
+    )
+
+    runs = list(data_sqlite_backend.iter_data(batch_size=2))
+    assert [run.run_time for run in runs] == sorted(run.run_time for run in runs)
+    assert len(runs) == 7
+    assert len(list(data_sqlite_backend.iter_data(step_names=["odd"]))) == 3
+    assert len(list(data_sqlite_backend.iter_data(status="failed"))) == 1
+    day = list(data_sqlite_backend.iter_data(since="2024-08-02", until="2024-08-03"))
+    assert [run.run_time for run in day] == ["2024-08-02 12:00:00"]
+
+
+def test_search_data(data_sqlite_backend):
+    """Test that the full-text index is kept in sync and rebuilt for existing runs."""
+    prompt = Prompt(
+        name="test",
+        system="You are a support agent",
+        user="{question}",
+        template_vars=["question"],
+    )
+    runs = [
+        RunData(
+            step_name="step",
+            prompt=prompt,
+            input_data={"question": f"Where is the order of customer {name}?"},
+            output_data={"answer": "It was shipped."},
+            status="success",
+        )
+        for name in ["Müller", "Smith", "O'Brien"]
+    ]
+    for run in runs:
+        data_sqlite_backend.store_data(run)
+
+    assert data_sqlite_backend.search_index
+    found = data_sqlite_backend.search_data("müller")
+    assert [run.step_run_id for run in found] == [runs[0].step_run_id]
+    assert len(data_sqlite_backend.search_data("support agent")) == 3
+    assert len(data_sqlite_backend.search_data('order "shipped')) == 3
+    assert data_sqlite_backend.search_data("refund") == []
+
+    data_sqlite_backend.delete_data([runs[1].step_run_id])
+    assert len(data_sqlite_backend.search_data("shipped")) == 2
+
+    # the index keeps no copy of the runs and forgets the terms of deleted runs
+    conn = sqlite3.connect(data_sqlite_backend.db_path)
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    assert "data_fts_content" not in tables
+    conn.execute(
+        "CREATE VIRTUAL TABLE temp.terms USING fts5vocab(main, data_fts, 'row')"
+    )
+    terms = dict(conn.execute("SELECT term, doc FROM temp.terms"))
+    assert "smith" not in terms
+    assert terms["shipped"] == 2
+    conn.execute("INSERT INTO data_fts(data_fts) VALUES ('integrity-check')")
+
+    # the index is rebuilt from the stored runs if it is missing or keeps a copy of them
+    conn.execute("DROP TABLE data_fts")
+    conn.execute(
+        "CREATE VIRTUAL TABLE data_fts USING fts5(input_data, output_data, prompt)"
+    )
+    conn.commit()
+    conn.close()
+    backend = SQLiteDataBackend(data_sqlite_backend.db_path)
+    assert len(backend.search_data("O'Brien")) == 1
+
+
+def test_latency_stats(data_sqlite_backend):
+    """Test that rollups are updated on write and give accurate percentiles."""
+    prompt = Prompt(name="test", system="", user="", template_vars=[], version=2)
+    latencies = [0.1 * (i + 1) for i in range(100)]
+    for i, latency in enumerate(latencies):
+        data_sqlite_backend.store_data(
+            RunData(
+                step_name="check_facts",
+                prompt=prompt,
+                input_data={},
+                output_data={},
+                status="failed" if i % 10 == 0 else "success",
+                execution_time=latency,
+                model="gpt-4o-mini",
+                run_time=f"2024-08-01 {i % 24:02d}:30:00",
+            )
+        )
+    data_sqlite_backend.store_data(make_run_data(step_name="other"))
+
+    stats = data_sqlite_backend.get_latency_stats(step_name="check_facts")
+    assert len(stats) == 1
+    assert stats[0]["model"] == "gpt-4o-mini"
+    assert stats[0]["prompt_version"] == 2
+    assert stats[0]["runs"] == 100
+    assert stats[0]["errors"] == 10
+    assert stats[0]["latency_max"] == pytest.approx(10.0)
+    assert stats[0]["p50"] == pytest.approx(5.0, rel=0.05)
+    assert stats[0]["p95"] == pytest.approx(9.5, rel=0.05)
+
+    # the window is extended to whole hours
+    window = data_sqlite_backend.get_latency_stats(
+        since="2024-08-01 01:45:00", until="2024-08-01 03:00:00", group_by=[]
+    )
+    assert window[0]["runs"] == sum(1 for i in range(100) if i % 24 in (1, 2))
+    # dates are the start of the day
+    day = data_sqlite_backend.get_latency_stats(
+        since="2024-08-01", until="2024-08-02", group_by=[]
+    )
+    assert day[0]["runs"] == 100
+
+    by_step = data_sqlite_backend.get_latency_stats(group_by=["step_name"])
+    assert {s["step_name"]: s["runs"] for s in by_step} == {
+        "check_facts": 100,
+        "other": 1,
+    }
+
+    data_sqlite_backend.rebuild_rollups()
+    assert data_sqlite_backend.get_latency_stats(step_name="check_facts") == stats
+
+
+def test_partitioned_runs(tmp_path):
+    """Test that runs are stored per month and old partitions can be dropped."""
+    db_path = str(tmp_path / "promptmage.db")
+    backend = SQLiteDataBackend(db_path, partition_by="month")
+    runs = [
+        make_run_data(step_name="step", run_time=run_time)
+        for run_time in [
+            "2024-06-15 12:00:00",
+            "2024-07-01 08:00:00",
+            "2024-07-20 09:00:00",
+            "2024-08-02 10:00:00",
+        ]
+    ]
+    for run in runs:
+        backend.store_data(run)
+    assert sorted(backend.partitions) == ["2024-06", "2024-07", "2024-08"]
+    assert (tmp_path / "promptmage.2024-07.db").exists()
+
+    assert backend.get_data(runs[2].step_run_id).run_time == runs[2].run_time
+    july = list(backend.iter_data(since="2024-07-01", until="2024-08-01"))
+    assert [run.step_run_id for run in july] == [
+        runs[1].step_run_id,
+        runs[2].step_run_id,
+    ]
+    assert len(backend._run_sessions(since="2024-07-01", until="2024-08-01")) == 2
+    assert len(backend.search_data("test")) == 4
+    assert backend.get_latency_stats(group_by=["step_name"])[0]["runs"] == 4
+
+    backend.create_dataset("dataset")
+    dataset = backend.get_datasets()[0]
+    backend.add_datapoint_to_dataset(runs[0].step_run_id, dataset.id)
+
+    # partitions are found again when the database is reopened
+    backend = SQLiteDataBackend(db_path)
+    assert backend.partition_by == "month"
+    assert backend.drop_partitions("2024-07-15") == 1
+    assert sorted(backend.partitions) == ["2024-07", "2024-08"]
+    assert not (tmp_path / "promptmage.2024-06.db").exists()
+    # the run in the dataset was kept in the main database
+    assert {run.step_run_id for run in backend.get_all_data()} == {
+        run.step_run_id for run in runs
+    }
+    assert len(backend.get_datapoints_with_runs(dataset.id)) == 1
+
+    backend.delete_data([runs[0].step_run_id, runs[3].step_run_id])
+    assert [run.step_run_id for run in backend.iter_data()] == [
+        runs[1].step_run_id,
+        runs[2].step_run_id,
+    ]
+
+
+def test_runs_reference_stored_prompts(tmp_path):
+    """Test that runs store a reference to stored prompts and keep a copy when they are deleted."""
+    db_path = str(tmp_path / "promptmage.db")
+    prompt_backend = SQLitePromptBackend(db_path)
+    data_backend = SQLiteDataBackend(db_path)
+    prompt = Prompt(name="p", system="system", user="user {x}", template_vars=["x"])
+    prompt_backend.store_prompt(prompt)
+    unstored = Prompt(name="q", system="other", user="user", template_vars=[])
+    stored_run, unstored_run = [
+        RunData(
+            step_name="test", prompt=p, input_data={}, output_data={}, status="success"
+        )
+        for p in [prompt, unstored]
+    ]
+    data_backend.store_data(stored_run)
+    data_backend.store_data(unstored_run)
+
+    conn = sqlite3.connect(db_path)
+    rows = dict(conn.execute("SELECT step_run_id, prompt FROM data").fetchall())
+    assert rows[stored_run.step_run_id] is None
+    assert json.loads(rows[unstored_run.step_run_id])["system"] == "other"
+    assert data_backend.get_data(stored_run.step_run_id).prompt.user == "user {x}"
+    assert data_backend.search_data("user")[0].prompt is not None
+
+    prompt_backend.delete_prompt(prompt.id)
+    (stored_prompt,) = conn.execute(
+        "SELECT prompt FROM data WHERE step_run_id = ?", (stored_run.step_run_id,)
+    ).fetchone()
+    assert json.loads(stored_prompt)["id"] == prompt.id
+    reopened = SQLiteDataBackend(db_path)
+    assert reopened.get_data(stored_run.step_run_id).prompt.system == "system"
+    conn.close()
+
+
+def test_referenced_prompts_are_cached(tmp_path, monkeypatch):
+    """Test that cached prompts are copied, follow prompt updates and are bounded."""
+    db_path = str(tmp_path / "promptmage.db")
+    prompt_backend = SQLitePromptBackend(db_path)
+    data_backend = SQLiteDataBackend(db_path)
+    prompt = Prompt(name="p", system="system", user="{x}", template_vars=["x"])
+    prompt_backend.store_prompt(prompt)
+
+    def run_with(prompt):
+        return RunData(
+            step_name="test",
+            prompt=prompt,
+            input_data={},
+            output_data={},
+            status="success",
+        )
+
+    runs = [run_with(prompt) for _ in range(2)]
+    for run in runs:
+        data_backend.store_data(run)
+
+    first, second = data_backend.get_all_data()
+    assert first.prompt is not second.prompt
+    first.prompt.template_vars.append("changed")
+    assert data_backend.get_data(runs[0].step_run_id).prompt.template_vars == ["x"]
+
+    prompt.active = True
+    prompt_backend.update_prompt(prompt)
+    assert data_backend.get_data(runs[0].step_run_id).prompt.active
+
+    monkeypatch.setattr(sqlite_backend, "PROMPT_CACHE_SIZE", 3)
+    for i in range(5):
+        other = Prompt(name=f"other{i}", system="", user="", template_vars=[])
+        prompt_backend.store_prompt(other)
+        data_backend.store_data(run_with(other))
+    assert len(data_backend.get_all_data()) == 7
+    assert len(data_backend._prompts) == 3
+
+
+def test_legacy_runs_are_migrated_to_prompt_references(tmp_path):
+    """Test that the prompt JSON of runs from older databases is replaced by references."""
+    db_path = str(tmp_path / "promptmage.db")
+    prompt = Prompt(name="p", system="system", user="user", template_vars=[])
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE data (step_run_id VARCHAR PRIMARY KEY, run_time VARCHAR NOT NULL, "
+        "execution_time FLOAT, model VARCHAR, step_name VARCHAR NOT NULL, run_id VARCHAR, "
+        "status VARCHAR NOT NULL, prompt TEXT, input_data TEXT, output_data TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE prompts (id VARCHAR PRIMARY KEY, name VARCHAR NOT NULL, "
+        "system TEXT NOT NULL, user TEXT NOT NULL, version INTEGER NOT NULL, "
+        "template_vars TEXT NOT NULL, active BOOLEAN NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO prompts VALUES (?, 'p', 'system', 'user', 1, '', 0)", (prompt.id,)
+    )
+    conn.execute(
+        "INSERT INTO data VALUES ('run', '2024-08-01 12:00:00', 1.0, NULL, 'step', "
+        "'run', 'success', ?, '{}', '{}')",
+        (json.dumps(prompt.to_dict()),),
+    )
+    conn.commit()
+
+    backend = SQLiteDataBackend(db_path)
+    assert conn.execute("SELECT prompt_id, prompt FROM data").fetchone() == (
+        prompt.id,
+        None,
+    )
+    assert backend.get_data("run").prompt.id == prompt.id
+    assert (
+        backend.get_latency_stats(group_by=["prompt_version"])[0]["prompt_version"] == 1
+    )
+    # the start and end timestamps are backfilled from the run time
+    run = backend.get_data("run")
+    assert run.started_at == pytest.approx(epoch_time("2024-08-01 12:00:00"))
+    assert run.ended_at == pytest.approx(run.started_at + 1.0)
+    conn.close()
+
+
+def test_run_timeline(tmp_path):
+    """Test time range queries and time-bucketed counts on the start timestamps."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"), partition_by="day")
+    start = datetime(2024, 8, 1, 23, 0)
+    for minutes, status in [(50, "success"), (20, "failed"), (70, "success")]:
+        backend.store_data(
+            RunData(
+                step_name="step",
+                prompt=None,
+                input_data={},
+                output_data={},
+                status=status,
+                execution_time=2.0,
+                run_time=str(start + timedelta(minutes=minutes)),
+            )
+        )
+
+    runs = list(backend.iter_data(since="2024-08-01 23:10", until="2024-08-02"))
+    assert [run.status for run in runs] == ["failed", "success"]
+    assert runs[0].started_at < runs[1].started_at
+    assert runs[0].ended_at == pytest.approx(runs[0].started_at + 2.0)
+
+    timeline = backend.get_run_timeline(bucket=1800)
+    assert [bucket["runs"] for bucket in timeline] == [1, 1, 1]
+    assert timeline[0]["start"] == epoch_time(start)
+    assert timeline[0]["errors"] == 1
+    assert timeline[0]["latency_mean"] == 2.0
+    hourly = backend.get_run_timeline(since="2024-08-02")
+    assert [(bucket["runs"], bucket["errors"]) for bucket in hourly] == [(1, 0)]
+    with pytest.raises(ValueError):
+        backend.get_run_timeline(since="yesterday")
+
+
+def test_large_payloads_are_stored_as_blobs(tmp_path):
+    """Test that large payload values are stored once in the blob store and read back."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"), blob_threshold=1024)
+    transcript = "lorem ipsum " * 1000
+    runs = [
+        RunData(
+            step_name=step_name,
+            prompt=None,
+            input_data={"transcript": transcript, "question": "why?"},
+            output_data=transcript.upper() if step_name == "shout" else "short",
+            status="success",
+        )
+        for step_name in ["summarize", "shout"]
+    ]
+    for run in runs:
+        backend.store_data(run)
+
+    assert len(list(backend.blobs)) == 2
+    conn = sqlite3.connect(backend.db_path)
+    sizes = [size for (size,) in conn.execute("SELECT length(input_data) FROM data")]
+    conn.close()
+    assert max(sizes) < 200
+    stored = backend.get_data(runs[1].step_run_id)
+    assert stored.input_data == runs[1].input_data
+    assert stored.output_data == transcript.upper()
+    assert backend.search_data("ipsum")[0].step_run_id == runs[1].step_run_id
+
+    backend.delete_data([runs[1].step_run_id])
+    assert backend.collect_blobs(min_age=0) == 1
+    assert backend.get_data(runs[0].step_run_id).input_data["transcript"] == transcript
+
+
+def test_blobs_in_use_are_not_collected(tmp_path):
+    """Test that stored blobs are renewed when used again and lookalike references are kept."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"), blob_threshold=1024)
+    transcript = "lorem ipsum " * 1000
+    first = make_run_data(step_name="first")
+    first.input_data = {"transcript": transcript}
+    backend.store_data(first)
+    (digest,) = backend.blobs
+    os.utime(backend.blobs._path(digest), (0, 0))
+
+    # storing the blob again renews it, runs that are not committed yet may reference it
+    second = make_run_data(step_name="second")
+    second.input_data = {"transcript": transcript}
+    backend.store_data(second)
+    assert backend.blobs.modified(digest) > time.time() - 3600
+    backend.delete_data([first.step_run_id, second.step_run_id])
+    assert backend.collect_blobs(min_age=3600) == 0
+
+    lookalike = make_run_data(step_name="lookalike")
+    lookalike.output_data = {"$blob": "not-a-hash"}
+    backend.store_data(lookalike)
+    assert backend.get_data(lookalike.step_run_id).output_data == {
+        "$blob": "not-a-hash"
+    }
+
+
+def test_payload_compression(tmp_path):
+    """Test that payloads are compressed transparently and old rows stay readable."""
+    db_path = str(tmp_path / "promptmage.db")
+    text = "the quick brown fox jumps over the lazy dog " * 50
+    plain_run = make_run_data(step_name="plain", run_time="2024-08-01 12:00:00")
+    plain_run.output_data = {"text": text}
+    SQLiteDataBackend(db_path).store_data(plain_run)
+
+    backend = SQLiteDataBackend(db_path, compression="zlib")
+    compressed_run = make_run_data(step_name="compressed")
+    compressed_run.output_data = {"text": text}
+    backend.store_data(compressed_run)
+
+    def column_types():
+        conn = sqlite3.connect(db_path)
+        types = dict(
+            conn.execute("SELECT step_name, typeof(output_data) FROM data").fetchall()
+        )
+        conn.close()
+        return types
+
+    assert column_types() == {"plain": "text", "compressed": "blob"}
+    assert backend.get_data(plain_run.step_run_id).output_data == {"text": text}
+    assert backend.get_data(compressed_run.step_run_id).output_data == {"text": text}
+    assert backend.search_data("fox")[0].step_run_id == compressed_run.step_run_id
+
+    assert backend.recompress(pause=0) == 1
+    assert column_types() == {"plain": "blob", "compressed": "blob"}
+    assert backend.recompress(pause=0) == 0
+
+    assert SQLiteDataBackend(db_path).recompress(pause=0) == 2
+    assert column_types() == {"plain": "text", "compressed": "text"}
+
+
+def test_dictionaries_trained_by_another_process_are_loaded(tmp_path):
+    """Test that a running backend reads runs compressed with a dictionary trained after it started."""
+    pytest.importorskip("zstandard")
+    db_path = str(tmp_path / "promptmage.db")
+    server = SQLiteDataBackend(db_path, compression="zstd")
+    runs = []
+    for i in range(300):
+        run = make_run_data(step_name=f"step{i % 5}")
+        run.output_data = {
+            "answer": f"the answer number {i} to the question of step {i % 5}",
+            "reasoning": f"the question is answered with the reasoning number {i * 7}",
+            "score": i,
+        }
+        server.store_data(run)
+        runs.append(run)
+
+    compress = SQLiteDataBackend(db_path, compression="zstd")
+    dictionary_id = compress.train_compression_dictionary(samples=300, size=4096)
+    assert compress.recompress(pause=0) > 0
+    # the dictionary was trained in another process
+    DICTIONARIES.pop(dictionary_id)
+
+    assert server.get_data(runs[0].step_run_id).output_data == runs[0].output_data
+
+
+def test_compressed_payloads_from_newer_versions_are_rejected():
+    """Test that payloads with an unknown format version are not misread."""
+    text = json.dumps({"text": "abc" * 100})
+    compressed = compress_payload(text)
+    assert isinstance(compressed, bytes) and len(compressed) < len(text)
+    assert decompress_payload(compressed) == text
+    assert compress_payload("{}") == "{}"
+    with pytest.raises(ValueError):
+        decompress_payload(HEADER.pack(MAGIC, 99, 1, 0) + b"data")
+
+
+def test_flow_runs(tmp_path):
+    """Test that flow runs are recorded and their step runs looked up by run ID."""
+    backend = SQLiteDataBackend(str(tmp_path / "promptmage.db"), partition_by="day")
+    started_at = epoch_time("2024-08-01 23:59:59")
+    backend.start_run("run", "flow", started_at)
+    assert backend.get_run("run")["status"] == "running"
+    for i, run_time in enumerate(["2024-08-01 23:59:59.5", "2024-08-02 00:00:00.5"]):
+        backend.store_data(
+            RunData(
+                step_name=f"step{i}",
+                prompt=None,
+                input_data={},
+                output_data={},
+                run_id="run",
+                status="success",
+                run_time=run_time,
+            )
+        )
+    backend.store_data(
+        RunData(
+            step_name="other", prompt=None, input_data={}, output_data={}, status="x"
+        )
+    )
+    backend.end_run("run", "success", started_at + 2)
+
+    assert backend.get_run("run") == {
+        "run_id": "run",
+        "flow_name": "flow",
+        "status": "success",
+        "started_at": started_at,
+        "ended_at": started_at + 2,
+    }
+    assert [run.step_name for run in backend.get_step_runs("run")] == [
+        "step0",
+        "step1",
+    ]
+    assert [run["run_id"] for run in backend.get_runs(flow_name="flow")] == ["run"]
+    assert backend.get_run("missing") is None
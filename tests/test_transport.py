@@ -0,0 +1,106 @@
+"""Tests for the HTTP transport of the remote backends."""
+
+import json
+import asyncio
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from promptmage.storage.transport import (
+    AsyncTransport,
+    Transport,
+    get_async_transport,
+)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers every path with a JSON body, after `failures` responses with status 503."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.server.requests.append((self.command, self.client_address))
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            status, body = 503, b"{}"
+        else:
+            status, body = 200, json.dumps({"path": self.path}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.requests = []
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(server):
+    transport = Transport(f"http://127.0.0.1:{server.server_port}/")
+    for i in range(5):
+        response = transport.get(f"/prompts/{i}")
+        assert response.json() == {"path": f"/prompts/{i}"}
+    # all requests were sent over the same kept alive connection
+    assert len({address for _, address in server.requests}) == 1
+    transport.close()
+
+
+def test_idempotent_requests_are_retried(server):
+    transport = Transport(
+        f"http://127.0.0.1:{server.server_port}", retries=2, backoff_factor=0
+    )
+    server.failures = 2
+    assert transport.get("/runs").status_code == 200
+    assert len(server.requests) == 3
+
+    # a POST may have been processed already, the error is returned instead
+    server.failures = 1
+    assert transport.post("/runs", data=b"{}").status_code == 503
+    assert len(server.requests) == 4
+    transport.close()
+
+
+@pytest.mark.asyncio
+async def test_async_transport_retries(server):
+    transport = AsyncTransport(
+        f"http://127.0.0.1:{server.server_port}", retries=1, backoff_factor=0
+    )
+    server.failures = 1
+    response = await transport.get("/prompts/p", params={"version": 2})
+    assert response.json() == {"path": "/prompts/p?version=2"}
+    assert len(server.requests) == 2
+    await transport.aclose()
+
+
+def test_async_transport_per_event_loop(server):
+    """Test that every event loop gets its own async transport, e.g. for each asyncio.run."""
+    transport = Transport(f"http://127.0.0.1:{server.server_port}")
+
+    async def get():
+        async_transport = get_async_transport(transport)
+        assert get_async_transport(transport) is async_transport
+        response = await async_transport.get("/prompts/p")
+        return async_transport, response.json()
+
+    first, body = asyncio.run(get())
+    assert body == {"path": "/prompts/p"}
+    second, body = asyncio.run(get())
+    assert body == {"path": "/prompts/p"}
+    assert first is not second
+    transport.close()